@@ -0,0 +1,213 @@
+"""Write-time anomaly checks for stock counts.
+
+Each item keeps a small usage model in ``item_usage_stats``: the count at
+the last saved session, units received since, and an exponentially
+weighted mean/variance of per-session usage. The model is mirrored in
+memory so checking a count write is a dict lookup and a few arithmetic
+operations; only flagged counts touch the database (``count_anomalies``).
+"""
+import math
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ReplaceOne, UpdateOne
+
+LOCATIONS = ("main_bar", "beer_bar", "lobby", "storage_room")
+
+EWMA_ALPHA = 0.3      # Weight of the newest session's usage
+Z_THRESHOLD = 3.0     # Standard deviations from expected before flagging
+REL_TOLERANCE = 0.5   # ...but always allow +/-50% of what should be on hand
+ABS_TOLERANCE = 6     # ...and a few units either way
+MIN_SAMPLES = 2       # Sessions of usage history before deviation checks apply
+SPIKE_FACTOR = 3      # Without history, flag counts above 3x what should be on hand
+
+
+# What a session save changes, kept so saving the same session again can replace it
+SESSION_FIELDS = ("last_session_count", "last_locations", "received_since", "usage_mean", "usage_var", "samples")
+
+
+def new_stats(venue_id: str, item_id: str) -> dict:
+    return {
+        "venue_id": venue_id,
+        "item_id": item_id,
+        "last_session_count": None,
+        "last_locations": {},
+        "received_since": 0,
+        "usage_mean": 0.0,
+        "usage_var": 0.0,
+        "samples": 0,
+    }
+
+
+def update_usage(stats: dict, usage: float) -> None:
+    """Fold one session's usage into the exponentially weighted mean/variance"""
+    if stats["samples"] == 0:
+        stats["usage_mean"] = float(usage)
+        stats["usage_var"] = 0.0
+    else:
+        diff = usage - stats["usage_mean"]
+        stats["usage_mean"] += EWMA_ALPHA * diff
+        stats["usage_var"] = (1 - EWMA_ALPHA) * (stats["usage_var"] + EWMA_ALPHA * diff * diff)
+    stats["samples"] += 1
+
+
+def expected_count(stats: dict) -> Optional[float]:
+    """Last session count + received since - typical usage, or None without a baseline"""
+    if stats.get("last_session_count") is None:
+        return None
+    on_hand = stats["last_session_count"] + stats["received_since"]
+    if stats["samples"] < MIN_SAMPLES:
+        return float(on_hand)
+    return max(0.0, on_hand - stats["usage_mean"])
+
+
+def check_count(stats: Optional[dict], count: dict) -> Optional[dict]:
+    """Return an anomaly description for a count write, or None if it looks plausible"""
+    total = count.get("total_count", 0)
+    reasons = []
+    if any((count.get(loc) or 0) < 0 for loc in LOCATIONS):
+        reasons.append("negative_count")
+    if stats is None:
+        return _anomaly(count, None, None, None, reasons) if reasons else None
+
+    expected = expected_count(stats)
+    if expected is None:
+        return _anomaly(count, None, None, None, reasons) if reasons else None
+
+    on_hand = stats["last_session_count"] + stats["received_since"]
+    std = math.sqrt(stats["usage_var"])
+    z_score = None
+    tolerance = None
+    if stats["samples"] < MIN_SAMPLES:
+        if total > SPIKE_FACTOR * on_hand + ABS_TOLERANCE:
+            reasons.append("spike")
+    else:
+        tolerance = max(Z_THRESHOLD * std, REL_TOLERANCE * on_hand, ABS_TOLERANCE)
+        z_score = (total - expected) / max(std, 1.0)
+        if abs(total - expected) > tolerance:
+            reasons.append("above_expected" if total > expected else "below_expected")
+
+    # A location that held a good share of the stock last session is now empty:
+    # often a location that was forgotten during the count
+    previous = stats.get("last_locations") or {}
+    for loc in LOCATIONS:
+        before = previous.get(loc, 0) or 0
+        if before >= max(ABS_TOLERANCE, 0.25 * on_hand) and (count.get(loc) or 0) == 0 and total > 0:
+            reasons.append(f"location_zeroed:{loc}")
+
+    if not reasons:
+        return None
+    return _anomaly(count, expected, tolerance, z_score, reasons)
+
+
+def _anomaly(count: dict, expected, tolerance, z_score, reasons: List[str]) -> dict:
+    return {
+        "item_id": count["item_id"],
+        "total_count": count.get("total_count", 0),
+        "location_counts": {loc: count.get(loc, 0) for loc in LOCATIONS},
+        "expected_count": round(expected, 1) if expected is not None else None,
+        "tolerance": round(tolerance, 1) if tolerance is not None else None,
+        "z_score": round(z_score, 2) if z_score is not None else None,
+        "reasons": reasons,
+    }
+
+
+class AnomalyDetector:
+    """In-memory mirror of one venue's ``item_usage_stats`` plus its open anomaly set"""
+
+    def __init__(self, venue_id: str):
+        self.venue_id = venue_id
+        self.stats: Dict[str, dict] = {}
+        self.open_items = set()
+        self.loaded = False
+
+    async def ensure_loaded(self, db) -> None:
+        if self.loaded:
+            return
+        stats = await db.item_usage_stats.find({"venue_id": self.venue_id}, {"_id": 0}).to_list(None)
+        open_anomalies = await db.count_anomalies.find(
+            {"venue_id": self.venue_id, "resolved": False}, {"_id": 0, "item_id": 1}
+        ).to_list(None)
+        self.stats = {s["item_id"]: s for s in stats}
+        self.open_items = {a["item_id"] for a in open_anomalies}
+        self.loaded = True
+
+    async def check(self, db, count: dict) -> Optional[dict]:
+        """Check a count write; record or clear the item's open anomaly as needed"""
+        await self.ensure_loaded(db)
+        anomaly = check_count(self.stats.get(count["item_id"]), count)
+        if anomaly:
+            anomaly["detected_at"] = datetime.now(timezone.utc)
+            await db.count_anomalies.update_one(
+                {"venue_id": self.venue_id, "item_id": count["item_id"], "resolved": False},
+                {"$set": anomaly, "$setOnInsert": {"id": str(uuid.uuid4()), "venue_id": self.venue_id, "resolved": False}},
+                upsert=True,
+            )
+            self.open_items.add(count["item_id"])
+        elif count["item_id"] in self.open_items:
+            # The count was corrected
+            await db.count_anomalies.update_many(
+                {"venue_id": self.venue_id, "item_id": count["item_id"], "resolved": False},
+                {"$set": {"resolved": True, "resolved_at": datetime.now(timezone.utc), "resolution": "recounted"}},
+            )
+            self.open_items.discard(count["item_id"])
+        return anomaly
+
+    async def record_receipts(self, db, receipts: List[dict]) -> None:
+        """Units received since the last session raise the expected count"""
+        await self.ensure_loaded(db)
+        ops = []
+        for r in receipts:
+            stats = self.stats.setdefault(r["item_id"], new_stats(self.venue_id, r["item_id"]))
+            stats["received_since"] += r["qty"]
+            defaults = {k: v for k, v in new_stats(self.venue_id, r["item_id"]).items() if k != "received_since"}
+            ops.append(UpdateOne(
+                {"venue_id": self.venue_id, "item_id": r["item_id"]},
+                {"$inc": {"received_since": r["qty"]}, "$setOnInsert": defaults},
+                upsert=True,
+            ))
+        if ops:
+            await db.item_usage_stats.bulk_write(ops, ordered=False)
+
+    async def record_session(self, db, counts: List[dict], session_id: Optional[str] = None) -> None:
+        """Fold each item's usage since the previous session into its model.
+
+        Saving ``session_id`` again when it was the last session recorded
+        replaces its sample rather than adding another.
+        """
+        await self.ensure_loaded(db)
+        ops = []
+        for count in counts:
+            stats = self.stats.setdefault(count["item_id"], new_stats(self.venue_id, count["item_id"]))
+            undo = stats.pop("session_undo", None)
+            if session_id and undo and undo["session_id"] == session_id:
+                # Receipts since the first save still count
+                received = stats["received_since"]
+                stats.update(undo["before"])
+                stats["received_since"] += received
+            if session_id:
+                stats["session_undo"] = {"session_id": session_id,
+                                         "before": {k: stats[k] for k in SESSION_FIELDS}}
+            current = count.get("total_count", 0)
+            if stats["last_session_count"] is not None:
+                usage = stats["last_session_count"] + stats["received_since"] - current
+                if usage >= 0:
+                    update_usage(stats, usage)
+            stats["last_session_count"] = current
+            stats["last_locations"] = {loc: count.get(loc, 0) for loc in LOCATIONS}
+            stats["received_since"] = 0
+            ops.append(ReplaceOne({"venue_id": self.venue_id, "item_id": count["item_id"]}, dict(stats), upsert=True))
+        if ops:
+            await db.item_usage_stats.bulk_write(ops, ordered=False)
+
+    def reset(self) -> None:
+        self.stats = {}
+        self.open_items = set()
+        self.loaded = False
+
+
+async def ensure_indexes(db) -> None:
+    await db.item_usage_stats.create_index([("venue_id", 1), ("item_id", 1)], unique=True)
+    await db.count_anomalies.create_index([("venue_id", 1), ("resolved", 1), ("detected_at", -1)])
+    await db.count_anomalies.create_index([("venue_id", 1), ("item_id", 1)])
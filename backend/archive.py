@@ -0,0 +1,239 @@
+"""Archival of old history into compressed monthly documents.
+
+Rows of ``historical_counts``, ``purchases``, ``confirmed_orders`` and
+``shopping_orders`` older than the archive horizon are moved into
+``archives``: one document per venue, collection and month holding the raw
+rows as gzip-compressed BSON plus a small uncompressed rollup (totals per
+session, supplier or status) that stays queryable. The raw rows are then
+deleted, so the hot collections and their indexes only cover recent history.
+
+Sessions are archived whole, with their snapshot records, and only when
+every session in their keyframe chain is past the horizon (see
+``snapshots.self_contained``). Archived sessions keep their
+``stock_sessions`` document, marked with ``archived_in``.
+
+``restore_month`` puts a month's rows back; the next archival run moves them
+out again if they are still past the horizon.
+"""
+import gzip
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import bson
+from pymongo import ReplaceOne
+
+import snapshots
+
+ARCHIVED_COLLECTIONS = ("historical_counts", "purchases", "confirmed_orders", "shopping_orders")
+
+# Field each collection is archived by (sessions are archived by session_date)
+DATE_FIELDS = {"purchases": "purchase_date", "confirmed_orders": "completed_at", "shopping_orders": "order_date"}
+
+DELETE_BATCH = 1000
+
+
+def pack(payload: dict) -> bytes:
+    return gzip.compress(bson.encode(payload))
+
+
+def unpack(data: bytes) -> dict:
+    return bson.decode(gzip.decompress(data))
+
+
+def month_of(value) -> Optional[str]:
+    return value.strftime("%Y-%m") if isinstance(value, datetime) else None
+
+
+def _add(totals: dict, key: str, **amounts) -> None:
+    entry = totals.setdefault(key or "Unknown", {})
+    for name, amount in amounts.items():
+        entry[name] = round(entry.get(name, 0) + amount, 2)
+
+
+def rollup(collection: str, docs: List[dict]) -> dict:
+    """Queryable summary of an archived month's rows"""
+    summary = {"rows": len(docs)}
+    if collection == "purchases":
+        suppliers: Dict[str, dict] = {}
+        for p in docs:
+            _add(suppliers, p.get('supplier'), purchases=1, units=p.get('actual_quantity', 0) or 0,
+                 total_cost=p.get('total_cost', 0.0) or 0.0)
+        summary["suppliers"] = suppliers
+        summary["total_cost"] = round(sum(s["total_cost"] for s in suppliers.values()), 2)
+    elif collection == "confirmed_orders":
+        suppliers = {}
+        for order in docs:
+            lines = order.get('items', [])
+            _add(suppliers, order.get('supplier'), orders=1, lines=len(lines),
+                 total_cost=sum(line.get('actualCost') or 0.0 for line in lines))
+        summary["suppliers"] = suppliers
+        summary["total_cost"] = round(sum(s["total_cost"] for s in suppliers.values()), 2)
+    elif collection == "shopping_orders":
+        statuses: Dict[str, int] = {}
+        for order in docs:
+            statuses[order.get('status', 'unknown')] = statuses.get(order.get('status', 'unknown'), 0) + 1
+        summary["statuses"] = statuses
+        summary["suppliers"] = sorted({order.get('supplier') for order in docs if order.get('supplier')})
+    return summary
+
+
+def closing_unit_cost(count: dict) -> float:
+    # Rows saved before the interval's own cost was stored kept the closing average in wac_unit_cost
+    return count.get('closing_wac_unit_cost') or count.get('wac_unit_cost') or count.get('cost_per_unit') or 0.0
+
+
+def session_rollup(session: dict, counts: List[dict]) -> dict:
+    return {
+        "session_id": session['id'],
+        "session_name": session.get('session_name'),
+        "session_date": session.get('session_date'),
+        "items": len(counts),
+        "total_units": sum(c.get('total_count', 0) or 0 for c in counts),
+        "stock_value": round(sum((c.get('total_count', 0) or 0) * closing_unit_cost(c) for c in counts), 2),
+    }
+
+
+async def _store(db, venue_id: str, collection: str, month: str, docs: List[dict], summary: dict,
+                 extra: Optional[dict] = None) -> dict:
+    """Write (or add to) the month's archive document"""
+    key = {"venue_id": venue_id, "collection": collection, "month": month}
+    payload = {"docs": docs, **(extra or {})}
+    existing = await db.archives.find_one(key)
+    if existing:
+        previous = unpack(existing['data'])
+        for name, values in payload.items():
+            payload[name] = previous.get(name, []) + values
+        if collection == "historical_counts":
+            summary = {"rows": len(payload['docs']), "sessions": existing['rollup']['sessions'] + summary['sessions']}
+        else:
+            summary = rollup(collection, payload['docs'])
+    data = pack(payload)
+    document = {
+        **key,
+        "rollup": summary,
+        "data": data,
+        "compressed_bytes": len(data),
+        "archived_at": datetime.now(timezone.utc),
+    }
+    await db.archives.replace_one(key, document, upsert=True)
+    return {"collection": collection, "month": month, "rows": len(docs), "compressed_bytes": len(data)}
+
+
+async def _delete(coll, ids: list) -> None:
+    for start in range(0, len(ids), DELETE_BATCH):
+        await coll.delete_many({"_id": {"$in": ids[start:start + DELETE_BATCH]}})
+
+
+async def archive_sessions(db, venue_id: str, cutoff: datetime, keyframes, dry_run: bool = False) -> List[dict]:
+    sessions = await db.stock_sessions.find(
+        {"venue_id": venue_id, "session_date": {"$lt": cutoff}, "archived_in": {"$exists": False}}, {"_id": 0}
+    ).to_list(None)
+    eligible = await snapshots.self_contained(db, venue_id, [s['id'] for s in sessions])
+    by_month: Dict[str, List[dict]] = {}
+    for session in sessions:
+        if session['id'] in eligible:
+            by_month.setdefault(month_of(session['session_date']), []).append(session)
+
+    results = []
+    for month, month_sessions in sorted(by_month.items()):
+        ids = [s['id'] for s in month_sessions]
+        rows = await db.historical_counts.find({"venue_id": venue_id, "session_id": {"$in": ids}}).to_list(None)
+        if dry_run:
+            results.append({"collection": "historical_counts", "month": month, "rows": len(rows), "sessions": len(ids)})
+            continue
+        # Totals come from the full session contents, not just the stored deltas
+        summaries = [session_rollup(s, await snapshots.session_counts(db, venue_id, s['id'], keyframes))
+                     for s in month_sessions]
+        records = await db.session_snapshots.find({"venue_id": venue_id, "session_id": {"$in": ids}}).to_list(None)
+        result = await _store(db, venue_id, "historical_counts", month, rows,
+                              {"rows": len(rows), "sessions": summaries}, {"snapshots": records})
+        await _delete(db.historical_counts, [r['_id'] for r in rows])
+        await _delete(db.session_snapshots, [r['_id'] for r in records])
+        await db.stock_sessions.update_many({"venue_id": venue_id, "id": {"$in": ids}}, {"$set": {"archived_in": month}})
+        for session_id in ids:
+            keyframes.invalidate_session(session_id)
+        results.append({**result, "sessions": len(ids)})
+    return results
+
+
+async def archive_collection(db, venue_id: str, collection: str, cutoff: datetime, dry_run: bool = False) -> List[dict]:
+    field = DATE_FIELDS[collection]
+    docs = await db[collection].find({"venue_id": venue_id, field: {"$lt": cutoff}}).to_list(None)
+    by_month: Dict[str, List[dict]] = {}
+    for doc in docs:
+        month = month_of(doc.get(field))
+        if month:
+            by_month.setdefault(month, []).append(doc)
+
+    results = []
+    for month, month_docs in sorted(by_month.items()):
+        if dry_run:
+            results.append({"collection": collection, "month": month, "rows": len(month_docs)})
+            continue
+        results.append(await _store(db, venue_id, collection, month, month_docs, rollup(collection, month_docs)))
+        await _delete(db[collection], [d['_id'] for d in month_docs])
+    return results
+
+
+async def archive_venue(db, venue_id: str, cutoff: datetime, keyframes, dry_run: bool = False) -> List[dict]:
+    """Move everything older than ``cutoff`` into monthly archives"""
+    results = await archive_sessions(db, venue_id, cutoff, keyframes, dry_run)
+    for collection in DATE_FIELDS:
+        results.extend(await archive_collection(db, venue_id, collection, cutoff, dry_run))
+    return results
+
+
+async def archived_venues(db) -> set:
+    """Venues with any history to consider"""
+    venues = set()
+    for collection in ("stock_sessions",) + tuple(DATE_FIELDS):
+        venues.update(await db[collection].distinct("venue_id"))
+    return venues
+
+
+async def list_archives(db, venue_id: str, collection: Optional[str] = None) -> List[dict]:
+    query = {"venue_id": venue_id}
+    if collection:
+        query["collection"] = collection
+    return await db.archives.find(query, {"_id": 0, "data": 0}).sort([("collection", 1), ("month", 1)]).to_list(None)
+
+
+async def restore_month(db, venue_id: str, collection: str, month: str) -> List[dict]:
+    """Put an archived month's rows back into their collection.
+
+    Restoring archived sessions also restores the months holding the
+    keyframes their deltas are built on.
+    """
+    archived = await db.archives.find_one({"venue_id": venue_id, "collection": collection, "month": month})
+    if not archived:
+        return []
+    payload = unpack(archived['data'])
+    # Upserts by _id, so restoring after an interrupted archival run is safe
+    if payload['docs']:
+        await db[collection].bulk_write([ReplaceOne({"_id": d['_id']}, d, upsert=True) for d in payload['docs']],
+                                        ordered=False)
+    restored = [{"collection": collection, "month": month, "rows": len(payload['docs'])}]
+
+    if collection == "historical_counts":
+        records = payload.get('snapshots', [])
+        if records:
+            await db.session_snapshots.bulk_write([ReplaceOne({"_id": r['_id']}, r, upsert=True) for r in records],
+                                                  ordered=False)
+        session_ids = [s['session_id'] for s in archived['rollup']['sessions']]
+        await db.stock_sessions.update_many({"venue_id": venue_id, "id": {"$in": session_ids}},
+                                            {"$unset": {"archived_in": ""}})
+        await db.archives.delete_one({"_id": archived['_id']})
+        keyframe_ids = list({r['keyframe_session_id'] for r in records} - set(session_ids))
+        base_sessions = await db.stock_sessions.find(
+            {"venue_id": venue_id, "id": {"$in": keyframe_ids}, "archived_in": {"$exists": True}},
+            {"_id": 0, "archived_in": 1}
+        ).to_list(None)
+        for base_month in sorted({s['archived_in'] for s in base_sessions}):
+            restored.extend(await restore_month(db, venue_id, collection, base_month))
+    else:
+        await db.archives.delete_one({"_id": archived['_id']})
+    return restored
+
+
+async def ensure_indexes(db) -> None:
+    await db.archives.create_index([("venue_id", 1), ("collection", 1), ("month", 1)], unique=True)
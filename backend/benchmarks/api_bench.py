@@ -0,0 +1,210 @@
+"""Load and latency benchmarks for the API hot paths.
+
+Seeds a synthetic venue per catalog size, then drives the ASGI app in-process
+with concurrent clients and reports p50/p95/p99 latency and throughput per
+endpoint. Runs against the embedded store by default, so no MongoDB is needed.
+
+    cd backend
+    python -m benchmarks.api_bench --sizes 100,1000,10000 --output bench.json
+    python -m benchmarks.api_bench --baseline bench.json --threshold 0.25
+
+With ``--baseline`` the run exits non-zero when any scenario's ``--metric``
+(p95 by default) got worse than the baseline by more than ``--threshold``.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+
+class Scenario:
+    def __init__(self, name: str, request: Callable, setup: Optional[Callable] = None,
+                 max_requests: Optional[int] = None):
+        self.name = name
+        self.request = request  # (ctx, i) -> (method, path, kwargs)
+        self.setup = setup  # async (client, ctx, n), untimed
+        self.max_requests = max_requests
+
+
+# Scenarios ------------------------------------------------------------------
+
+def _count_update(ctx, i):
+    item_ids = ctx["item_ids"]
+    return "PUT", f"/api/stock-counts/{item_ids[i % len(item_ids)]}", {"json_body": {"main_bar": i % 40}}
+
+
+async def _create_sessions(client, ctx, n):
+    ctx["new_session_ids"] = []
+    for i in range(n):
+        response = await client.post("/api/stock-sessions", json_body={"session_name": f"Bench {i}"})
+        ctx["new_session_ids"].append(response.json()["id"])
+
+
+def _save_counts(ctx, i):
+    return "POST", f"/api/stock-sessions/{ctx['new_session_ids'][i]}/save-counts", {}
+
+
+def _compare_sessions(ctx, i):
+    session_ids = ctx["session_ids"]
+    pair = i % (len(session_ids) - 1)
+    return "GET", f"/api/reports/session-comparison/{session_ids[pair]}/{session_ids[pair + 1]}", {}
+
+
+async def _sort_body(client, ctx, n):
+    ctx["sort_body"] = [{"id": item_id, "sort_order": (j + 1) * 100} for j, item_id in enumerate(ctx["item_ids"])]
+
+
+SCENARIOS = [
+    Scenario("count_update", _count_update),
+    Scenario("items", lambda ctx, i: ("GET", "/api/items", {})),
+    Scenario("shopping_list", lambda ctx, i: ("GET", "/api/shopping-list", {})),
+    Scenario("save_counts", _save_counts, setup=_create_sessions, max_requests=20),
+    Scenario("compare_sessions", _compare_sessions),
+    Scenario("usage_summary", lambda ctx, i: ("GET", "/api/reports/usage-summary", {})),
+    Scenario("batch_sort_order", lambda ctx, i: ("PUT", "/api/items/batch-sort-order", {"json_body": ctx["sort_body"]}),
+             setup=_sort_body, max_requests=20),
+]
+
+
+# Measurement ----------------------------------------------------------------
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], wall: float, errors: int) -> dict:
+    ordered = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+        "throughput_rps": round(len(ordered) / wall, 1) if wall else 0.0,
+    }
+
+
+async def run_scenario(client, scenario: Scenario, ctx: dict, n_requests: int, concurrency: int) -> dict:
+    n = min(n_requests, scenario.max_requests or n_requests)
+    if scenario.setup:
+        await scenario.setup(client, ctx, n)
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < n:
+            i = next_index
+            next_index += 1
+            method, path, kwargs = scenario.request(ctx, i)
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, n))))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def run(args) -> dict:
+    import server
+    from benchmarks.asgi_client import ASGIClient, lifespan
+    from benchmarks.seed import seed_venue
+
+    selected = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+    results: Dict[str, Dict[str, dict]] = {}
+    async with lifespan(server.app):
+        for size in args.sizes:
+            venue_id = f"bench-{size}-{int(time.time())}"
+            started = time.perf_counter()
+            ctx = await seed_venue(server.db, venue_id, size, months=args.months)
+            print(f"\n{size} items: seeded {ctx['documents']} documents in {time.perf_counter() - started:.1f}s")
+            client = ASGIClient(server.app, headers={"X-Venue-Id": venue_id})
+            results[str(size)] = {}
+            for scenario in selected:
+                stats = await run_scenario(client, scenario, ctx, args.requests, args.concurrency)
+                results[str(size)][scenario.name] = stats
+                print(f"  {scenario.name:<18} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  "
+                      f"p99 {stats['p99_ms']:>9.2f}ms  {stats['throughput_rps']:>8.1f} req/s"
+                      + (f"  {stats['errors']} errors" if stats["errors"] else ""))
+    return {
+        "meta": {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "storage": os.environ.get("STORAGE_BACKEND"),
+            "months": args.months,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float, metric: str) -> List[str]:
+    """Scenarios whose metric got worse than the baseline by more than threshold"""
+    regressions = []
+    for size, scenarios in current["results"].items():
+        for name, stats in scenarios.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base or not base.get(metric):
+                continue
+            change = stats[metric] / base[metric] - 1
+            if change > threshold:
+                regressions.append(f"{size} items / {name}: {metric} {base[metric]} -> {stats[metric]} (+{change:.0%})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--months", type=int, default=3, help="months of weekly sessions to seed")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=None,
+                        help=f"subset of: {', '.join(s.name for s in SCENARIOS)}")
+    parser.add_argument("--storage", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    os.environ["STORAGE_BACKEND"] = args.storage
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.metric)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
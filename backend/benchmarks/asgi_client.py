@@ -0,0 +1,103 @@
+"""Minimal in-process ASGI driver.
+
+Calls the app directly (no sockets, no HTTP client library) so benchmark
+timings measure the handlers rather than the transport.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode
+
+
+class Response:
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class ASGIClient:
+    def __init__(self, app, headers: Optional[Dict[str, str]] = None):
+        self.app = app
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+
+    async def request(self, method: str, path: str, json_body: Any = None, params: Optional[dict] = None,
+                      headers: Optional[Dict[str, str]] = None) -> Response:
+        body = b"" if json_body is None else json.dumps(json_body).encode()
+        merged = dict(self.headers)
+        merged.update({k.lower(): v for k, v in (headers or {}).items()})
+        if json_body is not None:
+            merged["content-type"] = "application/json"
+        merged["content-length"] = str(len(body))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method.upper(),
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": urlencode(params or {}).encode(),
+            "root_path": "",
+            "headers": [(k.encode(), v.encode()) for k, v in merged.items()],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+        }
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()  # no disconnects while a request is in flight
+
+        status = 500
+        response_headers: Dict[str, str] = {}
+        chunks = []
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update({k.decode(): v.decode() for k, v in message.get("headers", [])})
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return Response(status, response_headers, b"".join(chunks))
+
+    async def get(self, path: str, **kwargs) -> Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> Response:
+        return await self.request("PUT", path, **kwargs)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Run the app's startup and shutdown handlers around the block"""
+    to_app: asyncio.Queue = asyncio.Queue()
+    from_app: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}}, to_app.get, from_app.put))
+
+    async def expect(kind: str) -> None:
+        message = await from_app.get()
+        if message["type"] != kind:
+            raise RuntimeError(f"Lifespan {kind} failed: {message.get('message', message)}")
+
+    await to_app.put({"type": "lifespan.startup"})
+    await expect("lifespan.startup.complete")
+    try:
+        yield
+    finally:
+        await to_app.put({"type": "lifespan.shutdown"})
+        await expect("lifespan.shutdown.complete")
+        await task
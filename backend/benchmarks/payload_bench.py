@@ -0,0 +1,164 @@
+"""Response sizes and encoding cost per endpoint.
+
+Seeds a synthetic venue per catalog size, then fetches each endpoint in every
+representation (JSON, and MessagePack where the endpoint offers it) and
+content coding (identity, gzip, brotli) through the app's own middleware,
+and reports the bytes on the wire. Encoding cost is timed separately on the
+same payload: rendering it as JSON or MessagePack, and compressing that with
+the middleware's settings.
+
+    cd backend
+    python -m benchmarks.payload_bench --sizes 100,1000 --output payload.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+CODINGS = ["identity", "gzip", "br"]
+
+
+class Endpoint:
+    def __init__(self, name: str, path: Callable, msgpack: bool = True):
+        self.name = name
+        self.path = path  # ctx -> path
+        self.msgpack = msgpack
+
+
+ENDPOINTS = [
+    Endpoint("items", lambda ctx: "/api/items"),
+    Endpoint("stock_counts", lambda ctx: "/api/stock-counts"),
+    Endpoint("stock_sessions", lambda ctx: "/api/stock-sessions"),
+    Endpoint("session_counts", lambda ctx: f"/api/stock-sessions/{ctx['session_ids'][-2]}/counts"),
+    Endpoint("orders", lambda ctx: "/api/orders"),
+    Endpoint("shopping_list", lambda ctx: "/api/shopping-list", msgpack=False),
+    Endpoint("usage_summary", lambda ctx: "/api/reports/usage-summary", msgpack=False),
+]
+
+
+def time_per_call(func: Callable, repeat: int) -> float:
+    """Mean milliseconds per call"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - started) / repeat * 1000, 3)
+
+
+def encode_costs(payload, msgpack_offered: bool, middleware, repeat: int) -> Dict[str, dict]:
+    """Milliseconds to render ``payload`` per representation, and to compress the result"""
+    import msgpack
+    from starlette.responses import JSONResponse
+
+    renderers = {"json": JSONResponse(None).render}
+    if msgpack_offered:
+        renderers["msgpack"] = msgpack.packb
+    costs = {}
+    for representation, render in renderers.items():
+        body = render(payload)
+        costs[representation] = {"render_ms": time_per_call(lambda: render(payload), repeat)}
+        for coding in CODINGS[1:]:
+            def compress():
+                encoder = middleware.encoder(coding)
+                return encoder.compress(body) + encoder.finish()
+            costs[representation][f"{coding}_ms"] = time_per_call(compress, repeat)
+    return costs
+
+
+async def measure(client, endpoint: Endpoint, ctx: dict, middleware, repeat: int) -> dict:
+    path = endpoint.path(ctx)
+    accepts = {"json": "application/json"}
+    if endpoint.msgpack:
+        accepts["msgpack"] = "application/msgpack"
+    wire: Dict[str, Dict[str, int]] = {}
+    for representation, accept in accepts.items():
+        wire[representation] = {}
+        for coding in CODINGS:
+            response = await client.get(path, headers={"Accept": accept, "Accept-Encoding": coding})
+            if response.status >= 400:
+                raise RuntimeError(f"GET {path} returned {response.status}")
+            wire[representation][coding] = len(response.body)
+    payload = (await client.get(path, headers={"Accept-Encoding": "identity"})).json()
+    return {"bytes": wire, "encode": encode_costs(payload, endpoint.msgpack, middleware, repeat)}
+
+
+def format_row(name: str, result: dict) -> List[str]:
+    lines = []
+    for representation, sizes in result["bytes"].items():
+        cost = result["encode"][representation]
+        raw = sizes["identity"]
+        lines.append(
+            f"  {name:<15} {representation:<8} {raw:>10,} B  gzip {sizes['gzip']:>9,} B ({sizes['gzip'] / raw:>4.0%})"
+            f"  br {sizes['br']:>9,} B ({sizes['br'] / raw:>4.0%})"
+            f"  render {cost['render_ms']:>7.2f}ms  gzip {cost['gzip_ms']:>7.2f}ms  br {cost['br_ms']:>7.2f}ms"
+        )
+    return lines
+
+
+def find_middleware(app, kind):
+    """The configured instance of a middleware class (built on first use of the app)"""
+    layer = app.middleware_stack
+    while layer is not None and not isinstance(layer, kind):
+        layer = getattr(layer, "app", None)
+    return layer
+
+
+async def run(args) -> dict:
+    import server
+    from benchmarks.asgi_client import ASGIClient, lifespan
+    from benchmarks.seed import seed_venue
+    from response_encoding import EncodingMiddleware
+
+    selected = [e for e in ENDPOINTS if not args.endpoints or e.name in args.endpoints]
+    results: Dict[str, Dict[str, dict]] = {}
+    async with lifespan(server.app):
+        middleware = find_middleware(server.app, EncodingMiddleware)
+        for size in args.sizes:
+            venue_id = f"payload-{size}-{int(time.time())}"
+            ctx = await seed_venue(server.db, venue_id, size, months=args.months)
+            print(f"\n{size} items:")
+            client = ASGIClient(server.app, headers={"X-Venue-Id": venue_id})
+            results[str(size)] = {}
+            for endpoint in selected:
+                result = await measure(client, endpoint, ctx, middleware, args.repeat)
+                results[str(size)][endpoint.name] = result
+                print("\n".join(format_row(endpoint.name, result)))
+    return {
+        "meta": {
+            "storage": os.environ.get("STORAGE_BACKEND"),
+            "months": args.months,
+            "minimum_size": middleware.minimum_size,
+            "gzip_level": middleware.gzip_level,
+            "brotli_quality": middleware.brotli_quality,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--months", type=int, default=3, help="months of weekly sessions to seed")
+    parser.add_argument("--repeat", type=int, default=20, help="timed repetitions per encoding")
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), default=None,
+                        help=f"subset of: {', '.join(e.name for e in ENDPOINTS)}")
+    parser.add_argument("--storage", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--output", help="write results JSON here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    os.environ["STORAGE_BACKEND"] = args.storage
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
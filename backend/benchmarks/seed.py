@@ -0,0 +1,133 @@
+"""Synthetic venue data for benchmarks.
+
+Builds a catalog of ``n_items`` items plus weekly count sessions over
+``months`` months, with purchases and confirmed orders whenever an item
+drops below half its target. Documents are written straight into the
+database using the app's own models, which is much faster than going
+through the API and gives the same stored shape.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+import server
+import valuation
+
+CATEGORIES = [
+    ("A", "Thai Alcohol", ["Whisky", "Rum", "Gin", "Vodka"]),
+    ("B", "Beer", ["Lager", "Craft"]),
+    ("M", "Mixers", ["Soda", "Juice"]),
+    ("O", "Bar Supplies", [None]),
+    ("Z", "Hostel Supplies", [None]),
+]
+SUPPLIERS = ["Singha99", "Makro", "Tops", "Local Market"]
+LOCATIONS = ["main_bar", "beer_bar", "lobby", "storage_room"]
+
+CHUNK = 5000
+
+
+async def _insert(collection, docs: List[dict]) -> None:
+    for start in range(0, len(docs), CHUNK):
+        await collection.insert_many(docs[start:start + CHUNK])
+
+
+def _split(total: int, rng: random.Random) -> Dict[str, int]:
+    storage = int(total * rng.uniform(0.4, 0.7))
+    main_bar = (total - storage) // 2
+    return {"main_bar": main_bar, "beer_bar": 0, "lobby": total - storage - main_bar, "storage_room": storage}
+
+
+async def seed_venue(db, venue_id: str, n_items: int, months: int = 3, rng_seed: int = 7) -> dict:
+    """Populate one venue and return the ids the benchmark scenarios need"""
+    rng = random.Random(rng_seed)
+    now = datetime.now(timezone.utc)
+
+    items = []
+    for i in range(n_items):
+        category, category_name, subs = CATEGORIES[i % len(CATEGORIES)]
+        sub_category = rng.choice(subs)
+        units_per_case = rng.choice([1, 6, 12, 15, 24])
+        cost_per_unit = round(rng.uniform(5, 400), 2)
+        items.append(server.Item(
+            venue_id=venue_id,
+            name=f"{sub_category or category_name} {i:05d}",
+            category=category,
+            category_name=category_name,
+            sub_category=sub_category,
+            units_per_case=units_per_case,
+            target_stock=rng.choice([6, 12, 24, 48, 96]),
+            sort_order=i * 100,
+            primary_supplier=rng.choice(SUPPLIERS),
+            cost_per_unit=cost_per_unit,
+            cost_per_case=round(cost_per_unit * units_per_case, 1),
+            bought_by_case=units_per_case > 1,
+        ))
+
+    n_sessions = months * 4 + 1
+    start = now - timedelta(weeks=n_sessions - 1)
+    levels = {item.id: item.target_stock for item in items}
+    sessions, historical, purchases, orders = [], [], [], []
+    for s in range(n_sessions):
+        session_date = start + timedelta(weeks=s)
+        session = server.StockSession(
+            venue_id=venue_id, session_name=f"Week {s + 1}", session_date=session_date,
+            is_active=s == n_sessions - 1,
+        )
+        sessions.append(session.dict())
+
+        received: Dict[str, List[dict]] = {}
+        for item in items:
+            level = max(0, levels[item.id] - rng.randint(0, max(1, item.target_stock // 4)))
+            if level < item.target_stock / 2:
+                cases = max(1, (item.target_stock - level) // item.units_per_case)
+                qty = cases * item.units_per_case
+                level += qty
+                purchases.append(server.PurchaseEntry(
+                    venue_id=venue_id, session_id=session.id, item_id=item.id,
+                    planned_quantity=qty, actual_quantity=qty, cost_per_unit=item.cost_per_unit,
+                    total_cost=round(qty * item.cost_per_unit, 2), supplier=item.primary_supplier,
+                    purchase_date=session_date, delivery_received=True,
+                ).dict())
+                received.setdefault(item.primary_supplier, []).append({
+                    "id": item.id, "name": item.name, "units_per_case": item.units_per_case,
+                    "cost_per_unit": item.cost_per_unit, "orderQty": cases, "isCase": True,
+                    "actualQty": cases, "actualCost": item.cost_per_case,
+                })
+            levels[item.id] = level
+            count = server.StockCount(
+                venue_id=venue_id, item_id=item.id, total_count=level, count_date=session_date, **_split(level, rng)
+            ).dict()
+            count.update({
+                "session_id": session.id,
+                "saved_date": session_date,
+                "cost_per_unit": item.cost_per_unit,
+                "wac_unit_cost": item.cost_per_unit,
+                "fifo_unit_cost": item.cost_per_unit,
+            })
+            historical.append(count)
+
+        for supplier, lines in received.items():
+            orders.append({
+                "id": str(uuid.uuid4()), "venue_id": venue_id, "supplier": supplier, "status": "completed",
+                "completed_at": session_date.isoformat(), "items": lines,
+            })
+
+    counts = [
+        server.StockCount(venue_id=venue_id, item_id=item.id, total_count=levels[item.id], **_split(levels[item.id], rng)).dict()
+        for item in items
+    ]
+
+    await _insert(db.items, [item.dict() for item in items])
+    await _insert(db.stock_counts, counts)
+    await _insert(db.stock_sessions, sessions)
+    await _insert(db.historical_counts, historical)
+    await _insert(db.purchases, purchases)
+    await _insert(db.confirmed_orders, orders)
+    await valuation.recompute(db, venue_id)
+
+    return {
+        "item_ids": [item.id for item in items],
+        "session_ids": [session["id"] for session in sessions],
+        "documents": len(items) + len(counts) + len(sessions) + len(historical) + len(purchases) + len(orders),
+    }
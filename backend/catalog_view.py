@@ -0,0 +1,116 @@
+"""Grouped, sorted views of a venue's item catalog.
+
+The count, inventory and manage tabs all list the catalog the same way:
+grouped by category (in a fixed order) and sub-category (items without one
+first, then by their lowest ``sort_order``), each group's items sorted by
+``sort_order`` or a chosen column. ``build_view`` does that once on the
+server; the caller caches the result until the catalog, its ordering or,
+when stock is included, the counts change.
+
+With counts joined, every item carries what the count tab shows next to it
+(``have``, ``target``, ``need``, ``suggested`` order and stock ``value``)
+and every group totals them.
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+# Same order as the app's tabs; other categories follow alphabetically
+CATEGORY_ORDER = ['Beer', 'Thai Alcohol', 'Import Alcohol', 'Mixers', 'Bar Supplies', 'Hostel Supplies']
+
+GROUP_FIELDS = {"category": "category_name", "sub_category": "sub_category", "supplier": "primary_supplier"}
+ITEM_COLUMNS = ("sort_order", "name", "category", "category_name", "sub_category", "units_per_case", "target_stock",
+                "primary_supplier", "cost_per_unit", "cost_per_case", "bought_by_case", "sale_price", "version")
+COUNT_COLUMNS = ("have", "target", "need", "suggested", "value")
+
+
+def parse_group(spec: str) -> List[str]:
+    """``"category,sub_category"`` -> item fields to group by, outermost first"""
+    fields = []
+    for name in (part.strip() for part in spec.split(",")):
+        if not name:
+            continue
+        if name not in GROUP_FIELDS:
+            raise ValueError(f"group must be a list of: {', '.join(GROUP_FIELDS)}")
+        fields.append(GROUP_FIELDS[name])
+    return fields
+
+
+def parse_sort(spec: str) -> Tuple[str, bool]:
+    """``"-cost_per_unit"`` -> ``("cost_per_unit", True)`` (descending)"""
+    descending = spec.startswith("-")
+    column = spec.lstrip("-") or "sort_order"
+    if column not in ITEM_COLUMNS + COUNT_COLUMNS:
+        raise ValueError(f"sort must be one of: {', '.join(ITEM_COLUMNS + COUNT_COLUMNS)}")
+    return column, descending
+
+
+def with_stock(item: dict, have: int) -> dict:
+    """The item with its count and what it takes to reach target"""
+    target = item.get('target_stock') or 0
+    need = max(0, target - have)
+    units_per_case = item.get('units_per_case') or 1
+    suggested = math.ceil(need / units_per_case) if units_per_case > 1 and item.get('bought_by_case') else need
+    value = round(have * (item.get('cost_per_unit') or 0.0), 2)
+    return {**item, "have": have, "target": target, "need": need, "suggested": suggested, "value": value}
+
+
+def sort_items(items: List[dict], column: str, descending: bool) -> List[dict]:
+    ordered = sorted(items, key=lambda i: (i.get('sort_order') or 0, i.get('name') or ""))
+    if column == "sort_order" and not descending:
+        return ordered
+    # Stable on top of the default order; items without a value go last either way
+    present = [i for i in ordered if i.get(column) is not None]
+    present.sort(key=lambda i: i[column], reverse=descending)
+    return present + [i for i in ordered if i.get(column) is None]
+
+
+def group_order(field: str, value: Optional[str], items: List[dict]) -> tuple:
+    if field == "category_name":
+        rank = CATEGORY_ORDER.index(value) if value in CATEGORY_ORDER else len(CATEGORY_ORDER)
+        return (rank, value or "")
+    if field == "sub_category":
+        return (value is not None, min(i.get('sort_order') or 0 for i in items), value or "")
+    return (value is None, value or "")
+
+
+def totals(items: List[dict], stock: bool) -> dict:
+    result = {"items": len(items)}
+    if stock:
+        for column in ("have", "need", "suggested"):
+            result[column] = sum(i[column] for i in items)
+        result["value"] = round(sum(i["value"] for i in items), 2)
+    return result
+
+
+def build_groups(items: List[dict], fields: List[str], sort: Tuple[str, bool], stock: bool, path: Tuple[str, ...] = ()) -> List[dict]:
+    field, inner = fields[0], fields[1:]
+    members: Dict[Optional[str], List[dict]] = {}
+    for item in items:
+        value = item.get(field) or None
+        members.setdefault(value, []).append(item)
+    groups = []
+    for value in sorted(members, key=lambda v: group_order(field, v, members[v])):
+        # Labels read like the app's group headers: "Thai Alcohol - Vodka"
+        part = value if value is not None else (None if path else "Other")
+        key = path + (part,) if part else path
+        group = {"field": field, "value": value, "key": " - ".join(key),
+                 "totals": totals(members[value], stock)}
+        if inner:
+            group["groups"] = build_groups(members[value], inner, sort, stock, key)
+        else:
+            group["items"] = sort_items(members[value], *sort)
+        groups.append(group)
+    return groups
+
+
+def build_view(items: List[dict], counts: Optional[Dict[str, int]], fields: List[str], sort: Tuple[str, bool]) -> dict:
+    """The catalog grouped by ``fields`` (none: one flat list), with stock joined from ``counts`` if given"""
+    stock = counts is not None
+    if stock:
+        items = [with_stock(item, counts.get(item['id'], 0)) for item in items]
+    view = {"group": list(fields), "sort": sort[0], "descending": sort[1], "totals": totals(items, stock)}
+    if fields:
+        view["groups"] = build_groups(items, fields, sort, stock)
+    else:
+        view["items"] = sort_items(items, *sort)
+    return view
@@ -0,0 +1,314 @@
+"""MongoDB connection settings, pool statistics and retries.
+
+``client_options`` reads the pool size, timeouts and retryable reads/writes
+for the Motor client from ``MONGO_*`` environment variables (unset ones keep
+the driver defaults, except ``MONGO_MIN_POOL_SIZE``, which defaults to 2).
+``warm_up`` opens that many pooled connections at startup, so the first
+concurrent requests don't each pay for a TCP + TLS handshake.
+
+``PoolStats`` is a PyMongo pool listener: connections open and checked out,
+and how long checkouts waited for a free connection.
+
+``RetryingDatabase`` wraps the Motor database and retries idempotent
+operations that hit a transient error (e.g. a replica-set election), with
+jittered exponential backoff: reads, updates using only operators where
+applying twice equals applying once (``$set``, ``$unset``, ...), replaces,
+deletes by key and index creation. Inserts, ``$inc``/``$push`` updates and
+``find_one_and_*`` are left to the driver's own single retryable-write
+attempt, which is exactly-once; retrying them again here could apply them
+twice.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from pymongo import monitoring
+from pymongo.errors import AutoReconnect, OperationFailure, PyMongoError
+from pymongo.operations import DeleteMany, DeleteOne, ReplaceOne, UpdateMany, UpdateOne
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Environment variable -> (client option, parser)
+CLIENT_SETTINGS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_RETRY_WRITES": ("retryWrites", _flag),
+    "MONGO_RETRY_READS": ("retryReads", _flag),
+}
+
+DEFAULT_MIN_POOL_SIZE = 2
+
+# Server error codes for a node stepping down or shutting down
+RETRYABLE_CODES = {6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+
+# Update operators where applying the same update twice leaves the same document
+IDEMPOTENT_OPERATORS = {"$set", "$unset", "$setOnInsert", "$min", "$max"}
+
+
+def client_options(env) -> Dict[str, Any]:
+    options = {"minPoolSize": DEFAULT_MIN_POOL_SIZE}
+    for name, (option, parse) in CLIENT_SETTINGS.items():
+        if env.get(name):
+            options[option] = parse(env[name])
+    return options
+
+
+async def warm_up(db, connections: int) -> None:
+    """Open ``connections`` pooled connections by running that many pings at once"""
+    await asyncio.gather(*(db.command("ping") for _ in range(max(1, connections))))
+
+
+# Pool statistics
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self, window: int = 1000):
+        # Pool events arrive on Motor's executor threads
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures: Dict[str, int] = {}
+        self.pools_cleared = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=window)
+
+    def _waited(self) -> float:
+        started = getattr(self.local, "checkout_started", None)
+        self.local.checkout_started = None
+        return 0.0 if started is None else time.perf_counter() - started
+
+    def connection_check_out_started(self, event) -> None:
+        # Started and finished on the same thread, by the operation that wants the connection
+        self.local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event) -> None:
+        waited = self._waited()
+        with self.lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.recent_waits.append(waited)
+
+    def connection_check_out_failed(self, event) -> None:
+        self._waited()
+        with self.lock:
+            self.checkout_failures[str(event.reason)] = self.checkout_failures.get(str(event.reason), 0) + 1
+
+    def connection_checked_in(self, event) -> None:
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event) -> None:
+        with self.lock:
+            self.open += 1
+
+    def connection_closed(self, event) -> None:
+        with self.lock:
+            self.open -= 1
+
+    def pool_cleared(self, event) -> None:
+        with self.lock:
+            self.pools_cleared += 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def summary(self) -> dict:
+        with self.lock:
+            waits = sorted(self.recent_waits)
+            return {
+                "connections_open": self.open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "pools_cleared": self.pools_cleared,
+                "wait_ms": {
+                    "mean": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                    "p50": round(waits[len(waits) // 2] * 1000, 3) if waits else 0.0,
+                    "p95": round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else 0.0,
+                    "max": round(self.wait_max * 1000, 3),
+                },
+            }
+
+
+# Retries
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, AutoReconnect):  # Network errors, no primary, not primary
+        return True
+    if isinstance(error, OperationFailure):
+        return error.code in RETRYABLE_CODES or error.has_error_label("RetryableWriteError")
+    return isinstance(error, PyMongoError) and error.has_error_label("TransientTransactionError")
+
+
+def idempotent_update(update) -> bool:
+    return isinstance(update, dict) and bool(update) and set(update) <= IDEMPOTENT_OPERATORS
+
+
+def idempotent_bulk(requests) -> bool:
+    for request in requests:
+        if isinstance(request, (UpdateOne, UpdateMany)):
+            if not idempotent_update(request._doc):
+                return False
+        elif not isinstance(request, (ReplaceOne, DeleteOne, DeleteMany)):
+            return False
+    return True
+
+
+class RetryPolicy:
+    def __init__(self, attempts: int = 3, base_delay: float = 0.1, max_delay: float = 2.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.recovered = 0
+        self.exhausted = 0
+        self.errors: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls, env) -> "RetryPolicy":
+        return cls(
+            attempts=max(1, int(env.get("MONGO_RETRY_ATTEMPTS", "3"))),
+            base_delay=float(env.get("MONGO_RETRY_BASE_MS", "100")) / 1000,
+            max_delay=float(env.get("MONGO_RETRY_MAX_MS", "2000")) / 1000,
+        )
+
+    def delay(self, attempt: int) -> float:
+        # "Full jitter": retries from many requests don't arrive in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, operation, *args, **kwargs):
+        for attempt in range(self.attempts):
+            try:
+                result = await operation(*args, **kwargs)
+            except PyMongoError as e:
+                if not is_transient(e):
+                    raise
+                self.errors[type(e).__name__] = self.errors.get(type(e).__name__, 0) + 1
+                if attempt + 1 == self.attempts:
+                    self.exhausted += 1
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self.delay(attempt))
+            else:
+                if attempt:
+                    self.recovered += 1
+                return result
+
+    def summary(self) -> dict:
+        return {"attempts": self.attempts, "retries": self.retries, "recovered": self.recovered,
+                "exhausted": self.exhausted, "errors": dict(self.errors)}
+
+
+class RetryingCursor:
+    """``find`` cursor that re-runs the query from scratch if reading it fails"""
+
+    def __init__(self, collection, policy: RetryPolicy, args, kwargs):
+        self._collection = collection
+        self._policy = policy
+        self._args = args
+        self._kwargs = kwargs
+        self._chain = []
+
+    def sort(self, *args, **kwargs):
+        self._chain.append(("sort", args, kwargs))
+        return self
+
+    def skip(self, *args, **kwargs):
+        self._chain.append(("skip", args, kwargs))
+        return self
+
+    def limit(self, *args, **kwargs):
+        self._chain.append(("limit", args, kwargs))
+        return self
+
+    def _cursor(self):
+        cursor = self._collection.find(*self._args, **self._kwargs)
+        for method, args, kwargs in self._chain:
+            cursor = getattr(cursor, method)(*args, **kwargs)
+        return cursor
+
+    async def to_list(self, length: Optional[int]):
+        return await self._policy.run(lambda: self._cursor().to_list(length))
+
+    def __aiter__(self):
+        return self._cursor().__aiter__()
+
+
+class RetryingCollection:
+    READS = {"find_one", "count_documents", "estimated_document_count", "distinct", "index_information"}
+    KEYED_WRITES = {"replace_one", "delete_one", "delete_many", "create_index"}
+
+    def __init__(self, collection, policy: RetryPolicy):
+        self._collection = collection
+        self._policy = policy
+
+    def find(self, *args, **kwargs) -> RetryingCursor:
+        return RetryingCursor(self._collection, self._policy, args, kwargs)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._collection, name)
+        if name in self.READS or name in self.KEYED_WRITES:
+            return lambda *args, **kwargs: self._policy.run(attribute, *args, **kwargs)
+        if name in ("update_one", "update_many"):
+            def update(filter, update, *args, **kwargs):
+                if idempotent_update(update):
+                    return self._policy.run(attribute, filter, update, *args, **kwargs)
+                return attribute(filter, update, *args, **kwargs)
+            return update
+        if name == "bulk_write":
+            def bulk_write(requests, *args, **kwargs):
+                if idempotent_bulk(requests):
+                    return self._policy.run(attribute, requests, *args, **kwargs)
+                return attribute(requests, *args, **kwargs)
+            return bulk_write
+        return attribute
+
+
+class RetryingDatabase:
+    def __init__(self, database, policy: RetryPolicy):
+        self._database = database
+        self._collections: Dict[str, RetryingCollection] = {}
+        self.retry_policy = policy
+
+    def __getitem__(self, name: str) -> RetryingCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = RetryingCollection(self._database[name], self.retry_policy)
+        return collection
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name == "command":
+            return lambda *args, **kwargs: self.retry_policy.run(self._database.command, *args, **kwargs)
+        if name in ("name", "client", "list_collection_names"):
+            return getattr(self._database, name)
+        return self[name]
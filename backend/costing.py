@@ -0,0 +1,302 @@
+"""Price history and cost-of-goods valuation.
+
+Every price change (item edits, confirmed orders) is appended to
+``price_history``. Received stock is tracked per item in ``item_cost_state``
+as both a perpetual weighted-average pool and a FIFO queue of lots, and each
+receipt / session snapshot adds its quantities and cost of goods to a
+per-item, per-month document in ``cost_layers``. Reports read those layers
+instead of replaying every order.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+
+COST_METHODS = ("wac", "fifo")
+
+
+def period_key(when: datetime) -> str:
+    """Accounting period (calendar month) a timestamp falls in, e.g. '2026-02'"""
+    return when.strftime("%Y-%m")
+
+
+# Pure state transitions -----------------------------------------------------
+
+def new_cost_state(venue_id: str, item_id: str, opening_qty: float, unit_cost: float, when: datetime) -> dict:
+    """Start tracking an item, valuing the stock already on hand at its current price"""
+    opening_qty = max(0, opening_qty)
+    lots = []
+    if opening_qty > 0:
+        lots.append({"qty": opening_qty, "unit_cost": unit_cost, "received_at": when, "ref_id": "opening"})
+    return {
+        "venue_id": venue_id,
+        "item_id": item_id,
+        "wac_qty": opening_qty,
+        "wac_value": opening_qty * unit_cost,
+        "lots": lots,
+        "last_unit_cost": unit_cost,
+        "last_count": None,
+        "received_since_count": 0,
+        "updated_at": when,
+    }
+
+
+def wac_unit_cost(state: dict, fallback: float = 0.0) -> float:
+    """Current weighted-average unit cost, or the last known price when the pool is empty"""
+    if state["wac_qty"] > 0:
+        return state["wac_value"] / state["wac_qty"]
+    return state.get("last_unit_cost") or fallback
+
+
+def apply_receipt(state: dict, qty: float, unit_cost: float, when: datetime, ref_id: Optional[str] = None) -> None:
+    """Add received units to both the weighted-average pool and the FIFO queue"""
+    if qty <= 0:
+        return
+    state["wac_qty"] += qty
+    state["wac_value"] += qty * unit_cost
+    state["lots"].append({"qty": qty, "unit_cost": unit_cost, "received_at": when, "ref_id": ref_id})
+    state["last_unit_cost"] = unit_cost
+    state["received_since_count"] += qty
+    state["updated_at"] = when
+
+
+def apply_usage(state: dict, qty: float, fallback_unit_cost: float = 0.0) -> Tuple[float, float]:
+    """Consume used units and return their cost as (weighted-average, FIFO).
+
+    Negative usage (a count went up without a matching receipt) is booked back
+    into stock at the current average cost and costs nothing.
+    """
+    avg_cost = wac_unit_cost(state, fallback_unit_cost)
+    if qty < 0:
+        gain = -qty
+        state["wac_qty"] += gain
+        state["wac_value"] += gain * avg_cost
+        state["lots"].append({"qty": gain, "unit_cost": avg_cost, "received_at": state["updated_at"], "ref_id": "count_gain"})
+        return 0.0, 0.0
+    if qty == 0:
+        return 0.0, 0.0
+
+    cogs_wac = qty * avg_cost
+    state["wac_qty"] = max(0, state["wac_qty"] - qty)
+    state["wac_value"] = state["wac_qty"] * avg_cost
+
+    # FIFO: consume the oldest lots first; anything beyond recorded lots is
+    # valued at the last known price
+    remaining = qty
+    cogs_fifo = 0.0
+    lots = state["lots"]
+    while remaining > 0 and lots:
+        lot = lots[0]
+        take = min(remaining, lot["qty"])
+        cogs_fifo += take * lot["unit_cost"]
+        lot["qty"] -= take
+        remaining -= take
+        if lot["qty"] <= 0:
+            lots.pop(0)
+    if remaining > 0:
+        cogs_fifo += remaining * (state.get("last_unit_cost") or fallback_unit_cost)
+    return cogs_wac, cogs_fifo
+
+
+def session_undo(state: Optional[dict], session_id: str, before: Optional[dict], layer: Optional[dict],
+                 when: datetime) -> dict:
+    """What it takes to take back a session's usage: the state before it and what it left behind"""
+    return {
+        "session_id": session_id,
+        "before": before,  # None when the session started tracking the item
+        "after": {"wac_qty": state["wac_qty"], "wac_value": state["wac_value"], "lots": len(state["lots"])},
+        "layer": layer,
+        "booked_at": when,
+    }
+
+
+def undo_session(state: dict) -> Optional[dict]:
+    """Take back the last session's usage, keeping receipts booked since.
+
+    Returns the state as if the session had not been saved, or None if that
+    session started tracking the item.
+    """
+    undo = state.pop("session_undo")
+    before, after = undo["before"], undo["after"]
+    if before is None:
+        return None
+    state["wac_qty"] = before["wac_qty"] + state["wac_qty"] - after["wac_qty"]
+    state["wac_value"] = before["wac_value"] + state["wac_value"] - after["wac_value"]
+    state["lots"] = before["lots"] + state["lots"][after["lots"]:]
+    state["last_count"] = before["last_count"]
+    state["received_since_count"] += before["received_since_count"]
+    return state
+
+
+def fifo_unit_cost(state: dict, fallback: float = 0.0) -> float:
+    """Unit cost of the oldest remaining lot, i.e. what the next unit used will cost under FIFO"""
+    if state["lots"]:
+        return state["lots"][0]["unit_cost"]
+    return state.get("last_unit_cost") or fallback
+
+
+# Persistence ----------------------------------------------------------------
+
+async def record_price(db, venue_id: str, item_id: str, cost_per_unit: float, cost_per_case: float, source: str,
+                       ref_id: Optional[str] = None, when: Optional[datetime] = None) -> dict:
+    """Append a price history entry"""
+    entry = {
+        "id": str(uuid.uuid4()),
+        "venue_id": venue_id,
+        "item_id": item_id,
+        "cost_per_unit": cost_per_unit,
+        "cost_per_case": cost_per_case,
+        "source": source,  # item_create, item_update, order
+        "ref_id": ref_id,
+        "effective_date": when or datetime.now(timezone.utc),
+    }
+    await db.price_history.insert_one(dict(entry))
+    return entry
+
+
+async def _load_states(db, venue_id: str, item_ids: List[str]) -> Dict[str, dict]:
+    states = await db.item_cost_state.find(
+        {"venue_id": venue_id, "item_id": {"$in": item_ids}}, {"_id": 0}
+    ).to_list(None)
+    return {s["item_id"]: s for s in states}
+
+
+def _layer_inc(venue_id: str, item_id: str, when: datetime, inc: dict, closing_unit_cost: float) -> UpdateOne:
+    return UpdateOne(
+        {"venue_id": venue_id, "item_id": item_id, "period": period_key(when)},
+        {
+            "$inc": inc,
+            "$set": {"closing_wac_unit_cost": closing_unit_cost, "updated_at": when},
+            "$setOnInsert": {"venue_id": venue_id, "item_id": item_id, "period": period_key(when)},
+        },
+        upsert=True,
+    )
+
+
+async def record_receipts(db, venue_id: str, receipts: List[dict], ref_id: Optional[str] = None,
+                          when: Optional[datetime] = None) -> int:
+    """Book received stock into the cost state and this month's cost layer.
+
+    ``receipts`` holds ``{"item_id", "qty", "unit_cost"}`` entries with
+    quantities in units. Prices are appended to the price history too.
+    """
+    when = when or datetime.now(timezone.utc)
+    receipts = [r for r in receipts if r["qty"] > 0]
+    if not receipts:
+        return 0
+    item_ids = list({r["item_id"] for r in receipts})
+    states = await _load_states(db, venue_id, item_ids)
+
+    missing = [i for i in item_ids if i not in states]
+    if missing:
+        items = await db.items.find({"venue_id": venue_id, "id": {"$in": missing}}, {"_id": 0}).to_list(None)
+        counts = await db.stock_counts.find({"venue_id": venue_id, "item_id": {"$in": missing}}, {"_id": 0}).to_list(None)
+        prices = {i["id"]: i.get("cost_per_unit", 0.0) for i in items}
+        on_hand = {c["item_id"]: c.get("total_count", 0) for c in counts}
+        for item_id in missing:
+            state = new_cost_state(venue_id, item_id, on_hand.get(item_id, 0), prices.get(item_id, 0.0), when)
+            state["last_count"] = on_hand.get(item_id, 0)
+            states[item_id] = state
+
+    layer_ops = []
+    history = []
+    for r in receipts:
+        state = states[r["item_id"]]
+        apply_receipt(state, r["qty"], r["unit_cost"], when, ref_id)
+        layer_ops.append(_layer_inc(
+            venue_id, r["item_id"], when,
+            {"received_qty": r["qty"], "received_cost": r["qty"] * r["unit_cost"]},
+            wac_unit_cost(state),
+        ))
+        history.append({
+            "id": str(uuid.uuid4()),
+            "venue_id": venue_id,
+            "item_id": r["item_id"],
+            "cost_per_unit": r["unit_cost"],
+            "cost_per_case": r.get("cost_per_case", 0.0),
+            "source": "order",
+            "ref_id": ref_id,
+            "effective_date": when,
+        })
+
+    await db.item_cost_state.bulk_write(
+        [ReplaceOne({"venue_id": venue_id, "item_id": i}, states[i], upsert=True) for i in item_ids], ordered=False
+    )
+    await db.cost_layers.bulk_write(layer_ops, ordered=False)
+    await db.price_history.insert_many(history)
+    return len(receipts)
+
+
+async def record_session_usage(db, venue_id: str, counts: List[dict], prices: Dict[str, float],
+                               when: Optional[datetime] = None, session_id: Optional[str] = None) -> Dict[str, dict]:
+    """Cost the usage since the previous snapshot for every counted item.
+
+    Usage is ``last snapshot + received since - current count``. Returns per
+    item the unit cost of that usage under each method (what was booked to
+    the cost layers, divided by the usage; the current price when nothing
+    was used) so it can be stored on the snapshot rows.
+
+    Saving ``session_id`` again when it was the last session costed first
+    takes back what its previous save booked, so a re-save replaces it.
+    """
+    when = when or datetime.now(timezone.utc)
+    item_ids = [c["item_id"] for c in counts]
+    states = await _load_states(db, venue_id, item_ids)
+
+    state_ops = []
+    layer_ops = []
+    unit_costs = {}
+    for count in counts:
+        item_id = count["item_id"]
+        current = count.get("total_count", 0)
+        price = prices.get(item_id, 0.0)
+        state = states.get(item_id)
+        undo = (state or {}).get("session_undo")
+        if session_id and undo and undo["session_id"] == session_id:
+            state = undo_session(state)
+            if undo["layer"]:
+                layer_ops.append(_layer_inc(
+                    venue_id, item_id, undo["booked_at"], {k: -v for k, v in undo["layer"].items()},
+                    wac_unit_cost(state, price) if state else price,
+                ))
+        interval_costs = {"wac": price, "fifo": price}
+        before = layer = None
+        if state is None:
+            state = new_cost_state(venue_id, item_id, current, price, when)
+        elif state.get("last_count") is not None:
+            before = {k: state[k] for k in ("wac_qty", "wac_value", "last_count", "received_since_count")}
+            before["lots"] = [dict(lot) for lot in state["lots"]]
+            usage = state["last_count"] + state["received_since_count"] - current
+            cogs_wac, cogs_fifo = apply_usage(state, usage, price)
+            if usage > 0:
+                interval_costs = {"wac": cogs_wac / usage, "fifo": cogs_fifo / usage}
+                layer = {"usage_qty": usage, "cogs_wac": cogs_wac, "cogs_fifo": cogs_fifo}
+                layer_ops.append(_layer_inc(venue_id, item_id, when, layer, wac_unit_cost(state, price)))
+        state["last_count"] = current
+        state["received_since_count"] = 0
+        state["updated_at"] = when
+        if session_id:
+            state["session_undo"] = session_undo(state, session_id, before, layer, when)
+        state_ops.append(ReplaceOne({"venue_id": venue_id, "item_id": item_id}, state, upsert=True))
+        unit_costs[item_id] = {
+            "cost_per_unit": price,
+            "wac_unit_cost": round(interval_costs["wac"], 4),
+            "fifo_unit_cost": round(interval_costs["fifo"], 4),
+            # What the stock left on hand is valued at
+            "closing_wac_unit_cost": round(wac_unit_cost(state, price), 2),
+        }
+
+    if state_ops:
+        await db.item_cost_state.bulk_write(state_ops, ordered=False)
+    if layer_ops:
+        # In order: a re-save's take-back and its new usage may land on the same month
+        await db.cost_layers.bulk_write(layer_ops)
+    return unit_costs
+
+
+async def ensure_indexes(db) -> None:
+    await db.price_history.create_index([("venue_id", 1), ("item_id", 1), ("effective_date", -1)])
+    await db.item_cost_state.create_index([("venue_id", 1), ("item_id", 1)], unique=True)
+    await db.cost_layers.create_index([("venue_id", 1), ("item_id", 1), ("period", 1)], unique=True)
+    await db.cost_layers.create_index([("venue_id", 1), ("period", 1)])
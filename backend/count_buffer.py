@@ -0,0 +1,215 @@
+"""Write-behind buffer for stock count edits.
+
+Counting fires a ``PUT /stock-counts/{item_id}`` per field blur, and staff
+often fix a number right after typing it. Edits to an existing count are
+merged in memory here, per venue and item, and written once per ``window``
+seconds: one ``bulk_write`` per venue however many edits arrived, plus one
+valuation update for the whole batch.
+
+The edit's response is built from the merged document, so it reflects the
+change immediately. Anything that reads counts from the database calls
+``flush`` first; the periodic flush and the one on shutdown cover the rest.
+Only edits in this process are buffered, so with several workers another
+worker's reads can lag by up to ``window``.
+
+Each buffered edit still increments the document version, so ETags and
+If-Match checks behave as with direct writes. A flush writes the merged
+document if the stored version is still the one it was built on. If another
+writer got there first, the buffered location values are applied on top of
+the newer document (last writer wins per location, as for synced ops).
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from sync_ops import LOCATIONS
+
+logger = logging.getLogger(__name__)
+
+CONFLICT_RETRIES = 3
+
+
+def version_filter(version: int) -> dict:
+    # Documents written before versioning have no version field
+    return {"version": version} if version else {"version": {"$in": [0, None]}}
+
+
+def apply_fields(doc: dict, fields: Dict[str, int], updated_at: dict) -> dict:
+    merged = {**doc, **fields}
+    merged['location_updated_at'] = {**(doc.get('location_updated_at') or {}), **updated_at}
+    merged['total_count'] = sum(merged.get(loc, 0) or 0 for loc in LOCATIONS)
+    return merged
+
+
+class PendingCount:
+    """Edits to one count not yet written"""
+
+    def __init__(self, doc: dict, previous: Optional["PendingCount"] = None):
+        self.base_version = doc.get('version', 0) or 0
+        self.base = doc
+        self.doc = doc
+        # Location values set by the buffered edits, including those of a flush
+        # still underway, for merging onto a count changed by another writer
+        self.fields: Dict[str, int] = dict(previous.fields) if previous else {}
+        self.updated_at: dict = dict(previous.updated_at) if previous else {}
+        self.writes = 0
+        self.first_write = time.monotonic()
+
+    def stage(self, fields: Dict[str, int], now) -> dict:
+        self.fields.update(fields)
+        self.updated_at.update({loc: now for loc in fields})
+        self.doc = apply_fields(self.doc, fields, {loc: now for loc in fields})
+        self.doc['count_date'] = now
+        self.writes += 1
+        self.doc['version'] = self.base_version + self.writes
+        return self.doc
+
+
+# Called once per flushed venue with (item_id, old, new) for every count written
+ValuationCallback = Callable[[str, List[Tuple[str, Optional[dict], dict]]], Awaitable[None]]
+
+
+class CountBuffer:
+    def __init__(self, db, window: float, max_pending: int, on_flushed: ValuationCallback):
+        self.db = db
+        self.window = window
+        self.max_pending = max_pending
+        self.on_flushed = on_flushed
+        self.pending: Dict[str, Dict[str, PendingCount]] = {}
+        # Entries being written, so edits arriving meanwhile build on them
+        self.flushing: Dict[str, Dict[str, PendingCount]] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"edits": 0, "flushes": 0, "documents_written": 0, "conflicts_merged": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def get(self, venue_id: str, item_id: str) -> Optional[dict]:
+        """The newest state of a count with edits not yet written (or being written)"""
+        entry = self.pending.get(venue_id, {}).get(item_id) or self.flushing.get(venue_id, {}).get(item_id)
+        return dict(entry.doc) if entry else None
+
+    def stage(self, venue_id: str, item_id: str, current: dict, fields: Dict[str, int], now) -> dict:
+        """Merge an edit into the buffered count (``current`` is its state when nothing is buffered)"""
+        venue_pending = self.pending.setdefault(venue_id, {})
+        entry = venue_pending.get(item_id)
+        if entry is None:
+            in_flight = self.flushing.get(venue_id, {}).get(item_id)
+            entry = venue_pending[item_id] = (PendingCount(in_flight.doc, in_flight) if in_flight
+                                              else PendingCount(current))
+        self.stats["edits"] += 1
+        doc = entry.stage(fields, now)
+        if sum(len(p) for p in self.pending.values()) >= self.max_pending:
+            asyncio.get_running_loop().create_task(self._flush_logged(venue_id))
+        return dict(doc)
+
+    # Flushing
+
+    async def flush(self, venue_id: Optional[str] = None) -> int:
+        """Write the buffered edits of one venue (or all); returns the number of counts written"""
+        if venue_id is None:
+            return sum([await self.flush(v) for v in list(self.pending)])
+        lock = self.locks.setdefault(venue_id, asyncio.Lock())
+        async with lock:
+            # Waiting on the lock also means any flush already underway has landed
+            entries = self.pending.pop(venue_id, None)
+            if not entries:
+                return 0
+            self.flushing[venue_id] = entries
+            try:
+                await self._write(venue_id, entries)
+            except BaseException:
+                # Keep the edits for the next flush (also when cancelled at
+                # shutdown), unless newer ones replaced them
+                venue_pending = self.pending.setdefault(venue_id, {})
+                for item_id, entry in entries.items():
+                    venue_pending.setdefault(item_id, entry)
+                raise
+            finally:
+                self.flushing.pop(venue_id, None)
+        self.stats["flushes"] += 1
+        self.stats["documents_written"] += len(entries)
+        return len(entries)
+
+    async def _flush_logged(self, venue_id: str) -> None:
+        try:
+            await self.flush(venue_id)
+        except Exception:
+            logger.exception(f"Flushing buffered counts of venue '{venue_id}' failed")
+
+    @staticmethod
+    def _update(venue_id: str, item_id: str, version: int, doc: dict, writes: int) -> Tuple[dict, dict]:
+        """Filter and update writing ``doc`` over the count if it is still at ``version``"""
+        fields = {k: v for k, v in doc.items() if k not in ("_id", "version")}
+        return ({"venue_id": venue_id, "item_id": item_id, **version_filter(version)},
+                {"$set": fields, "$inc": {"version": writes}})
+
+    async def _write(self, venue_id: str, entries: Dict[str, PendingCount]) -> None:
+        ops = [UpdateOne(*self._update(venue_id, item_id, e.base_version, e.doc, e.writes))
+               for item_id, e in entries.items()]
+        result = await self.db.stock_counts.bulk_write(ops, ordered=False)
+        written = [(item_id, e.base, e.doc) for item_id, e in entries.items()]
+        if result.matched_count < len(ops):
+            # Some counts were changed by another writer since they were buffered
+            stored = await self.db.stock_counts.find(
+                {"venue_id": venue_id, "item_id": {"$in": list(entries)}}, {"_id": 0, "item_id": 1, "version": 1}
+            ).to_list(None)
+            versions = {s['item_id']: s.get('version', 0) for s in stored}
+            missed = {item_id for item_id, e in entries.items()
+                      if versions.get(item_id) != e.base_version + e.writes}
+            written = [w for w in written if w[0] not in missed]
+            for item_id in missed:
+                merged = await self._merge(venue_id, item_id, entries[item_id])
+                if merged:
+                    written.append(merged)
+        await self.on_flushed(venue_id, written)
+
+    async def _merge(self, venue_id: str, item_id: str, entry: PendingCount):
+        """Apply the buffered location values on top of a count changed by someone else"""
+        for _ in range(CONFLICT_RETRIES):
+            current = await self.db.stock_counts.find_one({"venue_id": venue_id, "item_id": item_id}, {"_id": 0})
+            if current is None:
+                return None  # Deleted (e.g. its item was removed)
+            merged = apply_fields(current, entry.fields, entry.updated_at)
+            merged['count_date'] = entry.doc['count_date']
+            result = await self.db.stock_counts.update_one(
+                *self._update(venue_id, item_id, current.get('version', 0) or 0, merged, entry.writes)
+            )
+            if result.matched_count:
+                self.stats["conflicts_merged"] += 1
+                return item_id, current, merged
+        logger.warning(f"Gave up merging buffered edits into count {item_id} of venue '{venue_id}'")
+        return None
+
+    # Background flushing
+
+    def start(self) -> None:
+        if self.enabled:
+            self.task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.window / 2)
+            due = time.monotonic() - self.window
+            for venue_id, entries in list(self.pending.items()):
+                if any(e.first_write <= due for e in entries.values()):
+                    await self._flush_logged(venue_id)
+
+    def summary(self) -> dict:
+        return {
+            "window_ms": round(self.window * 1000),
+            "pending": sum(len(p) for p in self.pending.values()),
+            **self.stats,
+        }
@@ -0,0 +1,128 @@
+"""One item's counts and purchases as a single timeline.
+
+Reads only the item's own rows, through the ``(venue_id, item_id,
+saved_date)`` index on ``historical_counts`` and the ``(venue_id, item_id,
+purchase_date)`` index on ``purchases``; sessions are never loaded whole.
+
+A count event is a session row stored for the item. Sessions saved as
+deltas only store the rows that changed, so sessions where the item's count
+stayed the same have no event of their own: their interval is part of the
+next event's. Each count event carries the usage since the count before it,
+``previous count + received in between - this count``, the same formula
+sessions are costed with.
+
+Events come newest first, ``limit`` at a time. ``next_cursor`` is the date
+of the oldest event returned; passing it back as ``cursor`` continues below
+it. A page never ends part way through events sharing a date, so a cursor
+never skips any. Archived months are not included.
+"""
+from bisect import bisect_right
+from datetime import datetime
+from itertools import accumulate
+from typing import List, Optional
+
+COUNT_FIELDS = ("main_bar", "beer_bar", "lobby", "storage_room", "total_count")
+
+
+def date_range(field: str, start: Optional[datetime], end: Optional[datetime], before: Optional[datetime]) -> dict:
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = start
+    if end is not None:
+        bounds["$lte"] = end
+    if before is not None:
+        bounds["$lt"] = before
+    return {field: bounds} if bounds else {}
+
+
+def count_event(row: dict) -> dict:
+    return {
+        "type": "count",
+        "date": row['saved_date'],
+        "session_id": row.get('session_id'),
+        **{field: row.get(field, 0) for field in COUNT_FIELDS},
+        "unit_cost": row.get('wac_unit_cost', row.get('cost_per_unit')),
+    }
+
+
+def purchase_event(row: dict) -> dict:
+    return {
+        "type": "purchase",
+        "date": row['purchase_date'],
+        "id": row.get('id'),
+        "session_id": row.get('session_id'),
+        "order_id": row.get('order_id'),
+        "quantity": row.get('actual_quantity', 0),
+        "cost_per_unit": row.get('cost_per_unit'),
+        "total_cost": row.get('total_cost'),
+        "supplier": row.get('supplier'),
+    }
+
+
+def take_page(events: List[dict], limit: int) -> List[dict]:
+    """The first ``limit`` events, plus any after them that share the last one's date"""
+    page = events[:limit]
+    while len(page) < len(events) and events[len(page)]['date'] == page[-1]['date']:
+        page.append(events[len(page)])
+    return page
+
+
+async def item_history(db, venue_id: str, item_id: str, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None, before: Optional[datetime] = None, limit: int = 50) -> dict:
+    item = {"venue_id": venue_id, "item_id": item_id}
+    # Each stream can fill at most ``limit`` places, and one more shows whether there is another page
+    counts = await db.historical_counts.find(
+        {**item, **date_range("saved_date", start, end, before)}, {"_id": 0}
+    ).sort("saved_date", -1).to_list(limit + 1)
+    purchases = await db.purchases.find(
+        {**item, **date_range("purchase_date", start, end, before)}, {"_id": 0}
+    ).sort("purchase_date", -1).to_list(limit + 1)
+
+    # Newest first; a count and a purchase at the same moment list the count first
+    events = sorted([count_event(r) for r in counts] + [purchase_event(r) for r in purchases],
+                    key=lambda e: (e['date'], e['type'] == "count"), reverse=True)
+    page = take_page(events, limit)
+    await add_usage(db, item, [e for e in page if e['type'] == "count"], counts)
+    return {
+        "item_id": item_id,
+        "events": page,
+        "next_cursor": page[-1]['date'] if len(events) > len(page) else None,
+    }
+
+
+async def add_usage(db, item: dict, points: List[dict], counts: List[dict]) -> None:
+    """Set ``previous_date``, ``received`` and ``usage`` on count events (newest first)"""
+    if not points:
+        return
+    # The count before the oldest one on the page: fetched already, or one more indexed lookup
+    oldest = points[-1]['date']
+    older = [r for r in counts if r['saved_date'] < oldest]
+    if older:
+        baseline = older[0]
+    else:
+        baseline = await db.historical_counts.find_one(
+            {**item, "saved_date": {"$lt": oldest}}, {"_id": 0, "saved_date": 1, "total_count": 1},
+            sort=[("saved_date", -1)]
+        )
+
+    # Everything received between the baseline and the newest count, as running totals by date
+    since = baseline['saved_date'] if baseline else oldest
+    received = await db.purchases.find(
+        {**item, "purchase_date": {"$gt": since, "$lte": points[0]['date']}},
+        {"_id": 0, "purchase_date": 1, "actual_quantity": 1}
+    ).sort("purchase_date", 1).to_list(None)
+    dates = [r['purchase_date'] for r in received]
+    running = [0] + list(accumulate(r.get('actual_quantity', 0) for r in received))
+
+    def received_by(when: datetime) -> int:
+        return running[bisect_right(dates, when)]
+
+    previous = [{"date": p['date'], "total_count": p['total_count']} for p in points[1:]]
+    previous.append({"date": baseline['saved_date'], "total_count": baseline.get('total_count', 0)} if baseline else None)
+    for point, prior in zip(points, previous):
+        if prior is None:
+            point.update(previous_date=None, received=None, usage=None)
+            continue
+        got = received_by(point['date']) - received_by(prior['date'])
+        point.update(previous_date=prior['date'], received=got,
+                     usage=prior['total_count'] + got - point['total_count'])
@@ -0,0 +1,237 @@
+"""Request and database metrics in Prometheus text format.
+
+``MetricsMiddleware`` times every HTTP request and records its status,
+response size and the database commands it issued; ``CommandMetrics`` is a
+PyMongo command listener that attributes each command to the request that
+ran it (Motor copies the request's context into its executor threads).
+Routes are labelled by their template (``/api/items/{item_id}``), so label
+cardinality stays bounded.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+
+INF_LABEL = 'le="+Inf"'
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, label_values: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in self.series.items():
+            lines.append(f"{self.name}{_labels(self.labels, values)} {_number(total)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_number(self.value)}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (non-cumulative, +Inf last), sum, count]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, label_values: Tuple[str, ...], value: float) -> None:
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels, values, INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {count}")
+        return lines
+
+
+class RequestStats:
+    """Database work done on behalf of one request"""
+    __slots__ = ("commands", "db_seconds", "scope", "command_shapes")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.commands = 0
+        self.db_seconds = 0.0
+        self.scope = scope
+        self.command_shapes: Dict[str, int] = {}  # filled in by the query monitor
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope) if self.scope is not None else "unmatched"
+
+
+def route_label(scope: dict) -> str:
+    # The router stores the matched route in the scope
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "barstock"):
+        # Command listeners run on Motor's executor threads
+        self.lock = threading.Lock()
+        self.requests = Counter(f"{prefix}_http_requests_total", "HTTP requests by route and status",
+                                ("method", "route", "status"))
+        self.latency = Histogram(f"{prefix}_http_request_duration_seconds", "HTTP request latency",
+                                 ("method", "route"))
+        self.response_size = Histogram(f"{prefix}_http_response_size_bytes", "HTTP response body size",
+                                       ("method", "route"), SIZE_BUCKETS)
+        self.in_flight = Gauge(f"{prefix}_http_requests_in_flight", "HTTP requests currently being handled")
+        self.request_commands = Histogram(f"{prefix}_http_request_db_commands", "Database commands issued per request",
+                                          ("method", "route"), COMMAND_COUNT_BUCKETS)
+        self.request_db_time = Histogram(f"{prefix}_http_request_db_seconds", "Time spent in database commands per request",
+                                         ("method", "route"))
+        self.command_latency = Histogram(f"{prefix}_db_command_duration_seconds", "Database command latency",
+                                         ("command",))
+        self.command_failures = Counter(f"{prefix}_db_command_failures_total", "Failed database commands",
+                                        ("command",))
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, size: int,
+                        stats: RequestStats) -> None:
+        labels = (method, route)
+        with self.lock:
+            self.requests.inc((method, route, str(status)))
+            self.latency.observe(labels, seconds)
+            self.response_size.observe(labels, size)
+            self.request_commands.observe(labels, stats.commands)
+            self.request_db_time.observe(labels, stats.db_seconds)
+
+    def observe_command(self, command: str, seconds: float, failed: bool = False) -> None:
+        with self.lock:
+            self.command_latency.observe((command,), seconds)
+            if failed:
+                self.command_failures.inc((command,))
+
+    def render(self) -> str:
+        with self.lock:
+            lines = []
+            for metric in (self.requests, self.latency, self.response_size, self.in_flight,
+                           self.request_commands, self.request_db_time, self.command_latency, self.command_failures):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        self._record(event, failed=False)
+
+    def failed(self, event) -> None:
+        self._record(event, failed=True)
+
+    def _record(self, event, failed: bool) -> None:
+        seconds = event.duration_micros / 1e6
+        self.registry.observe_command(event.command_name, seconds, failed)
+        stats = current_request.get()
+        if stats is not None:
+            with self.registry.lock:
+                stats.commands += 1
+                stats.db_seconds += seconds
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering).
+
+    ``observers`` are called with ``(method, route, status, seconds, stats)``
+    once each request completes.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, observers: Sequence[Callable] = ()):
+        self.app = app
+        self.registry = registry
+        self.observers = tuple(observers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        size = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        self.registry.in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.registry.in_flight.dec()
+            current_request.reset(token)
+            route = route_label(scope)
+            self.registry.observe_request(scope["method"], route, status, elapsed, size, stats)
+            for observer in self.observers:
+                observer(scope["method"], route, status, elapsed, stats)
@@ -0,0 +1,201 @@
+"""Versioned, run-once rewrites of stored data into the current schema.
+
+Each migration has a version number and runs once per database, in version
+order, at startup or from ``POST /api/migrations/run``. It is recorded in
+``applied_migrations`` with what it changed. Migrations only touch documents
+still in an old shape, so running one again (two workers starting at once,
+or a run interrupted before its record was written) changes nothing.
+
+With these applied, read paths can rely on the current schema: dates are
+BSON dates rather than ISO strings, items have ``target_stock`` instead of
+``min_stock``/``max_stock``, and costs are stored rounded to 1 decimal.
+"""
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+import valuation
+from sync_ops import LOCATIONS
+
+logger = logging.getLogger(__name__)
+
+# Collections whose documents carry a venue_id
+VENUE_COLLECTIONS = [
+    "items", "recipes", "stock_counts", "stock_sessions", "historical_counts", "purchases",
+    "shopping_orders", "confirmed_orders", "suppliers", "valuation", "price_history",
+    "item_cost_state", "cost_layers", "item_usage_stats", "count_anomalies",
+]
+
+# Date fields once written as ISO strings (older app versions and raw client payloads)
+DATE_FIELDS = {
+    "stock_sessions": ["session_date"],
+    "shopping_orders": ["order_date"],
+    "confirmed_orders": ["completed_at"],
+    "purchases": ["purchase_date"],
+    "stock_counts": ["count_date"],
+    "historical_counts": ["count_date", "saved_date"],
+    "price_history": ["effective_date"],
+}
+# Maps of location -> date
+DATE_MAP_FIELDS = {"stock_counts": ["location_updated_at"], "historical_counts": ["location_updated_at"]}
+
+COST_FIELDS = ("cost_per_unit", "cost_per_case", "sale_price")
+
+Changes = Dict[str, int]  # collection -> documents rewritten
+
+
+class Migration:
+    def __init__(self, version: int, name: str, apply: Callable[..., Awaitable[Changes]]):
+        self.version = version
+        self.name = name
+        self.apply = apply  # (db, default_venue_id) -> changes
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    def register(apply):
+        MIGRATIONS.append(Migration(version, name, apply))
+        return apply
+    return register
+
+
+def parse_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)  # Strings without an offset were UTC
+
+
+async def _rewrite(collection, updates: List[UpdateOne]) -> int:
+    if updates:
+        await collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+# Documents rewritten per bulk write while iterating a cursor
+BATCH_SIZE = 500
+
+
+@migration(1, "assign_default_venue")
+async def assign_default_venue(db, default_venue_id: str) -> Changes:
+    """Assign documents written before venues existed to the default venue"""
+    changes = {}
+    for name in VENUE_COLLECTIONS:
+        result = await db[name].update_many({"venue_id": {"$exists": False}}, {"$set": {"venue_id": default_venue_id}})
+        if result.modified_count:
+            changes[name] = result.modified_count
+    # Indexes from before venues existed would reject the same id/name in two venues
+    for name, index in (("suppliers", "name_1"), ("valuation", "id_1")):
+        if index in await db[name].index_information():
+            await db[name].drop_index(index)
+    return changes
+
+
+@migration(2, "real_dates")
+async def real_dates(db, default_venue_id: str) -> Changes:
+    """ISO date strings -> BSON dates"""
+    changes = {}
+    for name in sorted(set(DATE_FIELDS) | set(DATE_MAP_FIELDS)):
+        fields, maps = DATE_FIELDS.get(name, []), DATE_MAP_FIELDS.get(name, [])
+        # Only documents with a date still stored as a string
+        paths = fields + [f"{field}.{loc}" for field in maps for loc in LOCATIONS]
+        query = {"$or": [{path: {"$type": "string"}} for path in paths]}
+        rewritten, updates = 0, []
+        async for doc in db[name].find(query, {"_id": 1, **{f: 1 for f in fields + maps}}):
+            fix = {}
+            for field in fields:
+                if isinstance(doc.get(field), str) and parse_date(doc[field]):
+                    fix[field] = parse_date(doc[field])
+            for field in maps:
+                for key, value in (doc.get(field) or {}).items():
+                    if isinstance(value, str) and parse_date(value):
+                        fix[f"{field}.{key}"] = parse_date(value)
+            if fix:
+                updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": fix}))
+            if len(updates) >= BATCH_SIZE:
+                rewritten += await _rewrite(db[name], updates)
+                updates = []
+        rewritten += await _rewrite(db[name], updates)
+        if rewritten:
+            changes[name] = rewritten
+    return changes
+
+
+@migration(3, "target_stock")
+async def target_stock(db, default_venue_id: str) -> Changes:
+    """min_stock/max_stock -> target_stock (the old maximum was the level to restock to)"""
+    items = await db.items.find(
+        {"$or": [{"min_stock": {"$exists": True}}, {"max_stock": {"$exists": True}}]},
+        {"_id": 1, "target_stock": 1, "max_stock": 1}
+    ).to_list(None)
+    updates = []
+    for item in items:
+        update = {"$unset": {"min_stock": "", "max_stock": ""}}
+        if not item.get('target_stock') and item.get('max_stock'):
+            update["$set"] = {"target_stock": int(item['max_stock'])}
+        updates.append(UpdateOne({"_id": item["_id"]}, update))
+    return {"items": await _rewrite(db.items, updates)} if updates else {}
+
+
+@migration(4, "round_costs")
+async def round_costs(db, default_venue_id: str) -> Changes:
+    """Item costs rounded to 1 decimal, as every write now stores them"""
+    items = await db.items.find({}, {"_id": 1, "venue_id": 1, **{f: 1 for f in COST_FIELDS}}).to_list(None)
+    updates = []
+    venues = set()
+    for item in items:
+        fix = {f: round(item[f], 1) for f in COST_FIELDS
+               if isinstance(item.get(f), (int, float)) and round(item[f], 1) != item[f]}
+        if fix:
+            updates.append(UpdateOne({"_id": item["_id"]}, {"$set": fix}))
+            venues.add(item.get('venue_id'))
+    await _rewrite(db.items, updates)
+    # Stock is valued at the unit cost
+    for venue_id in sorted(v for v in venues if v):
+        await valuation.recompute(db, venue_id)
+    return {"items": len(updates)} if updates else {}
+
+
+async def status(db) -> List[dict]:
+    """Every known migration, with its record if applied"""
+    applied = {r['version']: r for r in await db.applied_migrations.find({}, {"_id": 0}).to_list(None)}
+    return [{"version": m.version, "name": m.name, "applied": applied.get(m.version)}
+            for m in sorted(MIGRATIONS, key=lambda m: m.version)]
+
+
+async def run_pending(db, default_venue_id: str) -> List[dict]:
+    """Apply the migrations not yet recorded, in order; returns the records of those applied"""
+    await ensure_indexes(db)  # Before the first record, so concurrent runs can't both record one
+    applied = {r['version'] for r in await db.applied_migrations.find({}, {"_id": 0, "version": 1}).to_list(None)}
+    records = []
+    for m in sorted(MIGRATIONS, key=lambda m: m.version):
+        if m.version in applied:
+            continue
+        started = time.perf_counter()
+        changes = await m.apply(db, default_venue_id)
+        record = {
+            "version": m.version,
+            "name": m.name,
+            "changes": changes,
+            "applied_at": datetime.now(timezone.utc),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        try:
+            await db.applied_migrations.insert_one(dict(record))
+        except DuplicateKeyError:
+            pass  # Another worker ran it at the same time; ours changed nothing it hadn't
+        if changes:
+            logger.info(f"Migration {m.version} ({m.name}): {changes}")
+        records.append(record)
+    return records
+
+
+async def ensure_indexes(db) -> None:
+    await db.applied_migrations.create_index("version", unique=True)
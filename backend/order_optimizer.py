@@ -0,0 +1,258 @@
+"""Cost-minimizing purchase planner.
+
+For every item below target, each candidate supplier offer is priced at its
+cheapest mix of full cases and loose units that covers the need (case-only
+offers are rounded up to whole cases).
+
+Supplier minimum order totals decide which suppliers are worth ordering
+from, so every combination of the suppliers that have a minimum is tried
+(up to ``MAX_EXACT_SUPPLIERS`` of them; beyond that all stay open). Within a
+combination each item goes to its cheapest open offer, and an open supplier
+still short of its minimum is filled up by pulling in items it also carries
+(only from suppliers that stay above their own minimum) and/or topping up
+its lines with extra units, whichever adds less. Of the resulting plans the
+one meeting the most minimums, then the cheapest in total, is returned.
+Which suppliers to use is searched exhaustively; filling a shortfall is
+greedy, so the plan is the cheapest found rather than a proven optimum.
+"""
+import itertools
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+# Suppliers with a minimum order beyond this many are all kept open instead
+# of trying every combination (2^n plans)
+MAX_EXACT_SUPPLIERS = 8
+
+
+def item_offers(item: dict) -> List[dict]:
+    """All offers for an item: its primary supplier plus any alternatives"""
+    units_per_case = item.get('units_per_case') or 1
+    offers = [{
+        "supplier": item.get('primary_supplier') or 'Other',
+        "cost_per_unit": item.get('cost_per_unit') or 0.0,
+        "cost_per_case": item.get('cost_per_case') or 0.0,
+        "units_per_case": units_per_case,
+        # Items bought by the case are ordered in whole cases only
+        "case_only": bool(item.get('bought_by_case')) and units_per_case > 1,
+    }]
+    for offer in item.get('supplier_offers') or []:
+        offers.append({
+            "supplier": offer['supplier'],
+            "cost_per_unit": offer.get('cost_per_unit') or 0.0,
+            "cost_per_case": offer.get('cost_per_case') or 0.0,
+            "units_per_case": offer.get('units_per_case') or units_per_case,
+            "case_only": bool(offer.get('case_only')),
+        })
+    return offers
+
+
+def price_offer(need: int, offer: dict, supplier_case_only: bool = False) -> Optional[dict]:
+    """Cheapest (cases, singles) combination from one offer covering ``need`` units"""
+    upc = max(1, offer['units_per_case'])
+    cpu = offer['cost_per_unit']
+    cpc = offer['cost_per_case'] or (cpu * upc if upc > 1 else 0.0)
+    case_only = (offer['case_only'] or supplier_case_only) and upc > 1
+    has_cases = upc > 1 and cpc > 0
+    has_singles = cpu > 0 and not case_only
+
+    candidates = []
+    if has_cases:
+        full = need // upc
+        candidates.append((math.ceil(need / upc), 0))
+        if has_singles:
+            candidates.append((full, need - full * upc))
+    if has_singles:
+        candidates.append((0, need))
+    if not candidates:
+        # Unpriced item: still plan the quantity, at zero cost
+        candidates.append((math.ceil(need / upc), 0) if case_only else (0, need))
+
+    best = None
+    for cases, singles in candidates:
+        cost = cases * cpc + singles * cpu
+        if best is None or cost < best['cost'] - 1e-9:
+            best = {
+                "supplier": offer['supplier'],
+                "cases": cases,
+                "singles": singles,
+                "units": cases * upc + singles,
+                "units_per_case": upc,
+                "cost_per_unit": cpu,
+                "cost_per_case": cpc,
+                "cost": round(cost, 2),
+            }
+    return best
+
+
+def optimize_orders(needs: Dict[str, int], items: Dict[str, dict],
+                    supplier_terms: Optional[Dict[str, dict]] = None) -> dict:
+    """Plan the cheapest order per supplier for the given per-item needs (in units)"""
+    supplier_terms = supplier_terms or {}
+
+    # Price every offer once; options[item_id] is sorted cheapest first
+    options: Dict[str, List[dict]] = {}
+    offers: Dict[Tuple[str, str], Tuple[dict, bool]] = {}
+    for item_id, need in needs.items():
+        if need <= 0:
+            continue
+        priced = []
+        for offer in item_offers(items[item_id]):
+            terms = supplier_terms.get(offer['supplier'], {})
+            line = price_offer(need, offer, terms.get('case_only', False))
+            if line:
+                priced.append(line)
+                offers.setdefault((item_id, offer['supplier']), (offer, terms.get('case_only', False)))
+        if priced:
+            # Cheapest first; ties keep the primary supplier
+            options[item_id] = sorted(priced, key=lambda line: line['cost'])
+
+    minimums = {name: terms.get('min_order_total') or 0.0 for name, terms in supplier_terms.items()}
+    gated = sorted({line['supplier'] for lines in options.values() for line in lines if minimums.get(line['supplier'])})
+    if len(gated) > MAX_EXACT_SUPPLIERS:
+        combinations = [set(gated)]
+    else:
+        combinations = [set(c) for n in range(len(gated) + 1) for c in itertools.combinations(gated, n)]
+
+    def reprice(item_id: str, supplier: str, units: int) -> dict:
+        offer, supplier_case_only = offers[(item_id, supplier)]
+        return price_offer(units, offer, supplier_case_only)
+
+    best, best_rank = None, None
+    for open_suppliers in combinations:
+        plan = _plan(open_suppliers, options, needs, minimums, reprice)
+        if plan is None:
+            continue
+        unmet = sum(1 for name, total in _totals(plan).items() if total < minimums.get(name, 0.0) - 1e-9)
+        rank = (unmet, round(sum(line['cost'] for line in plan.values()), 2))
+        if best_rank is None or rank < best_rank:
+            best, best_rank = plan, rank
+    choice = best or {}
+
+    suppliers: Dict[str, dict] = {}
+    for item_id, planned in choice.items():
+        item = items[item_id]
+        line = {k: v for k, v in planned.items() if k != 'cover_units'}
+        entry = suppliers.setdefault(line['supplier'], {"items": [], "total_cost": 0.0})
+        entry['items'].append({
+            "item_id": item_id,
+            "item_name": item.get('name', ''),
+            "need_units": needs[item_id],
+            **line,
+            # Extra units bought only to reach the supplier's minimum
+            "top_up_units": line['units'] - planned['cover_units'],
+        })
+        entry['total_cost'] = round(entry['total_cost'] + line['cost'], 2)
+
+    for name, entry in suppliers.items():
+        minimum = supplier_terms.get(name, {}).get('min_order_total', 0.0)
+        entry['min_order_total'] = minimum
+        entry['meets_minimum'] = entry['total_cost'] >= minimum
+        entry['items'].sort(key=lambda line: line['item_name'])
+
+    return {
+        "suppliers": suppliers,
+        "total_cost": round(sum(e['total_cost'] for e in suppliers.values()), 2),
+        "items_planned": len(choice),
+    }
+
+
+def _totals(choice: Dict[str, dict]) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for line in choice.values():
+        out[line['supplier']] = out.get(line['supplier'], 0.0) + line['cost']
+    return out
+
+
+def _plan(open_suppliers: Set[str], options: Dict[str, List[dict]], needs: Dict[str, int],
+          minimums: Dict[str, float], reprice) -> Optional[Dict[str, dict]]:
+    """Cheapest plan ordering only from suppliers without a minimum or in ``open_suppliers``"""
+    def usable(supplier: str) -> bool:
+        return not minimums.get(supplier) or supplier in open_suppliers
+
+    choice = {}
+    for item_id, lines in options.items():
+        line = next((line for line in lines if usable(line['supplier'])), None)
+        if line is None:
+            return None  # An item only these closed suppliers sell
+        choice[item_id] = {**line, "cover_units": line['units']}
+
+    # Biggest minimums first: they are the hardest to reach
+    for supplier in sorted(open_suppliers, key=lambda s: (-minimums[s], s)):
+        totals = _totals(choice)
+        if supplier not in totals:
+            continue  # Nothing ordered from it, so its minimum doesn't apply
+        shortfall = minimums[supplier] - totals[supplier]
+        if shortfall <= 1e-9:
+            continue
+        candidates = [_top_up(choice, supplier, shortfall, needs, reprice)]
+        pulled = _pull(choice, supplier, shortfall, options, minimums)
+        if pulled is not None:
+            remaining = minimums[supplier] - _totals(pulled)[supplier]
+            candidates.append(_top_up(pulled, supplier, remaining, needs, reprice) if remaining > 1e-9 else pulled)
+        reached = [c for c in candidates if c is not None]
+        if reached:
+            choice = min(reached, key=lambda c: sum(line['cost'] for line in c.values()))
+    return choice
+
+
+def _pull(choice: Dict[str, dict], supplier: str, shortfall: float, options: Dict[str, List[dict]],
+          minimums: Dict[str, float]) -> Optional[Dict[str, dict]]:
+    """Move items ``supplier`` also carries onto its order, cheapest extra cost per unit of progress first.
+
+    An item is only taken from a supplier that keeps meeting its own minimum
+    (or has nothing left to order). None if nothing could be pulled.
+    """
+    pulls = []
+    for item_id, line in choice.items():
+        if line['supplier'] == supplier:
+            continue
+        alt = next((o for o in options[item_id] if o['supplier'] == supplier), None)
+        if alt and alt['cost'] > 0:
+            pulls.append(((alt['cost'] - line['cost']) / alt['cost'], item_id, alt))
+    if not pulls:
+        return None
+    pulls.sort(key=lambda p: (p[0], p[1]))
+    choice = dict(choice)
+    totals = _totals(choice)
+    gained = 0.0
+    moved = False
+    for _, item_id, alt in pulls:
+        if gained >= shortfall - 1e-9:
+            break
+        donor = choice[item_id]
+        left = totals[donor['supplier']] - donor['cost']
+        if left > 1e-9 and left < minimums.get(donor['supplier'], 0.0) - 1e-9:
+            continue  # Would push that supplier below its own minimum
+        totals[donor['supplier']] = left
+        choice[item_id] = {**alt, "cover_units": alt['units']}
+        gained += alt['cost']
+        moved = True
+    return choice if moved else None
+
+
+def _top_up(choice: Dict[str, dict], supplier: str, shortfall: float, needs: Dict[str, int],
+            reprice) -> Optional[Dict[str, dict]]:
+    """Buy extra units on ``supplier``'s lines (at most doubling each) until ``shortfall`` is covered.
+
+    Each step adds the next purchasable amount of one line; the step that
+    covers what is left with the least overshoot is preferred. None if the
+    lines can't reach it.
+    """
+    choice = dict(choice)
+    added = 0.0
+    while added < shortfall - 1e-9:
+        steps = []
+        for item_id, line in choice.items():
+            if line['supplier'] != supplier or line['units'] + 1 > 2 * needs[item_id]:
+                continue
+            bigger = reprice(item_id, supplier, line['units'] + 1)
+            if bigger['units'] <= 2 * needs[item_id] and bigger['cost'] > line['cost']:
+                steps.append((bigger['cost'] - line['cost'], item_id, bigger))
+        if not steps:
+            return None
+        remaining = shortfall - added
+        covering = [s for s in steps if s[0] >= remaining - 1e-9]
+        cost, item_id, bigger = min(covering, key=lambda s: (s[0], s[1])) if covering else max(steps, key=lambda s: (s[0], s[1]))
+        choice[item_id] = {**bigger, "cover_units": choice[item_id]['cover_units']}
+        added += cost
+    return choice
@@ -0,0 +1,31 @@
+"""Fractional sort keys for the item catalog.
+
+Moving an item (or a group of items) gives it new ``sort_order`` keys
+spaced evenly between its new neighbours' keys, so a move writes only the
+moved items. Each move into the same gap halves it; once a gap is too
+small for the keys needed (or two neighbours share a key, as items did
+when groups were renumbered as a whole), the venue's keys are respaced
+``STEP`` apart in their current order and the move is retried.
+"""
+from typing import List, Optional
+
+STEP = 100.0  # Spacing of freshly numbered keys, as the app has always used
+MIN_GAP = 1e-6  # About 26 moves into the same gap before a rebalance
+
+
+def keys_between(lo: Optional[float], hi: Optional[float], n: int) -> Optional[List[float]]:
+    """``n`` increasing keys strictly between ``lo`` and ``hi`` (either may be open), or None if they don't fit"""
+    if lo is None and hi is None:
+        lo = 0.0
+    if lo is None:
+        lo = hi - STEP * (n + 1)
+    elif hi is None:
+        hi = lo + STEP * (n + 1)
+    gap = (hi - lo) / (n + 1)
+    if gap < MIN_GAP:
+        return None
+    return [lo + gap * (i + 1) for i in range(n)]
+
+
+def spaced(n: int) -> List[float]:
+    return [STEP * (i + 1) for i in range(n)]
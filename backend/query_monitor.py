@@ -0,0 +1,172 @@
+"""Database command monitoring: slow queries and N+1 suspects.
+
+``QueryMonitor`` is a PyMongo command listener. Every command is reduced to
+its *shape* (command, collection and filter with the values blanked out, e.g.
+``update items {"venue_id": "?", "id": "?"}``), counted against the request
+that issued it, and logged when slower than ``slow_ms``. When a request
+issues more than ``n_plus_one_threshold`` commands of the same shape it is
+recorded as an N+1 suspect: a loop doing one round trip per item.
+"""
+import heapq
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from metrics import current_request
+
+logger = logging.getLogger(__name__)
+
+# Handshake, auth and cursor bookkeeping, not application queries
+IGNORED_COMMANDS = {
+    "hello", "ismaster", "isMaster", "ping", "buildInfo", "saslStart", "saslContinue",
+    "endSessions", "killCursors", "getMore",
+}
+
+MAX_SLOW_QUERIES = 50
+
+
+def _blank(value):
+    if isinstance(value, dict):
+        return {k: _blank(v) for k, v in value.items()}
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        return [_blank(v) for v in value]
+    return "?"
+
+
+def command_filter(command_name: str, command: dict) -> Optional[dict]:
+    if command_name in ("find", "count", "distinct"):
+        return command.get("filter", command.get("query"))
+    if command_name == "findAndModify":
+        return command.get("query")
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        return statements[0].get("q") if statements else None
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        return pipeline[0].get("$match") if pipeline else None
+    return None
+
+
+def command_shape(command_name: str, command: dict) -> str:
+    collection = command.get(command_name)
+    query = command_filter(command_name, command)
+    shape = f"{command_name} {collection}"
+    if query is not None:
+        shape += " " + json.dumps(_blank(query), default=str)
+    return shape
+
+
+class QueryMonitor(monitoring.CommandListener):
+    def __init__(self, slow_ms: float = 100.0, n_plus_one_threshold: int = 10, recent: int = 100):
+        self.slow_ms = slow_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, Tuple[str, str]] = {}
+        self._recent_slow = deque(maxlen=recent)
+        self._worst_slow: List[tuple] = []  # min-heap of (duration_ms, seq, entry)
+        self._seq = 0
+        self._suspects: Dict[Tuple[str, str], dict] = {}
+        self._routes: Dict[str, dict] = {}
+
+    # Command listener
+
+    def started(self, event) -> None:
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        shape = command_shape(event.command_name, event.command)
+        stats = current_request.get()
+        route = stats.route if stats is not None else None
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (shape, route)
+            if stats is not None:
+                stats.command_shapes[shape] = stats.command_shapes.get(shape, 0) + 1
+
+    def succeeded(self, event) -> None:
+        self._finish(event)
+
+    def failed(self, event) -> None:
+        self._finish(event)
+
+    def _finish(self, event) -> None:
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.slow_ms:
+            return
+        shape, route = pending
+        entry = {
+            "shape": shape,
+            "route": route,
+            "duration_ms": round(duration_ms, 2),
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+        logger.warning(f"Slow query ({duration_ms:.1f}ms) on {route or 'background'}: {shape}")
+        with self._lock:
+            self._recent_slow.append(entry)
+            self._seq += 1
+            item = (duration_ms, self._seq, entry)
+            if len(self._worst_slow) < MAX_SLOW_QUERIES:
+                heapq.heappush(self._worst_slow, item)
+            elif duration_ms > self._worst_slow[0][0]:
+                heapq.heapreplace(self._worst_slow, item)
+
+    # Request observer (called by the metrics middleware)
+
+    def finish_request(self, method: str, route: str, status: int, seconds: float, stats) -> None:
+        key = f"{method} {route}"
+        suspects = [(shape, n) for shape, n in stats.command_shapes.items() if n > self.n_plus_one_threshold]
+        with self._lock:
+            totals = self._routes.get(key)
+            if totals is None:
+                totals = self._routes[key] = {"route": key, "requests": 0, "commands": 0, "max_commands": 0,
+                                              "db_ms": 0.0}
+            totals["requests"] += 1
+            totals["commands"] += stats.commands
+            totals["max_commands"] = max(totals["max_commands"], stats.commands)
+            totals["db_ms"] += stats.db_seconds * 1000
+
+            for shape, n in suspects:
+                suspect = self._suspects.get((key, shape))
+                if suspect is None:
+                    suspect = self._suspects[(key, shape)] = {"route": key, "shape": shape, "requests": 0,
+                                                              "max_repeats": 0, "total_repeats": 0}
+                suspect["requests"] += 1
+                suspect["max_repeats"] = max(suspect["max_repeats"], n)
+                suspect["total_repeats"] += n
+                suspect["last_seen"] = datetime.now(timezone.utc).isoformat()
+        for shape, n in suspects:
+            logger.warning(f"N+1 suspect: {key} issued {n}x {shape}")
+
+    # Reporting
+
+    def summary(self, limit: int = 20) -> dict:
+        with self._lock:
+            routes = [
+                {**r, "db_ms": round(r["db_ms"], 2), "avg_commands": round(r["commands"] / r["requests"], 2)}
+                for r in self._routes.values()
+            ]
+            suspects = [dict(s) for s in self._suspects.values()]
+            slowest = [entry for _, _, entry in sorted(self._worst_slow, reverse=True)]
+            recent = list(self._recent_slow)[-limit:][::-1]
+        return {
+            "slow_ms": self.slow_ms,
+            "n_plus_one_threshold": self.n_plus_one_threshold,
+            "n_plus_one_suspects": sorted(suspects, key=lambda s: s["total_repeats"], reverse=True)[:limit],
+            "slowest_queries": slowest[:limit],
+            "recent_slow_queries": recent,
+            "routes_by_commands": sorted(routes, key=lambda r: r["commands"], reverse=True)[:limit],
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._recent_slow.clear()
+            self._worst_slow.clear()
+            self._suspects.clear()
+            self._routes.clear()
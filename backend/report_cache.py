@@ -0,0 +1,70 @@
+"""Size-bounded LRU cache for reports over saved sessions.
+
+Saved sessions are immutable snapshots, so a report over a fixed set of
+sessions only changes when the catalog changes (covered by putting the
+catalog version in the key) or when something is written against one of
+those sessions (covered by ``invalidate_session``).
+"""
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+
+class ReportCache:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(kind: str, session_ids: Tuple[str, ...], version: Hashable, *extra: Hashable) -> tuple:
+        return (kind, tuple(session_ids), version) + extra
+
+    def get(self, key: Hashable):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_build(self, key: Hashable, build: Callable[[], Awaitable[Any]]):
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = await build()
+        self.put(key, value)
+        return value
+
+    def invalidate_session(self, session_id: str) -> int:
+        """Drop every cached report that includes ``session_id``"""
+        stale = [key for key in self._entries if session_id in key[1]]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
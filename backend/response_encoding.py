@@ -0,0 +1,179 @@
+"""Response compression and MessagePack content negotiation.
+
+``EncodingMiddleware`` compresses response bodies of at least
+``minimum_size`` bytes with brotli or gzip, whichever the request's
+``Accept-Encoding`` ranks higher (brotli on a tie: it is smaller at a
+similar cost). Only textual and MessagePack bodies are compressed, and a
+body that already has a ``Content-Encoding`` is left alone. It is a pure
+ASGI middleware added inside ``MetricsMiddleware``, so the recorded response
+sizes are the bytes on the wire.
+
+The list endpoints use ``NegotiatedResponse``: JSON by default, MessagePack
+when the request's ``Accept`` names ``application/msgpack`` and ranks it at
+least as high as JSON. The middleware records that preference for the request, since
+FastAPI builds the response without access to the request.
+"""
+import zlib
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import brotli
+import msgpack
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+MSGPACK = "application/msgpack"
+COMPRESSIBLE_TYPES = ("text/", "application/json", MSGPACK, "application/javascript", "image/svg+xml")
+
+prefers_msgpack: ContextVar[bool] = ContextVar("prefers_msgpack", default=False)
+
+
+def parse_qualities(header: str) -> Dict[str, float]:
+    """``"br;q=1.0, gzip;q=0.8"`` -> ``{"br": 1.0, "gzip": 0.8}`` (lower-cased)"""
+    qualities = {}
+    for part in header.split(","):
+        value, *params = [p.strip() for p in part.split(";")]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        qualities[value.lower()] = q
+    return qualities
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    qualities = parse_qualities(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    # Earlier names win ties
+    q, name = max(((qualities.get(name, wildcard), name) for name in ("br", "gzip")), key=lambda c: c[0])
+    return name if q > 0 else None
+
+
+def accepts_msgpack(accept: str) -> bool:
+    qualities = parse_qualities(accept)
+
+    def quality(media_type: str) -> float:
+        kind = media_type.split("/")[0]
+        return qualities.get(media_type, qualities.get(f"{kind}/*", qualities.get("*/*", 0.0)))
+
+    # Only when asked for by name: browsers and most clients send */*
+    msgpack_q = max(qualities.get(MSGPACK, 0.0), qualities.get("application/x-msgpack", 0.0))
+    return msgpack_q > 0 and msgpack_q >= quality("application/json")
+
+
+def compressible(headers: Headers) -> bool:
+    return "content-encoding" not in headers and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class EncodingMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def encoder(self, encoding: str):
+        return BrotliEncoder(self.brotli_quality) if encoding == "br" else GzipEncoder(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        token = prefers_msgpack.set(accepts_msgpack(request_headers.get("accept", "")))
+        try:
+            encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+            if encoding is None:
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, self.compressing(send, encoding))
+        finally:
+            prefers_msgpack.reset(token)
+
+    def compressing(self, send, encoding: str):
+        start = None
+        encoder = None  # Set once the response turns out to be worth compressing
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message  # Held until the first body chunk shows the size
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=start["headers"])
+                if not compressible(headers) or (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = self.encoder(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]  # Streamed: the length isn't known up front
+                else:
+                    body = encoder.compress(body) + encoder.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            chunk = encoder.compress(body)
+            if not more_body:
+                chunk += encoder.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        return send_compressed
+
+
+class NegotiatedResponse(JSONResponse):
+    """JSON, or MessagePack when the request prefers it"""
+
+    def __init__(self, content, *args, **kwargs):
+        self.media_type = MSGPACK if prefers_msgpack.get() else JSONResponse.media_type
+        super().__init__(content, *args, **kwargs)
+        self.headers.add_vary_header("Accept")
+
+    def render(self, content) -> bytes:
+        if self.media_type == MSGPACK:
+            return msgpack.packb(content)
+        return super().render(content)
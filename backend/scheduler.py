@@ -0,0 +1,266 @@
+"""In-process asyncio job scheduler.
+
+Jobs run on an interval or a cron schedule inside the app's event loop, off
+the request path. A ``single_flight`` job takes a lease document in
+``job_leases`` before running, so when several workers run the app only one
+of them runs it at a time; the lease is renewed while the job runs and
+expires on its own if the worker dies. Local jobs (e.g. warming this
+process's caches) run in every worker.
+
+Every run is recorded in ``job_runs`` (trigger, duration, outcome), so the
+history shown at ``/api/jobs`` covers all workers.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+RUN_HISTORY_DAYS = 14
+
+
+class CronSchedule:
+    """Five-field cron expression (minute hour day-of-month month day-of-week).
+
+    Fields take ``*``, numbers, ranges (``1-5``), steps (``*/15``, ``0-30/10``)
+    and lists (``1,15``); day of week runs 0-6 from Sunday (7 is Sunday too).
+    As in cron, when both day fields are restricted a day matching either runs.
+    """
+    BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expression: str, tz: str = "UTC"):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.tz = ZoneInfo(tz)
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.BOUNDS)
+        )
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/")
+                step = int(step_text)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(x) for x in part.split("-"))
+            else:
+                start = end = int(part)
+            if high == 6 and end == 7:  # Sunday as 7
+                values.add(0)
+                end = 6
+            if start < low or end > high or step < 1:
+                raise ValueError(f"Cron field {field!r} out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return in_weekdays
+        if self.any_weekday:
+            return in_days
+        return in_days or in_weekdays
+
+    def next_after(self, when: datetime) -> datetime:
+        """First matching minute strictly after ``when``"""
+        local = when.astimezone(self.tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(366 * 5):
+            if self._day_matches(local):
+                for hour in sorted(h for h in self.hours if h >= local.hour):
+                    first_minute = local.minute if hour == local.hour else 0
+                    minutes = [m for m in sorted(self.minutes) if m >= first_minute]
+                    if minutes:
+                        return local.replace(hour=hour, minute=minutes[0]).astimezone(timezone.utc)
+            local = (local + timedelta(days=1)).replace(hour=0, minute=0)
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval: Optional[float] = None,
+                 cron: Optional[CronSchedule] = None, single_flight: bool = True, lease_seconds: float = 300,
+                 initial_delay: Optional[float] = None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = cron
+        self.single_flight = single_flight
+        self.lease_seconds = lease_seconds
+        self.initial_delay = initial_delay
+        self.next_run: Optional[datetime] = None
+        self.running = False
+        self.skipped = 0  # Runs another worker held the lease for
+
+    def schedule_after(self, when: datetime, first: bool = False) -> datetime:
+        if self.cron:
+            self.next_run = self.cron.next_after(when)
+        else:
+            delay = self.initial_delay if first and self.initial_delay is not None else self.interval
+            self.next_run = when + timedelta(seconds=delay)
+        return self.next_run
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "schedule": f"cron {self.cron.expression}" if self.cron else f"every {self.interval:g}s",
+            "single_flight": self.single_flight,
+            "next_run": self.next_run,
+            "running": self.running,
+            "skipped": self.skipped,
+        }
+
+
+class Scheduler:
+    def __init__(self, db, owner: Optional[str] = None, tz: str = "UTC"):
+        self.db = db
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.tz = tz
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add_interval(self, name: str, seconds: float, func: Callable[[], Awaitable], **options) -> Job:
+        return self._add(Job(name, func, interval=seconds, **options))
+
+    def add_cron(self, name: str, expression: str, func: Callable[[], Awaitable], **options) -> Job:
+        return self._add(Job(name, func, cron=CronSchedule(expression, self.tz), **options))
+
+    def _add(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError(f"Job {job.name!r} already registered")
+        self.jobs[job.name] = job
+        return job
+
+    # Lifecycle
+
+    def start(self) -> None:
+        now = datetime.now(timezone.utc)
+        for job in self.jobs.values():
+            job.schedule_after(now, first=True)
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job:{job.name}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _loop(self, job: Job) -> None:
+        while True:
+            delay = (job.next_run - datetime.now(timezone.utc)).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.run(job.name, trigger="schedule")
+            except Exception:
+                logger.exception(f"Job {job.name} could not be run")
+            job.schedule_after(datetime.now(timezone.utc))
+
+    # Running
+
+    async def _acquire(self, job: Job) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            lease = await self.db.job_leases.find_one_and_update(
+                {"name": job.name, "$or": [{"expires_at": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "acquired_at": now,
+                          "expires_at": now + timedelta(seconds=job.lease_seconds)}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False  # Held by another worker
+        return lease is not None and lease.get("owner") == self.owner
+
+    async def _renew(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(job.lease_seconds / 3)
+            await self.db.job_leases.update_one(
+                {"name": job.name, "owner": self.owner},
+                {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=job.lease_seconds)}},
+            )
+
+    async def _release(self, job: Job) -> None:
+        await self.db.job_leases.update_one(
+            {"name": job.name, "owner": self.owner}, {"$set": {"expires_at": datetime.now(timezone.utc)}}
+        )
+
+    async def run(self, name: str, trigger: str = "manual") -> dict:
+        """Run a job now (unless it is already running here or holds no lease)"""
+        job = self.jobs[name]
+        if job.running:
+            return {"job": name, "status": "skipped", "reason": "already running"}
+        if job.single_flight and not await self._acquire(job):
+            job.skipped += 1
+            return {"job": name, "status": "skipped", "reason": "running on another worker"}
+
+        job.running = True
+        renewing = asyncio.create_task(self._renew(job)) if job.single_flight else None
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        record = {"id": str(uuid.uuid4()), "job": name, "owner": self.owner, "trigger": trigger,
+                  "started_at": started_at}
+        try:
+            result = await job.func()
+            record.update(status="ok", result=result)
+        except Exception as e:
+            logger.exception(f"Job {name} failed")
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        finally:
+            job.running = False
+            if renewing:
+                renewing.cancel()
+            if job.single_flight:
+                await self._release(job)
+        record.update(finished_at=datetime.now(timezone.utc), duration_ms=round((time.perf_counter() - started) * 1000, 2))
+        try:
+            await self.db.job_runs.insert_one(dict(record))
+        except Exception:
+            logger.exception(f"Could not record run of job {name}")
+        return record
+
+    # Reporting
+
+    async def status(self, runs: int = 10) -> List[dict]:
+        leases = {lease['name']: lease for lease in await self.db.job_leases.find({}, {"_id": 0}).to_list(None)}
+        jobs = []
+        for job in self.jobs.values():
+            recent = await self.db.job_runs.find({"job": job.name}, {"_id": 0}).sort("started_at", -1).to_list(runs)
+            durations = sorted(r['duration_ms'] for r in recent)
+            lease = leases.get(job.name)
+            jobs.append({
+                **job.describe(),
+                "lease": lease if lease and _aware(lease['expires_at']) > datetime.now(timezone.utc) else None,
+                "last_run": recent[0] if recent else None,
+                "median_duration_ms": durations[len(durations) // 2] if durations else None,
+                "max_duration_ms": durations[-1] if durations else None,
+                "recent_runs": recent,
+            })
+        return jobs
+
+    async def ensure_indexes(self) -> None:
+        await self.db.job_leases.create_index("name", unique=True)
+        await self.db.job_runs.create_index([("job", 1), ("started_at", -1)])
+        await self.db.job_runs.create_index("started_at", expireAfterSeconds=RUN_HISTORY_DAYS * 86400)
+
+
+def _aware(when: datetime) -> datetime:
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
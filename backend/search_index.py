@@ -0,0 +1,185 @@
+"""Prefix and fuzzy search over a venue's item catalog.
+
+Item names, sub-categories, category names and suppliers are normalised
+(case-folded, accents stripped, split on anything that isn't a letter or
+digit) into tokens. A prefix trie finds the tokens a partly typed word could
+become, and a trigram index finds tokens close to a misspelt one ("sinhga"
+-> "singha"), scored by the Dice coefficient of their trigrams.
+
+Every query token has to match an item somewhere; an item's score adds up
+each query token's best match, weighted by the field it matched in (a name
+counts more than a supplier). The index lives in memory, per venue:
+``add``/``remove`` keep it current for single-item writes, and ``build``
+rebuilds it from scratch when it missed some.
+"""
+import heapq
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+
+FIELD_WEIGHTS = {"name": 1.0, "sub_category": 0.6, "category_name": 0.4, "primary_supplier": 0.3}
+
+EXACT_SCORE = 1.0
+# A prefix match scores between these, higher the more of the token was typed
+PREFIX_SCORE = (0.5, 0.9)
+FUZZY_SCORE = 0.7  # times the trigram similarity
+MIN_SIMILARITY = 0.4  # a swapped pair of letters in a six-letter word still scores 0.43
+MIN_FUZZY_LENGTH = 3  # shorter tokens share too few trigrams to compare
+
+_SPLIT = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [t for t in _SPLIT.split(normalize(text or "")) if t]
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "tokens")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.tokens: Set[str] = set()  # Every indexed token below this node
+
+
+class SearchIndex:
+    def __init__(self):
+        self.version = None  # Catalog version the index reflects
+        self.items: Dict[str, dict] = {}  # id -> fields returned with a hit
+        self.sort_keys: Dict[str, tuple] = {}
+        self.item_tokens: Dict[str, Set[str]] = {}
+        self.postings: Dict[str, Dict[str, float]] = {}  # token -> {item id: best field weight}
+        self.root = _TrieNode()
+        self.trigram_tokens: Dict[str, Set[str]] = {}
+        self.trigram_counts: Dict[str, int] = {}  # token -> number of distinct trigrams
+
+    def build(self, items: Iterable[dict], version) -> None:
+        self.__init__()
+        for item in items:
+            self.add(item)
+        self.version = version
+
+    # Writes
+
+    def add(self, item: dict) -> None:
+        """Index an item, replacing what was indexed for it before"""
+        self.remove(item['id'])
+        self.items[item['id']] = {"id": item['id'], **{field: item.get(field) for field in FIELD_WEIGHTS}}
+        name = item.get('name') or ""
+        self.sort_keys[item['id']] = (len(name), name)
+        weights: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(item.get(field)):
+                weights[token] = max(weights.get(token, 0.0), weight)
+        self.item_tokens[item['id']] = set(weights)
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                self._add_token(token)
+            posting[item['id']] = weight
+
+    def remove(self, item_id: str) -> None:
+        self.items.pop(item_id, None)
+        self.sort_keys.pop(item_id, None)
+        for token in self.item_tokens.pop(item_id, ()):
+            posting = self.postings[token]
+            posting.pop(item_id, None)
+            if not posting:
+                del self.postings[token]
+                self._remove_token(token)
+
+    def _add_token(self, token: str) -> None:
+        node = self.root
+        node.tokens.add(token)
+        for char in token:
+            node = node.children.setdefault(char, _TrieNode())
+            node.tokens.add(token)
+        grams = trigrams(token)
+        self.trigram_counts[token] = len(grams)
+        for gram in grams:
+            self.trigram_tokens.setdefault(gram, set()).add(token)
+
+    def _remove_token(self, token: str) -> None:
+        node = self.root
+        node.tokens.discard(token)
+        for char in token:
+            child = node.children[char]
+            child.tokens.discard(token)
+            if not child.tokens:
+                del node.children[char]  # Nothing else below: drop the branch
+                break
+            node = child
+        del self.trigram_counts[token]
+        for gram in trigrams(token):
+            tokens = self.trigram_tokens[gram]
+            tokens.discard(token)
+            if not tokens:
+                del self.trigram_tokens[gram]
+
+    # Queries
+
+    def _prefixed(self, prefix: str) -> Set[str]:
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.tokens
+
+    def _similar(self, token: str) -> Dict[str, float]:
+        grams = trigrams(token)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self.trigram_tokens.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        similar = {}
+        for candidate, n in shared.items():
+            similarity = 2 * n / (len(grams) + self.trigram_counts[candidate])
+            if similarity >= MIN_SIMILARITY:
+                similar[candidate] = similarity
+        return similar
+
+    def _token_matches(self, query_token: str) -> Dict[str, float]:
+        """Indexed tokens matching one query token, with their match score"""
+        low, high = PREFIX_SCORE
+        matches = {token: low + (high - low) * len(query_token) / len(token)
+                   for token in self._prefixed(query_token)}
+        if query_token in self.postings:
+            matches[query_token] = EXACT_SCORE
+        if len(query_token) >= MIN_FUZZY_LENGTH:
+            for token, similarity in self._similar(query_token).items():
+                matches[token] = max(matches.get(token, 0.0), FUZZY_SCORE * similarity)
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        scores: Optional[Dict[str, float]] = None
+        for query_token in dict.fromkeys(tokenize(query)):
+            best: Dict[str, float] = {}
+            for token, score in self._token_matches(query_token).items():
+                for item_id, weight in self.postings[token].items():
+                    if score * weight > best.get(item_id, 0.0):
+                        best[item_id] = score * weight
+            # Every query token has to match
+            scores = best if scores is None else {i: s + best[i] for i, s in scores.items() if i in best}
+            if not scores:
+                return []
+        if not scores or limit <= 0:
+            return []
+        # Only hits scoring at least the limit-th best need ordering (ties go to shorter names)
+        cutoff = heapq.nlargest(limit, scores.values())[-1]
+        top = heapq.nsmallest(limit, [(-score, self.sort_keys[item_id], item_id)
+                                      for item_id, score in scores.items() if score >= cutoff])
+        return [{**self.items[item_id], "score": round(-score, 3)} for score, _, item_id in top]
+
+    def summary(self) -> dict:
+        return {"items": len(self.items), "tokens": len(self.postings), "trigrams": len(self.trigram_tokens)}
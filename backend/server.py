@@ -1,46 +1,125 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Body
+# First, so the import time it records covers everything below
+import startup_timing
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Depends, Header, Query
+from fastapi.encoders import jsonable_encoder
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import Response
 import os
+import asyncio
+import json
 import logging
 import math
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field
 from typing import List, Optional, Dict, Any
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+import costing
+import order_optimizer
+import ordering
+import valuation
+from anomalies import AnomalyDetector
+import anomalies
+import catalog_view
+import item_history
+import migrations
+from report_cache import ReportCache
+import storage
+import metrics
+import sync_ops
+import snapshots
+import archive
+import connection
+import response_encoding
+from response_encoding import NegotiatedResponse
+from count_buffer import CountBuffer
+from query_monitor import QueryMonitor
+from scheduler import Scheduler
+from search_index import SearchIndex
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Import, startup and first-request timings, at /api/debug/startup
+startup_timer = startup_timing.StartupTimer()
+
+# Per-route latency and database usage, exported at /metrics
+metrics_registry = metrics.MetricsRegistry()
+
+# Slow query log and N+1 detection, summarized at /api/debug/queries
+query_monitor = QueryMonitor(
+    slow_ms=float(os.environ.get('SLOW_QUERY_MS', '100')),
+    n_plus_one_threshold=int(os.environ.get('N_PLUS_ONE_THRESHOLD', '10')),
+)
+
+# Connections in use and checkout waits, at /api/debug/pool
+pool_stats = connection.PoolStats()
+
+# Database connection (MongoDB, or the embedded store with STORAGE_BACKEND=memory)
+client, db = storage.connect(
+    os.environ, event_listeners=[metrics.CommandMetrics(metrics_registry), query_monitor, pool_stats]
+)
+
+# Background jobs (archival, nightly recomputes, cache warming), listed at /api/jobs
+job_scheduler = Scheduler(db, tz=os.environ.get('SCHEDULER_TIMEZONE', 'UTC'))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await on_startup()
+    yield
+    await on_shutdown()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Every document belongs to a venue; clients that don't send X-Venue-Id
+# (e.g. the current frontend) work on the default venue
+DEFAULT_VENUE_ID = os.environ.get('DEFAULT_VENUE_ID', 'main')
+
+async def get_venue_id(x_venue_id: Optional[str] = Header(None)) -> str:
+    return x_venue_id or DEFAULT_VENUE_ID
+
 # Define Models
+class SupplierOffer(BaseModel):
+    supplier: str
+    cost_per_unit: float = 0.0
+    cost_per_case: float = 0.0
+    units_per_case: Optional[int] = None  # Defaults to the item's units_per_case
+    case_only: bool = False
+
+class SupplierTerms(BaseModel):
+    venue_id: str = DEFAULT_VENUE_ID
+    name: str
+    min_order_total: float = 0.0  # Minimum order value in baht
+    case_only: bool = False  # Supplier only sells whole cases
+
 class Item(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    venue_id: str = DEFAULT_VENUE_ID
     name: str
     category: str  # A, B, M, O, Z
     category_name: str  # Thai Alcohol, Beer, Mixers, Bar Supplies, Hostel Supplies
     sub_category: Optional[str] = None  # For grouping like "Tequila", "Vodka", "Rum"
     units_per_case: int = 1
     target_stock: int = 0  # Simplified: just one target level
-    sort_order: int = 0  # For custom ordering
+    sort_order: float = 0  # For custom ordering (fractional keys, see ordering.py)
     primary_supplier: str
     cost_per_unit: float = 0.0
     cost_per_case: float = 0.0
     bought_by_case: bool = False  # Whether this item is commonly bought by case
     sale_price: Optional[float] = None
+    supplier_offers: List[SupplierOffer] = []  # Other suppliers carrying this item
+    version: int = 0  # Incremented on every write (0 = written before versioning)
 
 # Recipe models
 class RecipeIngredient(BaseModel):
@@ -55,6 +134,7 @@ class RecipeFixedCost(BaseModel):
 
 class Recipe(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    venue_id: str = DEFAULT_VENUE_ID
     name: str
     sale_price: float = 0.0
     ingredients: List[RecipeIngredient] = []
@@ -73,15 +153,29 @@ class ItemCreate(BaseModel):
     sub_category: Optional[str] = None  # For grouping like "Tequila", "Vodka", "Rum"
     units_per_case: int = 1
     target_stock: int = 0  # Simplified: just one target level
-    sort_order: int = 0  # For custom ordering
+    sort_order: float = 0  # For custom ordering (fractional keys, see ordering.py)
     primary_supplier: str
     cost_per_unit: float = 0.0
     cost_per_case: float = 0.0
     bought_by_case: bool = False  # Whether this item is commonly bought by case
     sale_price: Optional[float] = None
+    supplier_offers: List[SupplierOffer] = []
+    version: Optional[int] = None  # On update: the version this edit was based on
+
+class ReorderGroup(BaseModel):
+    category_name: str
+    sub_category: Optional[str] = None
+
+class ReorderRequest(BaseModel):
+    """Move an item, or a whole sub-category, between two items (ids; either end may be open)"""
+    item_id: Optional[str] = None
+    group: Optional[ReorderGroup] = None
+    before: Optional[str] = None  # Item that should come just before the moved ones
+    after: Optional[str] = None  # Item that should come just after them
 
 class StockCount(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    venue_id: str = DEFAULT_VENUE_ID
     item_id: str
     main_bar: int = 0
     beer_bar: int = 0
@@ -90,6 +184,12 @@ class StockCount(BaseModel):
     total_count: int = 0
     count_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     counted_by: str = "Staff"
+    # When each location was last written, so offline edits that arrive late don't overwrite newer ones
+    location_updated_at: Dict[str, datetime] = {}
+    version: int = 0  # Incremented on every write (0 = no count yet)
+
+class StockCountResult(StockCount):
+    anomaly: Optional[Dict[str, Any]] = None  # Set when the count looks like a miscount
 
 class StockCountCreate(BaseModel):
     item_id: str
@@ -104,6 +204,7 @@ class StockCountUpdate(BaseModel):
     beer_bar: Optional[int] = None
     lobby: Optional[int] = None
     storage_room: Optional[int] = None
+    version: Optional[int] = None  # The version this edit was based on
 
 # New models for case/single input support
 class LocationStockInput(BaseModel):
@@ -117,6 +218,32 @@ class StockCountInputs(BaseModel):
     storage_room: LocationStockInput = Field(default_factory=LocationStockInput)
     counted_by: str = "Staff"
 
+# Offline op-log models
+class SyncOp(BaseModel):
+    op_id: str  # Generated on the device; retries reuse it
+    type: str  # count_set, case_count_set or order_qty_set
+    item_id: str
+    location: Optional[str] = None  # count ops only
+    value: Optional[int] = None  # units for count_set, quantity for order_qty_set
+    cases: int = 0  # case_count_set only
+    singles: int = 0
+    device_ts: datetime  # When the edit was made on the device
+
+class SyncBatch(BaseModel):
+    device_id: Optional[str] = None
+    ops: List[SyncOp]
+
+class SyncOpResult(BaseModel):
+    op_id: str
+    status: str  # applied, duplicate, stale or rejected
+    error: Optional[str] = None
+
+class SyncResult(BaseModel):
+    results: List[SyncOpResult]
+    summary: Dict[str, int]
+    counts: List[StockCountResult]
+    order_quantities: Dict[str, int]
+
 class CaseCalculation(BaseModel):
     total_units: int
     cases_needed: int
@@ -139,6 +266,7 @@ class ShoppingListItem(BaseModel):
 
 class StockSession(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    venue_id: str = DEFAULT_VENUE_ID
     session_name: str
     session_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     is_active: bool = True
@@ -153,6 +281,7 @@ class StockSessionCreate(BaseModel):
 # Enhanced models for order confirmation and purchase tracking
 class ShoppingListOrder(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    venue_id: str = DEFAULT_VENUE_ID
     supplier: str
     order_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     status: str = "pending"  # pending, ordered, received, confirmed
@@ -166,8 +295,9 @@ class ShoppingListOrderCreate(BaseModel):
 
 class PurchaseEntry(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    venue_id: str = DEFAULT_VENUE_ID
     order_id: Optional[str] = None  # link to shopping list order
-    session_id: str
+    session_id: Optional[str] = None  # None for deliveries confirmed while no session was open
     item_id: str
     planned_quantity: int  # from shopping list
     actual_quantity: int  # what was actually bought
@@ -190,6 +320,29 @@ class PurchaseEntryCreate(BaseModel):
     delivery_received: bool = False
     notes: Optional[str] = None
 
+class ConfirmedOrderLine(BaseModel):
+    # The app sends the catalog item itself, so ``id`` is the item's id
+    id: str = Field(validation_alias=AliasChoices('id', 'item_id'))
+    name: Optional[str] = None
+    units_per_case: int = 1
+    cost_per_unit: float = 0.0
+    isCase: bool = False
+    orderQty: int = 0  # planned, in cases when isCase
+    actualQty: int = 0  # received, in cases when isCase
+    actualCost: Optional[float] = None  # for the whole line
+
+class ConfirmedOrderCreate(BaseModel):
+    id: str  # generated by the client, so a retried request can be recognised
+    supplier: str
+    status: str = "completed"
+    completed_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    session_id: Optional[str] = None  # defaults to the open session
+    items: List[ConfirmedOrderLine]
+    notes: Optional[str] = None
+
+class ConfirmedOrder(ConfirmedOrderCreate):
+    venue_id: str = DEFAULT_VENUE_ID
+
 class SessionComparison(BaseModel):
     session1_id: str
     session1_name: str
@@ -212,6 +365,143 @@ class UsageReport(BaseModel):
     total_usage_cost: float
     supplier: str
 
+REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', '256'))
+# Every Nth saved session is stored in full, the rest as changes since the
+# previous one (1 stores every session in full)
+SNAPSHOT_KEYFRAME_INTERVAL = max(1, int(os.environ.get('SNAPSHOT_KEYFRAME_INTERVAL', '8')))
+SNAPSHOT_CACHE_SIZE = int(os.environ.get('SNAPSHOT_CACHE_SIZE', '8'))
+CATALOG_VIEW_CACHE_SIZE = int(os.environ.get('CATALOG_VIEW_CACHE_SIZE', '16'))
+
+class VenueState:
+    """In-process caches for one venue, so each venue's hot paths only ever see its own data"""
+    def __init__(self, venue_id: str):
+        # Data versions: caches derived from items/counts are keyed on these
+        # and rebuilt only after a write that changes their inputs
+        self.versions = {"catalog": 0, "counts": 0, "suppliers": 0, "ordering": 0}
+        # Cost and category per item for valuation deltas on count writes
+        self.item_value_info = {"version": None, "map": {}}
+        # Cheapest order plan, keyed on catalog/counts/suppliers versions
+        self.optimized_orders = {"key": None, "result": None}
+        # Reports over saved sessions, keyed on session ids + catalog version
+        self.report_cache = ReportCache(maxsize=REPORT_CACHE_SIZE)
+        # Decoded keyframe sessions, so reading a delta session only fetches its deltas
+        self.keyframes = ReportCache(maxsize=SNAPSHOT_CACHE_SIZE)
+        # Rolling usage model per item, checked on every count write
+        self.anomaly_detector = AnomalyDetector(venue_id)
+        # Typeahead over the catalog, updated in place by single-item writes
+        self.search_index = SearchIndex()
+        # Grouped and sorted catalog views, keyed on the query + catalog/ordering(/counts) versions
+        self.catalog_views = ReportCache(maxsize=CATALOG_VIEW_CACHE_SIZE)
+
+venue_states: Dict[str, VenueState] = {}
+
+def venue_state(venue_id: str) -> VenueState:
+    state = venue_states.get(venue_id)
+    if state is None:
+        state = venue_states[venue_id] = VenueState(venue_id)
+    return state
+
+def bump_version(venue_id: str, *names):
+    versions = venue_state(venue_id).versions
+    for name in names:
+        versions[name] += 1
+
+async def get_item_value_map(venue_id: str) -> dict:
+    state = venue_state(venue_id)
+    version = state.versions["catalog"]
+    if state.item_value_info["version"] != version:
+        items = await db.items.find(
+            {"venue_id": venue_id}, {"_id": 0, "id": 1, "cost_per_unit": 1, "category_name": 1}
+        ).to_list(None)
+        state.item_value_info["map"] = {i['id']: (i.get('cost_per_unit', 0.0), i.get('category_name')) for i in items}
+        state.item_value_info["version"] = version
+    return state.item_value_info["map"]
+
+async def get_search_index(venue_id: str) -> SearchIndex:
+    state = venue_state(venue_id)
+    version = state.versions["catalog"]
+    if state.search_index.version != version:
+        items = await db.items.find(
+            {"venue_id": venue_id},
+            {"_id": 0, "id": 1, "name": 1, "sub_category": 1, "category_name": 1, "primary_supplier": 1},
+        ).to_list(None)
+        state.search_index.build(items, version)
+    return state.search_index
+
+def sync_search_index(venue_id: str, item: Optional[dict] = None, removed_id: Optional[str] = None):
+    """Apply an item write to the search index (call right after bumping the catalog version).
+
+    An index that was already behind is left alone; the next search rebuilds it.
+    """
+    state = venue_state(venue_id)
+    index = state.search_index
+    if index.version != state.versions["catalog"] - 1:
+        return
+    if item is not None:
+        index.add(item)
+    if removed_id is not None:
+        index.remove(removed_id)
+    index.version = state.versions["catalog"]
+
+async def get_item_value_info(venue_id: str, item_id: str):
+    return (await get_item_value_map(venue_id)).get(item_id, (0.0, None))
+
+async def apply_count_valuation(venue_id: str, item_id: str, old_count: Optional[dict], new_count: Optional[dict]):
+    unit_cost, category = await get_item_value_info(venue_id, item_id)
+    await valuation.apply_deltas(db, venue_id, valuation.count_value_deltas(old_count, new_count, unit_cost, category))
+
+async def apply_count_valuations(venue_id: str, changes: list):
+    """Valuation update for several ``(item_id, old_count, new_count)`` changes at once"""
+    values = await get_item_value_map(venue_id)
+    deltas: Dict[tuple, float] = {}
+    for item_id, old_count, new_count in changes:
+        unit_cost, category = values.get(item_id, (0.0, None))
+        for key, value in valuation.count_value_deltas(old_count, new_count, unit_cost, category).items():
+            deltas[key] = deltas.get(key, 0.0) + value
+    await valuation.apply_deltas(db, venue_id, deltas)
+
+# Edits to existing counts are merged in memory and written every
+# COUNT_BUFFER_MS (0 writes each edit straight through). Handlers that read
+# counts from the database, or write them another way, flush the venue first.
+count_buffer = CountBuffer(
+    db,
+    window=float(os.environ.get('COUNT_BUFFER_MS', '1500')) / 1000,
+    max_pending=int(os.environ.get('COUNT_BUFFER_MAX_PENDING', '500')),
+    on_flushed=apply_count_valuations,
+)
+
+# Optimistic concurrency: every item and count write increments `version`.
+# A writer that names the version it read (If-Match header or `version` in the
+# body) gets a 409 with the current document instead of overwriting a newer edit.
+COUNT_WRITE_RETRIES = 3
+
+def expected_version(if_match: Optional[str], body_version: Optional[int]) -> Optional[int]:
+    if if_match:
+        tag = if_match.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == "*":
+            return None
+        try:
+            return int(tag)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="If-Match must be a document version")
+    return body_version
+
+def version_filter(version: int) -> dict:
+    # Documents written before versioning have no version field
+    return {"version": version} if version else {"version": {"$in": [0, None]}}
+
+def version_conflict(kind: str, current: BaseModel) -> HTTPException:
+    return HTTPException(status_code=409, detail={
+        "message": f"{kind} was changed by someone else",
+        "current": jsonable_encoder(current),
+    })
+
+def set_etag(response: Response, version: int):
+    response.headers["ETag"] = f'"{version}"'
+
 # Helper function to calculate cases
 def calculate_cases(units_needed: int, units_per_case: int) -> CaseCalculation:
     if units_per_case <= 1:
@@ -259,7 +549,7 @@ def parse_from_mongo(item):
 
 # Items endpoints
 @api_router.post("/items", response_model=Item)
-async def create_item(item: ItemCreate):
+async def create_item(item: ItemCreate, venue_id: str = Depends(get_venue_id)):
     item_dict = item.dict()
     # Calculate costs bidirectionally
     if item_dict['cost_per_case'] == 0 and item_dict['cost_per_unit'] > 0:
@@ -271,36 +561,154 @@ async def create_item(item: ItemCreate):
         if item_dict.get(f):
             item_dict[f] = round(item_dict[f], 1)
     
-    item_obj = Item(**item_dict)
+    item_dict.pop('version')
+    item_obj = Item(**item_dict, venue_id=venue_id, version=1)
     result = await db.items.insert_one(prepare_for_mongo(item_obj.dict()))
+    await costing.record_price(db, venue_id, item_obj.id, item_obj.cost_per_unit, item_obj.cost_per_case, "item_create")
+    bump_version(venue_id, "catalog")
+    sync_search_index(venue_id, item=item_obj.dict())
     return item_obj
 
-@api_router.get("/items", response_model=List[Item])
-async def get_items():
-    items = await db.items.find().to_list(1000)
+@api_router.get("/items", response_model=List[Item], response_class=NegotiatedResponse)
+async def get_items(venue_id: str = Depends(get_venue_id)):
+    # Served in display order off the (venue_id, sort_order) index
+    items = await db.items.find({"venue_id": venue_id}).sort([("sort_order", 1), ("name", 1)]).to_list(1000)
     return [Item(**parse_from_mongo(item)) for item in items]
 
 # Batch update sort order (must be before /items/{item_id} routes)
 @api_router.put("/items/batch-sort-order")
-async def batch_update_sort_order(request: Request):
+async def batch_update_sort_order(request: Request, venue_id: str = Depends(get_venue_id)):
     updates = await request.json()
     for update in updates:
         await db.items.update_one(
-            {"id": update["id"]},
-            {"$set": {"sort_order": update["sort_order"]}}
+            {"venue_id": venue_id, "id": update["id"]},
+            {"$set": {"sort_order": update["sort_order"]}, "$inc": {"version": 1}}
         )
+    bump_version(venue_id, "ordering")
     return {"message": f"Updated {len(updates)} items"}
 
+ORDERING_FIELDS = {"_id": 0, "id": 1, "sort_order": 1, "category_name": 1, "sub_category": 1, "name": 1}
+
+def display_order(item: dict) -> tuple:
+    """The order the app lists items in: by key, keeping sub-categories together on ties"""
+    return (item.get('sort_order') or 0, item.get('category_name') or "", item.get('sub_category') or "", item.get('name') or "")
+
+async def rebalance_sort_order(venue_id: str) -> None:
+    """Respace every key in the venue ``ordering.STEP`` apart, keeping the current order"""
+    items = await db.items.find({"venue_id": venue_id}, ORDERING_FIELDS).to_list(None)
+    items.sort(key=display_order)
+    writes = [UpdateOne({"venue_id": venue_id, "id": item['id']}, {"$set": {"sort_order": key}, "$inc": {"version": 1}})
+              for item, key in zip(items, ordering.spaced(len(items))) if item.get('sort_order') != key]
+    if writes:
+        await db.items.bulk_write(writes, ordered=False)
+
+@api_router.post("/items/reorder")
+async def reorder_items(move: ReorderRequest, venue_id: str = Depends(get_venue_id)):
+    """Move an item or sub-category between two items, rewriting only the moved items' keys"""
+    if (move.item_id is None) == (move.group is None):
+        raise HTTPException(status_code=400, detail="Give either item_id or group")
+    if move.before is None and move.after is None:
+        raise HTTPException(status_code=400, detail="Give the item to place it before or after")
+    if move.item_id is not None:
+        moved = await db.items.find({"venue_id": venue_id, "id": move.item_id}, ORDERING_FIELDS).to_list(None)
+    else:
+        in_category = await db.items.find(
+            {"venue_id": venue_id, "category_name": move.group.category_name}, ORDERING_FIELDS
+        ).to_list(None)
+        moved = [i for i in in_category if (i.get('sub_category') or None) == (move.group.sub_category or None)]
+    if not moved:
+        raise HTTPException(status_code=404, detail="Item not found" if move.item_id else "Group not found")
+    moved.sort(key=display_order)
+    moved_ids = {item['id'] for item in moved}
+    if {move.before, move.after} & moved_ids:
+        raise HTTPException(status_code=400, detail="Can't place items next to themselves")
+
+    async def neighbour(item_id: Optional[str]) -> Optional[dict]:
+        if item_id is None:
+            return None
+        item = await db.items.find_one({"venue_id": venue_id, "id": item_id}, ORDERING_FIELDS)
+        if not item:
+            raise HTTPException(status_code=404, detail=f"Item {item_id} not found")
+        return item
+
+    def key_of(item: Optional[dict]) -> Optional[float]:
+        return None if item is None else item.get('sort_order') or 0
+
+    before, after = await neighbour(move.before), await neighbour(move.after)
+    if before and after and display_order(before) > display_order(after):
+        raise HTTPException(status_code=400, detail="before has to come ahead of after")
+    keys = ordering.keys_between(key_of(before), key_of(after), len(moved))
+    rebalanced = keys is None
+    if rebalanced:
+        # The gap ran out (or the neighbours shared a key): respace the venue and try again
+        await rebalance_sort_order(venue_id)
+        before, after = await neighbour(move.before), await neighbour(move.after)
+        keys = ordering.keys_between(key_of(before), key_of(after), len(moved))
+        if keys is None:
+            raise HTTPException(status_code=400, detail="before has to come ahead of after")
+
+    await db.items.bulk_write([
+        UpdateOne({"venue_id": venue_id, "id": item['id']}, {"$set": {"sort_order": key}, "$inc": {"version": 1}})
+        for item, key in zip(moved, keys)
+    ], ordered=False)
+    bump_version(venue_id, "ordering")
+    return {"items": [{"id": item['id'], "sort_order": key} for item, key in zip(moved, keys)], "rebalanced": rebalanced}
+
+@api_router.get("/items/search", response_class=NegotiatedResponse)
+async def search_items(response: Response, q: str = "", limit: int = 20, venue_id: str = Depends(get_venue_id)):
+    """Items matching a partly typed or misspelt query, best first"""
+    index = await get_search_index(venue_id)
+    started = time.perf_counter()
+    hits = index.search(q, max(1, min(limit, 100)))
+    response.headers["Server-Timing"] = f"search;dur={(time.perf_counter() - started) * 1000:.3f}"
+    return hits
+
+@api_router.get("/items/view", response_class=NegotiatedResponse)
+async def get_items_view(group: str = "category,sub_category", sort: str = "sort_order", counts: bool = False,
+                         venue_id: str = Depends(get_venue_id)):
+    """The catalog grouped and sorted as the app lists it, optionally with current stock and need per item.
+
+    ``group`` nests by any of category, sub_category, supplier (empty: a flat
+    list); ``sort`` is an item column or, with stock, have/target/need/suggested/value,
+    prefixed with ``-`` for descending. Sorting by a stock column joins the counts.
+    """
+    try:
+        fields = catalog_view.parse_group(group)
+        column, descending = catalog_view.parse_sort(sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    counts = counts or column in catalog_view.COUNT_COLUMNS
+    if counts:
+        await count_buffer.flush(venue_id)
+    state = venue_state(venue_id)
+    versions = (state.versions["catalog"], state.versions["ordering"], state.versions["counts"] if counts else None)
+    key = ("items-view", tuple(fields), column, descending, counts) + versions
+
+    async def build():
+        items = [Item(**item).dict() for item in await db.items.find({"venue_id": venue_id}, {"_id": 0}).to_list(None)]
+        stock = None
+        if counts:
+            rows = await db.stock_counts.find({"venue_id": venue_id}, {"_id": 0, "item_id": 1, "total_count": 1}).to_list(None)
+            stock = {row['item_id']: row.get('total_count', 0) for row in rows}
+        return catalog_view.build_view(items, stock, fields, (column, descending))
+
+    # Already plain JSON types: skip FastAPI's per-request re-encoding of the whole view
+    return NegotiatedResponse(await state.catalog_views.get_or_build(key, build))
+
 @api_router.get("/items/{item_id}", response_model=Item)
-async def get_item(item_id: str):
-    item = await db.items.find_one({"id": item_id})
+async def get_item(item_id: str, response: Response, venue_id: str = Depends(get_venue_id)):
+    item = await db.items.find_one({"venue_id": venue_id, "id": item_id})
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    return Item(**parse_from_mongo(item))
+    item = Item(**parse_from_mongo(item))
+    set_etag(response, item.version)
+    return item
 
 @api_router.put("/items/{item_id}", response_model=Item)
-async def update_item(item_id: str, item_update: ItemCreate):
+async def update_item(item_id: str, item_update: ItemCreate, response: Response,
+                      venue_id: str = Depends(get_venue_id), if_match: Optional[str] = Header(None)):
     update_dict = item_update.dict()
+    expected = expected_version(if_match, update_dict.pop('version'))
     # Calculate costs bidirectionally (rounded to 1 decimal)
     if update_dict['cost_per_case'] == 0 and update_dict['cost_per_unit'] > 0:
         update_dict['cost_per_case'] = round(update_dict['cost_per_unit'] * update_dict['units_per_case'], 1)
@@ -311,22 +719,71 @@ async def update_item(item_id: str, item_update: ItemCreate):
         if update_dict.get(f):
             update_dict[f] = round(update_dict[f], 1)
     
-    result = await db.items.update_one(
-        {"id": item_id}, 
-        {"$set": update_dict}
+    # One round trip: the conditional update hands back the document it replaced
+    query = {"venue_id": venue_id, "id": item_id}
+    if expected is not None:
+        query.update(version_filter(expected))
+    previous = await db.items.find_one_and_update(
+        query, {"$set": update_dict, "$inc": {"version": 1}}, return_document=ReturnDocument.BEFORE
     )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Item not found")
+    if not previous:
+        current = await db.items.find_one({"venue_id": venue_id, "id": item_id})
+        if not current:
+            raise HTTPException(status_code=404, detail="Item not found")
+        raise version_conflict("Item", Item(**parse_from_mongo(current)))
+    bump_version(venue_id, "catalog")
+    sync_search_index(venue_id, item={**previous, **update_dict})
+    
+    # Record a price history entry only when the cost actually changed
+    if (previous.get('cost_per_unit', 0.0) != update_dict['cost_per_unit']
+            or previous.get('cost_per_case', 0.0) != update_dict['cost_per_case']):
+        await costing.record_price(db, venue_id, item_id, update_dict['cost_per_unit'], update_dict['cost_per_case'], "item_update")
     
-    updated_item = await db.items.find_one({"id": item_id})
-    return Item(**parse_from_mongo(updated_item))
+    # Revalue counted stock when the unit cost or category moved
+    if (previous.get('cost_per_unit', 0.0) != update_dict['cost_per_unit']
+            or previous.get('category_name') != update_dict['category_name']):
+        await count_buffer.flush(venue_id)
+        count = await db.stock_counts.find_one({"venue_id": venue_id, "item_id": item_id})
+        await valuation.apply_deltas(db, venue_id, valuation.revalue_deltas(
+            count, previous.get('cost_per_unit', 0.0), update_dict['cost_per_unit'],
+            previous.get('category_name'), update_dict['category_name']
+        ))
+    
+    updated_item = Item(**{**parse_from_mongo(previous), **update_dict, "version": previous.get('version', 0) + 1})
+    set_etag(response, updated_item.version)
+    return updated_item
+
+@api_router.get("/items/{item_id}/price-history", response_class=NegotiatedResponse)
+async def get_item_price_history(item_id: str, limit: int = 100, venue_id: str = Depends(get_venue_id)):
+    """Price changes for an item, newest first"""
+    history = await db.price_history.find({"venue_id": venue_id, "item_id": item_id}, {"_id": 0}).sort("effective_date", -1).to_list(limit)
+    return history
+
+@api_router.get("/items/{item_id}/history", response_class=NegotiatedResponse)
+async def get_item_history(item_id: str, start: Optional[datetime] = Query(None, alias="from"),
+                           end: Optional[datetime] = Query(None, alias="to"), limit: int = 50,
+                           cursor: Optional[str] = None, venue_id: str = Depends(get_venue_id)):
+    """An item's saved counts and purchases, newest first, with usage between counts"""
+    before = None
+    if cursor:
+        try:
+            before = datetime.fromisoformat(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return await item_history.item_history(db, venue_id, item_id, start, end, before, max(1, min(limit, 200)))
 
 @api_router.delete("/items/{item_id}")
-async def delete_item(item_id: str):
-    # Also delete associated stock counts
-    await db.stock_counts.delete_many({"item_id": item_id})
+async def delete_item(item_id: str, venue_id: str = Depends(get_venue_id)):
+    # Also delete associated stock counts (and their value)
+    await count_buffer.flush(venue_id)
+    count = await db.stock_counts.find_one({"venue_id": venue_id, "item_id": item_id})
+    if count:
+        await apply_count_valuation(venue_id, item_id, count, None)
+    await db.stock_counts.delete_many({"venue_id": venue_id, "item_id": item_id})
     
-    result = await db.items.delete_one({"id": item_id})
+    result = await db.items.delete_one({"venue_id": venue_id, "id": item_id})
+    bump_version(venue_id, "catalog", "counts")
+    sync_search_index(venue_id, removed_id=item_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
     
@@ -334,109 +791,169 @@ async def delete_item(item_id: str):
 
 # Recipe endpoints
 @api_router.post("/recipes", response_model=Recipe)
-async def create_recipe(recipe: RecipeCreate):
-    recipe_obj = Recipe(**recipe.dict())
+async def create_recipe(recipe: RecipeCreate, venue_id: str = Depends(get_venue_id)):
+    recipe_obj = Recipe(**recipe.dict(), venue_id=venue_id)
     await db.recipes.insert_one(prepare_for_mongo(recipe_obj.dict()))
     return recipe_obj
 
-@api_router.get("/recipes", response_model=List[Recipe])
-async def get_recipes():
-    recipes = await db.recipes.find().to_list(1000)
+@api_router.get("/recipes", response_model=List[Recipe], response_class=NegotiatedResponse)
+async def get_recipes(venue_id: str = Depends(get_venue_id)):
+    recipes = await db.recipes.find({"venue_id": venue_id}).to_list(1000)
     return [Recipe(**parse_from_mongo(r)) for r in recipes]
 
 @api_router.put("/recipes/{recipe_id}", response_model=Recipe)
-async def update_recipe(recipe_id: str, recipe_update: RecipeCreate):
+async def update_recipe(recipe_id: str, recipe_update: RecipeCreate, venue_id: str = Depends(get_venue_id)):
     result = await db.recipes.update_one(
-        {"id": recipe_id},
+        {"venue_id": venue_id, "id": recipe_id},
         {"$set": recipe_update.dict()}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    updated = await db.recipes.find_one({"id": recipe_id})
+    updated = await db.recipes.find_one({"venue_id": venue_id, "id": recipe_id})
     return Recipe(**parse_from_mongo(updated))
 
 @api_router.delete("/recipes/{recipe_id}")
-async def delete_recipe(recipe_id: str):
-    result = await db.recipes.delete_one({"id": recipe_id})
+async def delete_recipe(recipe_id: str, venue_id: str = Depends(get_venue_id)):
+    result = await db.recipes.delete_one({"venue_id": venue_id, "id": recipe_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Recipe not found")
     return {"message": "Recipe deleted"}
 
 # Stock counting endpoints
-@api_router.post("/stock-counts", response_model=StockCount)
-async def create_stock_count(count: StockCountCreate):
+@api_router.post("/stock-counts", response_model=StockCountResult)
+async def create_stock_count(count: StockCountCreate, venue_id: str = Depends(get_venue_id)):
+    await count_buffer.flush(venue_id)
     count_dict = count.dict()
+    count_dict['venue_id'] = venue_id
     # Calculate total
     total = count_dict['main_bar'] + count_dict['beer_bar'] + count_dict['lobby'] + count_dict['storage_room']
     count_dict['total_count'] = total
+    now = datetime.now(timezone.utc)
+    count_dict['location_updated_at'] = {loc: now for loc in sync_ops.LOCATIONS}
     
     count_obj = StockCount(**count_dict)
     
     # Check if count exists for this item, if so update it
-    existing_count = await db.stock_counts.find_one({"item_id": count.item_id})
+    existing_count = await db.stock_counts.find_one({"venue_id": venue_id, "item_id": count.item_id})
     if existing_count:
         result = await db.stock_counts.update_one(
-            {"item_id": count.item_id},
-            {"$set": prepare_for_mongo(count_obj.dict())}
+            {"venue_id": venue_id, "item_id": count.item_id},
+            {"$set": prepare_for_mongo(count_obj.dict(exclude={'version'})), "$inc": {"version": 1}}
         )
+        count_obj.version = existing_count.get('version', 0) + 1
     else:
+        count_obj.version = 1
         result = await db.stock_counts.insert_one(prepare_for_mongo(count_obj.dict()))
+    bump_version(venue_id, "counts")
+    await apply_count_valuation(venue_id, count.item_id, existing_count, count_dict)
+    anomaly = await venue_state(venue_id).anomaly_detector.check(db, count_dict)
     
-    return count_obj
+    return StockCountResult(**count_obj.dict(), anomaly=anomaly)
 
-@api_router.get("/stock-counts", response_model=List[StockCount])
-async def get_stock_counts():
-    counts = await db.stock_counts.find().to_list(1000)
+@api_router.get("/stock-counts", response_model=List[StockCount], response_class=NegotiatedResponse)
+async def get_stock_counts(venue_id: str = Depends(get_venue_id)):
+    await count_buffer.flush(venue_id)
+    counts = await db.stock_counts.find({"venue_id": venue_id}).to_list(1000)
     return [StockCount(**parse_from_mongo(count)) for count in counts]
 
 @api_router.get("/stock-counts/{item_id}", response_model=StockCount)
-async def get_stock_count(item_id: str):
-    count = await db.stock_counts.find_one({"item_id": item_id})
+async def get_stock_count(item_id: str, response: Response, venue_id: str = Depends(get_venue_id)):
+    count = (count_buffer.get(venue_id, item_id)
+             or await db.stock_counts.find_one({"venue_id": venue_id, "item_id": item_id}))
     if not count:
         # Return empty count for item
-        return StockCount(item_id=item_id)
-    return StockCount(**parse_from_mongo(count))
-
-@api_router.put("/stock-counts/{item_id}", response_model=StockCount)
-async def update_stock_count(item_id: str, count_update: StockCountUpdate):
-    existing_count = await db.stock_counts.find_one({"item_id": item_id})
-    
-    if existing_count:
-        # Update only provided fields
-        update_data = existing_count.copy()
-        for field, value in count_update.dict().items():
-            if value is not None:
-                update_data[field] = value
-        
-        # Recalculate total
-        update_data['total_count'] = update_data['main_bar'] + update_data['beer_bar'] + update_data['lobby'] + update_data['storage_room']
-        update_data['count_date'] = datetime.now(timezone.utc)
-        
-        result = await db.stock_counts.update_one(
-            {"item_id": item_id},
-            {"$set": prepare_for_mongo(update_data)}
-        )
-        return StockCount(**parse_from_mongo(update_data))
+        count = StockCount(item_id=item_id, venue_id=venue_id)
     else:
-        # Create new count
-        count_dict = {"item_id": item_id}
-        for field, value in count_update.dict().items():
-            if value is not None:
-                count_dict[field] = value
-            else:
-                count_dict[field] = 0
-                
-        count_dict['total_count'] = count_dict['main_bar'] + count_dict['beer_bar'] + count_dict['lobby'] + count_dict['storage_room']
+        count = StockCount(**parse_from_mongo(count))
+    set_etag(response, count.version)
+    return count
+
+@api_router.put("/stock-counts/{item_id}", response_model=StockCountResult)
+async def update_stock_count(item_id: str, count_update: StockCountUpdate, response: Response,
+                             venue_id: str = Depends(get_venue_id), if_match: Optional[str] = Header(None)):
+    expected = expected_version(if_match, count_update.version)
+    fields = count_update.dict(exclude={'version'})
+    # Read-modify-write guarded by the version that was read: if another write
+    # lands in between, the update misses and is redone against the new state,
+    # or reported as a conflict when the caller named the version it edited
+    for attempt in range(COUNT_WRITE_RETRIES):
+        existing_count = (count_buffer.get(venue_id, item_id)
+                          or await db.stock_counts.find_one({"venue_id": venue_id, "item_id": item_id}))
+        # An edit may have been buffered while the database was read
+        existing_count = count_buffer.get(venue_id, item_id) or existing_count
+        current_version = existing_count.get('version', 0) if existing_count else 0
+        if expected is not None and expected != current_version:
+            current = (StockCount(**parse_from_mongo(existing_count)) if existing_count
+                       else StockCount(item_id=item_id, venue_id=venue_id))
+            raise version_conflict("Stock count", current)
+        now = datetime.now(timezone.utc)
         
-        count_obj = StockCount(**count_dict)
-        await db.stock_counts.insert_one(prepare_for_mongo(count_obj.dict()))
-        return count_obj
+        if existing_count and count_buffer.enabled:
+            # Merged into the buffered count; written with the next flush
+            changes = {field: value for field, value in fields.items() if value is not None}
+            update_data = count_buffer.stage(venue_id, item_id, parse_from_mongo(existing_count), changes, now)
+            bump_version(venue_id, "counts")
+            anomaly = await venue_state(venue_id).anomaly_detector.check(db, update_data)
+            set_etag(response, update_data['version'])
+            return StockCountResult(**update_data, anomaly=anomaly)
+        elif existing_count:
+            # Update only provided fields
+            update_data = existing_count.copy()
+            update_data.pop('version', None)
+            update_data['location_updated_at'] = dict(existing_count.get('location_updated_at') or {})
+            for field, value in fields.items():
+                if value is not None:
+                    update_data[field] = value
+                    update_data['location_updated_at'][field] = now
+            
+            # Recalculate total
+            update_data['total_count'] = update_data['main_bar'] + update_data['beer_bar'] + update_data['lobby'] + update_data['storage_room']
+            update_data['count_date'] = now
+            
+            result = await db.stock_counts.update_one(
+                {"venue_id": venue_id, "item_id": item_id, **version_filter(current_version)},
+                {"$set": prepare_for_mongo(update_data), "$inc": {"version": 1}}
+            )
+            if result.matched_count == 0:
+                continue
+            update_data['version'] = current_version + 1
+            bump_version(venue_id, "counts")
+            await apply_count_valuation(venue_id, item_id, existing_count, update_data)
+            anomaly = await venue_state(venue_id).anomaly_detector.check(db, update_data)
+            set_etag(response, update_data['version'])
+            return StockCountResult(**parse_from_mongo(update_data), anomaly=anomaly)
+        else:
+            # Create new count
+            count_dict = {"item_id": item_id, "venue_id": venue_id, "location_updated_at": {}, "version": 1}
+            for field, value in fields.items():
+                if value is not None:
+                    count_dict[field] = value
+                    count_dict['location_updated_at'][field] = now
+                else:
+                    count_dict[field] = 0
+                    
+            count_dict['total_count'] = count_dict['main_bar'] + count_dict['beer_bar'] + count_dict['lobby'] + count_dict['storage_room']
+            
+            count_obj = StockCount(**count_dict)
+            try:
+                await db.stock_counts.insert_one(prepare_for_mongo(count_obj.dict()))
+            except DuplicateKeyError:
+                continue  # Created concurrently
+            bump_version(venue_id, "counts")
+            await apply_count_valuation(venue_id, item_id, None, count_dict)
+            anomaly = await venue_state(venue_id).anomaly_detector.check(db, count_dict)
+            set_etag(response, count_obj.version)
+            return StockCountResult(**count_obj.dict(), anomaly=anomaly)
+    
+    current = await db.stock_counts.find_one({"venue_id": venue_id, "item_id": item_id})
+    raise version_conflict("Stock count", StockCount(**parse_from_mongo(current)))
 
 # New endpoint for case/single input method
-@api_router.post("/stock-counts-enhanced/{item_id}", response_model=StockCount)
-async def create_enhanced_stock_count(item_id: str, stock_inputs: StockCountInputs):
+@api_router.post("/stock-counts-enhanced/{item_id}", response_model=StockCountResult)
+async def create_enhanced_stock_count(item_id: str, stock_inputs: StockCountInputs, venue_id: str = Depends(get_venue_id)):
+    await count_buffer.flush(venue_id)
     # Get item to check units per case
-    item = await db.items.find_one({"id": item_id})
+    item = await db.items.find_one({"venue_id": venue_id, "id": item_id})
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
@@ -449,37 +966,213 @@ async def create_enhanced_stock_count(item_id: str, stock_inputs: StockCountInpu
     storage_room_total = (stock_inputs.storage_room.cases * units_per_case) + stock_inputs.storage_room.singles
     
     total_count = main_bar_total + beer_bar_total + lobby_total + storage_room_total
+    now = datetime.now(timezone.utc)
     
     # Create or update stock count
     stock_count_data = {
         "item_id": item_id,
+        "venue_id": venue_id,
         "main_bar": main_bar_total,
         "beer_bar": beer_bar_total,
         "lobby": lobby_total,
         "storage_room": storage_room_total,
         "total_count": total_count,
         "counted_by": stock_inputs.counted_by,
-        "count_date": datetime.now(timezone.utc)
+        "count_date": now,
+        "location_updated_at": {loc: now for loc in sync_ops.LOCATIONS},
     }
     
     # Try to update existing, or create new
-    existing = await db.stock_counts.find_one({"item_id": item_id})
+    existing = await db.stock_counts.find_one({"venue_id": venue_id, "item_id": item_id})
     if existing:
-        await db.stock_counts.update_one({"item_id": item_id}, {"$set": stock_count_data})
+        await db.stock_counts.update_one(
+            {"venue_id": venue_id, "item_id": item_id}, {"$set": stock_count_data, "$inc": {"version": 1}}
+        )
     else:
-        stock_count = StockCount(**stock_count_data)
+        stock_count = StockCount(**stock_count_data, version=1)
         await db.stock_counts.insert_one(prepare_for_mongo(stock_count.dict()))
+    bump_version(venue_id, "counts")
+    await apply_count_valuation(venue_id, item_id, existing, stock_count_data)
+    anomaly = await venue_state(venue_id).anomaly_detector.check(db, stock_count_data)
     
-    updated_count = await db.stock_counts.find_one({"item_id": item_id})
-    return StockCount(**parse_from_mongo(updated_count))
+    updated_count = await db.stock_counts.find_one({"venue_id": venue_id, "item_id": item_id})
+    return StockCountResult(**parse_from_mongo(updated_count), anomaly=anomaly)
+
+# Offline op-log ingestion: a device flushes its queued edits in one request
+SYNC_MAX_OPS = int(os.environ.get('SYNC_MAX_OPS', '2000'))
+SYNC_OP_TTL_DAYS = int(os.environ.get('SYNC_OP_TTL_DAYS', '30'))
+
+async def write_sync_counts(venue_id: str, plan: dict, counts_by_item: Dict[str, dict], items_by_id: Dict[str, dict],
+                            now: datetime, written: Dict[str, dict], deltas: Dict[tuple, float]) -> set:
+    """Write the planned counts in one bulk write, each only if unchanged since it was read.
+
+    Only the locations the ops set are written, with their timestamps. Adds
+    what was written to ``written`` and its valuation changes to ``deltas``;
+    returns the item ids whose count changed in between.
+    """
+    item_ids = list(plan['counts'])
+    writes = []
+    for item_id in item_ids:
+        doc, read = plan['counts'][item_id], counts_by_item.get(item_id)
+        locations = plan['locations'][item_id]
+        fields = {loc: doc[loc] for loc in locations}
+        fields.update({f"location_updated_at.{loc}": doc['location_updated_at'][loc] for loc in locations})
+        fields.update(total_count=doc['total_count'], count_date=now)
+        doc.setdefault('id', str(uuid.uuid4()))
+        untouched = {loc: 0 for loc in sync_ops.LOCATIONS if loc not in locations}
+        writes.append(UpdateOne(
+            # A count created or changed since it was read makes this upsert collide instead of matching
+            {"venue_id": venue_id, "item_id": item_id, **version_filter(read.get('version', 0) if read else 0)},
+            {"$set": fields, "$inc": {"version": 1},
+             "$setOnInsert": {"id": doc['id'], "counted_by": "Staff", **untouched}},
+            upsert=True,
+        ))
+    if not writes:
+        return set()
+    missed = set()
+    try:
+        await db.stock_counts.bulk_write(writes, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(error['code'] != 11000 for error in errors):
+            raise
+        missed = {item_ids[error['index']] for error in errors}
+    for item_id in item_ids:
+        if item_id in missed:
+            continue
+        doc, read = plan['counts'][item_id], counts_by_item.get(item_id)
+        doc['version'] = (read.get('version', 0) if read else 0) + 1
+        written[item_id] = doc
+        item = items_by_id[item_id]
+        for key, value in valuation.count_value_deltas(
+            read, doc, item.get('cost_per_unit', 0.0), item.get('category_name')
+        ).items():
+            deltas[key] = deltas.get(key, 0.0) + value
+    return missed
+
+@api_router.post("/sync/ops", response_model=SyncResult)
+async def ingest_sync_ops(batch: SyncBatch, venue_id: str = Depends(get_venue_id)):
+    if len(batch.ops) > SYNC_MAX_OPS:
+        raise HTTPException(status_code=413, detail=f"At most {SYNC_MAX_OPS} ops per batch")
+    await count_buffer.flush(venue_id)
+    ops = [op.dict() for op in batch.ops]
+    op_ids = list({op['op_id'] for op in ops})
+    item_ids = list({op['item_id'] for op in ops})
+
+    applied = await db.applied_ops.find(
+        {"venue_id": venue_id, "op_id": {"$in": op_ids}}, {"_id": 0, "op_id": 1}
+    ).to_list(None)
+    items = await db.items.find(
+        {"venue_id": venue_id, "id": {"$in": item_ids}},
+        {"_id": 0, "id": 1, "units_per_case": 1, "cost_per_unit": 1, "category_name": 1}
+    ).to_list(None)
+    counts = await db.stock_counts.find({"venue_id": venue_id, "item_id": {"$in": item_ids}}).to_list(None)
+    quantities = await db.order_quantities.find(
+        {"venue_id": venue_id, "item_id": {"$in": item_ids}}, {"_id": 0}
+    ).to_list(None)
+
+    items_by_id = {i['id']: i for i in items}
+    counts_by_item = {c['item_id']: parse_from_mongo(c) for c in counts}
+    applied_op_ids = {a['op_id'] for a in applied}
+    plan = sync_ops.plan_ops(
+        ops, applied_op_ids, items_by_id, counts_by_item,
+        {q['item_id']: q for q in quantities},
+    )
+    results = plan['results']
+    records = {r['op_id']: r for r in plan['records']}
+    now = datetime.now(timezone.utc)
+
+    # Count writes are guarded by the version that was read; ops on counts
+    # another write changed in the meantime are planned again on the new state
+    written: Dict[str, dict] = {}
+    deltas: Dict[tuple, float] = {}
+    counts_plan = plan
+    for attempt in range(COUNT_WRITE_RETRIES):
+        missed = await write_sync_counts(venue_id, counts_plan, counts_by_item, items_by_id, now, written, deltas)
+        if not missed:
+            break
+        fresh = await db.stock_counts.find({"venue_id": venue_id, "item_id": {"$in": list(missed)}}).to_list(None)
+        counts_by_item.update({c['item_id']: parse_from_mongo(c) for c in fresh})
+        retried = [i for i, op in enumerate(ops) if op['item_id'] in missed and op['type'] != "order_qty_set"
+                   and results[i]['status'] in ("applied", "stale")]
+        counts_plan = sync_ops.plan_ops([ops[i] for i in retried], applied_op_ids, items_by_id, counts_by_item, {})
+        for i, result in zip(retried, counts_plan['results']):
+            results[i] = result
+        records.update({r['op_id']: r for r in counts_plan['records']})
+    if written:
+        bump_version(venue_id, "counts")
+        await valuation.apply_deltas(db, venue_id, deltas)
+    if missed:
+        raise HTTPException(status_code=409, detail="Stock counts kept changing during the sync; send the batch again")
+
+    if plan['order_quantities']:
+        await db.order_quantities.bulk_write([
+            UpdateOne(
+                {"venue_id": venue_id, "item_id": item_id},
+                {"$set": {"quantity": doc['quantity'], "updated_at": doc['updated_at']}},
+                upsert=True,
+            )
+            for item_id, doc in plan['order_quantities'].items()
+        ], ordered=False)
+
+    if records:
+        # $setOnInsert keeps the first outcome if two flushes of the same ops race
+        await db.applied_ops.bulk_write([
+            UpdateOne(
+                {"venue_id": venue_id, "op_id": r['op_id']},
+                {"$setOnInsert": {
+                    "venue_id": venue_id, "op_id": r['op_id'], "type": r['type'], "item_id": r['item_id'],
+                    "status": r['status'], "device_id": batch.device_id, "device_ts": r['device_ts'],
+                    "applied_at": now,
+                }},
+                upsert=True,
+            )
+            for r in records.values()
+        ], ordered=False)
+
+    detector = venue_state(venue_id).anomaly_detector
+    updated_counts = []
+    for item_id, doc in written.items():
+        doc.update(venue_id=venue_id, count_date=now)
+        anomaly = await detector.check(db, doc)
+        updated_counts.append(StockCountResult(**doc, anomaly=anomaly))
+
+    summary: Dict[str, int] = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return SyncResult(
+        results=results,
+        summary=summary,
+        counts=updated_counts,
+        order_quantities={item_id: doc['quantity'] for item_id, doc in plan['order_quantities'].items()},
+    )
+
+@api_router.get("/order-quantities")
+async def get_order_quantities(venue_id: str = Depends(get_venue_id)):
+    """Planned order quantities synced from counting devices, by item id"""
+    quantities = await db.order_quantities.find({"venue_id": venue_id}, {"_id": 0}).to_list(None)
+    return {q['item_id']: q['quantity'] for q in quantities}
+
+# Live stock valuation (running totals per location x category)
+@api_router.get("/valuation")
+async def get_valuation(venue_id: str = Depends(get_venue_id)):
+    await count_buffer.flush(venue_id)
+    return await valuation.get_valuation(db, venue_id)
+
+@api_router.post("/valuation/recompute")
+async def recompute_valuation(apply: bool = True, venue_id: str = Depends(get_venue_id)):
+    """Rebuild valuation totals from all counts and report drift from the running totals"""
+    await count_buffer.flush(venue_id)
+    return await valuation.recompute(db, venue_id, apply=apply)
 
 # Shopping list endpoint with case logic
 @api_router.get("/shopping-list")
-async def get_shopping_list():
+async def get_shopping_list(venue_id: str = Depends(get_venue_id)):
+    await count_buffer.flush(venue_id)
     # Get all items
-    items = await db.items.find().to_list(1000)
+    items = await db.items.find({"venue_id": venue_id}).to_list(1000)
     # Get all stock counts
-    counts = await db.stock_counts.find().to_list(1000)
+    counts = await db.stock_counts.find({"venue_id": venue_id}).to_list(1000)
     
     # Create a map of stock counts by item_id
     stock_map = {count['item_id']: count for count in counts}
@@ -494,7 +1187,7 @@ async def get_shopping_list():
             current_stock = stock_map[item_obj.id]['total_count']
         
         # Calculate need to buy
-        need_to_buy = max(0, item_obj.max_stock - current_stock)
+        need_to_buy = max(0, item_obj.target_stock - current_stock)
         
         if need_to_buy > 0:
             supplier = item_obj.primary_supplier
@@ -514,8 +1207,8 @@ async def get_shopping_list():
                 item_name=item_obj.name,
                 item_id=item_obj.id,
                 current_stock=current_stock,
-                min_stock=item_obj.min_stock,
-                max_stock=item_obj.max_stock,
+                min_stock=item_obj.target_stock,
+                max_stock=item_obj.target_stock,
                 need_to_buy_units=need_to_buy,
                 case_calculation=case_calc,
                 supplier=supplier,
@@ -528,10 +1221,50 @@ async def get_shopping_list():
     
     return shopping_list
 
+# Supplier terms used by the order optimizer
+@api_router.get("/suppliers", response_model=List[SupplierTerms], response_class=NegotiatedResponse)
+async def get_suppliers(venue_id: str = Depends(get_venue_id)):
+    suppliers = await db.suppliers.find({"venue_id": venue_id}, {"_id": 0}).to_list(1000)
+    return [SupplierTerms(**s) for s in suppliers]
+
+@api_router.put("/suppliers/{name}", response_model=SupplierTerms)
+async def update_supplier(name: str, terms: SupplierTerms, venue_id: str = Depends(get_venue_id)):
+    terms.name = name
+    terms.venue_id = venue_id
+    await db.suppliers.update_one({"venue_id": venue_id, "name": name}, {"$set": terms.dict()}, upsert=True)
+    bump_version(venue_id, "suppliers")
+    return terms
+
+# Cheapest mix of cases/singles across suppliers, cached until counts, prices or terms change
+@api_router.get("/shopping-list/optimized")
+async def get_optimized_shopping_list(venue_id: str = Depends(get_venue_id)):
+    await count_buffer.flush(venue_id)
+    state = venue_state(venue_id)
+    key = (state.versions["catalog"], state.versions["counts"], state.versions["suppliers"])
+    if state.optimized_orders["key"] == key:
+        return {**state.optimized_orders["result"], "cached": True}
+    
+    items = await db.items.find({"venue_id": venue_id}, {"_id": 0}).to_list(None)
+    counts = await db.stock_counts.find({"venue_id": venue_id}, {"_id": 0, "item_id": 1, "total_count": 1}).to_list(None)
+    suppliers = await db.suppliers.find({"venue_id": venue_id}, {"_id": 0}).to_list(None)
+    
+    stock_map = {count['item_id']: count.get('total_count', 0) for count in counts}
+    items_map = {item['id']: item for item in items}
+    needs = {
+        item['id']: max(0, item.get('target_stock', 0) - stock_map.get(item['id'], 0))
+        for item in items
+    }
+    result = order_optimizer.optimize_orders(needs, items_map, {s['name']: s for s in suppliers})
+    result["generated_at"] = datetime.now(timezone.utc)
+    
+    state.optimized_orders["key"] = key
+    state.optimized_orders["result"] = result
+    return {**result, "cached": False}
+
 # Plain text shopping list for messaging (especially Singha99)
 @api_router.get("/shopping-list-text/{supplier}")
-async def get_shopping_list_text(supplier: str):
-    shopping_data = await get_shopping_list()
+async def get_shopping_list_text(supplier: str, venue_id: str = Depends(get_venue_id)):
+    shopping_data = await get_shopping_list(venue_id)
     
     if supplier not in shopping_data:
         return {"text": f"No items needed from {supplier}"}
@@ -560,10 +1293,11 @@ async def get_shopping_list_text(supplier: str):
 
 # Quick restock check
 @api_router.get("/quick-restock")
-async def get_quick_restock():
+async def get_quick_restock(venue_id: str = Depends(get_venue_id)):
+    await count_buffer.flush(venue_id)
     # Get items that are below minimum stock
-    items = await db.items.find().to_list(1000)
-    counts = await db.stock_counts.find().to_list(1000)
+    items = await db.items.find({"venue_id": venue_id}).to_list(1000)
+    counts = await db.stock_counts.find({"venue_id": venue_id}).to_list(1000)
     
     stock_map = {count['item_id']: count for count in counts}
     
@@ -590,61 +1324,65 @@ async def get_quick_restock():
 
 # Stock Sessions for historical tracking
 @api_router.post("/stock-sessions", response_model=StockSession)
-async def create_stock_session(session: StockSessionCreate):
-    # Mark all other sessions as inactive
-    await db.stock_sessions.update_many({}, {"$set": {"is_active": False}})
+async def create_stock_session(session: StockSessionCreate, venue_id: str = Depends(get_venue_id)):
+    # Mark this venue's other sessions as inactive
+    await db.stock_sessions.update_many({"venue_id": venue_id, "is_active": True}, {"$set": {"is_active": False}})
     
-    session_obj = StockSession(**session.dict())
+    session_obj = StockSession(**session.dict(), venue_id=venue_id)
     await db.stock_sessions.insert_one(prepare_for_mongo(session_obj.dict()))
     return session_obj
 
-@api_router.get("/stock-sessions", response_model=List[StockSession])
-async def get_stock_sessions():
-    sessions = await db.stock_sessions.find().sort("session_date", -1).to_list(100)
+@api_router.get("/stock-sessions", response_model=List[StockSession], response_class=NegotiatedResponse)
+async def get_stock_sessions(venue_id: str = Depends(get_venue_id)):
+    sessions = await db.stock_sessions.find({"venue_id": venue_id}).sort("session_date", -1).to_list(100)
     return [StockSession(**parse_from_mongo(session)) for session in sessions]
 
-@api_router.get("/stock-sessions/{session_id}/counts")
-async def get_session_counts(session_id: str):
+@api_router.get("/stock-sessions/{session_id}/counts", response_class=NegotiatedResponse)
+async def get_session_counts(session_id: str, venue_id: str = Depends(get_venue_id)):
     """Get all stock counts saved for a specific session"""
-    counts = await db.historical_counts.find({"session_id": session_id}, {"_id": 0}).to_list(1000)
+    counts = await snapshots.session_counts(db, venue_id, session_id, venue_state(venue_id).keyframes)
+    if not counts:
+        session = await db.stock_sessions.find_one({"venue_id": venue_id, "id": session_id}, {"_id": 0, "archived_in": 1})
+        if session and session.get('archived_in'):
+            raise archived_session_error(session)
     return counts
 
 @api_router.get("/stock-sessions/current", response_model=Optional[StockSession])
-async def get_current_session():
-    session = await db.stock_sessions.find_one({"is_active": True})
+async def get_current_session(venue_id: str = Depends(get_venue_id)):
+    session = await db.stock_sessions.find_one({"venue_id": venue_id, "is_active": True})
     if session:
         return StockSession(**parse_from_mongo(session))
     return None
 
 # Order confirmation workflow endpoints
 @api_router.post("/shopping-orders", response_model=ShoppingListOrder)
-async def create_shopping_order(order: ShoppingListOrderCreate):
-    order_obj = ShoppingListOrder(**order.dict())
+async def create_shopping_order(order: ShoppingListOrderCreate, venue_id: str = Depends(get_venue_id)):
+    order_obj = ShoppingListOrder(**order.dict(), venue_id=venue_id)
     await db.shopping_orders.insert_one(prepare_for_mongo(order_obj.dict()))
     return order_obj
 
-@api_router.get("/shopping-orders", response_model=List[ShoppingListOrder])
-async def get_shopping_orders(status: Optional[str] = None):
-    filter_query = {"status": status} if status else {}
+@api_router.get("/shopping-orders", response_model=List[ShoppingListOrder], response_class=NegotiatedResponse)
+async def get_shopping_orders(status: Optional[str] = None, venue_id: str = Depends(get_venue_id)):
+    filter_query = {"venue_id": venue_id, "status": status} if status else {"venue_id": venue_id}
     orders = await db.shopping_orders.find(filter_query).sort("order_date", -1).to_list(100)
     return [ShoppingListOrder(**parse_from_mongo(order)) for order in orders]
 
 @api_router.put("/shopping-orders/{order_id}/status")
-async def update_order_status(order_id: str, status: str, notes: Optional[str] = None):
+async def update_order_status(order_id: str, status: str, notes: Optional[str] = None, venue_id: str = Depends(get_venue_id)):
     update_data = {"status": status}
     if notes:
         update_data["notes"] = notes
     
-    result = await db.shopping_orders.update_one({"id": order_id}, {"$set": update_data})
+    result = await db.shopping_orders.update_one({"venue_id": venue_id, "id": order_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Order not found")
     
     return {"message": f"Order status updated to {status}"}
 
 @api_router.post("/shopping-list/create-order/{supplier}")
-async def create_order_from_shopping_list(supplier: str, notes: Optional[str] = None):
+async def create_order_from_shopping_list(supplier: str, notes: Optional[str] = None, venue_id: str = Depends(get_venue_id)):
     # Get current shopping list
-    shopping_list_response = await get_shopping_list()
+    shopping_list_response = await get_shopping_list(venue_id)
     shopping_list = shopping_list_response
     
     if supplier not in shopping_list:
@@ -670,80 +1408,236 @@ async def create_order_from_shopping_list(supplier: str, notes: Optional[str] =
         notes=notes or f"Auto-generated from shopping list on {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M')}"
     )
     
-    return await create_shopping_order(order_data)
+    return await create_shopping_order(order_data, venue_id)
 
 # Enhanced purchase management endpoints
 @api_router.post("/purchases", response_model=PurchaseEntry)
-async def create_purchase_entry(purchase: PurchaseEntryCreate):
-    purchase_obj = PurchaseEntry(**purchase.dict())
+async def create_purchase_entry(purchase: PurchaseEntryCreate, venue_id: str = Depends(get_venue_id)):
+    purchase_obj = PurchaseEntry(**purchase.dict(), venue_id=venue_id)
     await db.purchases.insert_one(prepare_for_mongo(purchase_obj.dict()))
+    venue_state(venue_id).report_cache.invalidate_session(purchase_obj.session_id)
     return purchase_obj
 
-@api_router.get("/purchases/session/{session_id}", response_model=List[PurchaseEntry])
-async def get_session_purchases(session_id: str):
-    purchases = await db.purchases.find({"session_id": session_id}).to_list(1000)
+@api_router.get("/purchases/session/{session_id}", response_model=List[PurchaseEntry], response_class=NegotiatedResponse)
+async def get_session_purchases(session_id: str, venue_id: str = Depends(get_venue_id)):
+    purchases = await db.purchases.find({"venue_id": venue_id, "session_id": session_id}).to_list(1000)
     return [PurchaseEntry(**parse_from_mongo(purchase)) for purchase in purchases]
 
 @api_router.put("/purchases/{purchase_id}", response_model=PurchaseEntry)
-async def update_purchase_entry(purchase_id: str, purchase_update: PurchaseEntryCreate):
+async def update_purchase_entry(purchase_id: str, purchase_update: PurchaseEntryCreate, venue_id: str = Depends(get_venue_id)):
     update_dict = purchase_update.dict()
+    previous = await db.purchases.find_one({"venue_id": venue_id, "id": purchase_id}, {"_id": 0, "session_id": 1})
     result = await db.purchases.update_one(
-        {"id": purchase_id}, 
+        {"venue_id": venue_id, "id": purchase_id}, 
         {"$set": update_dict}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Purchase entry not found")
+    cache = venue_state(venue_id).report_cache
+    cache.invalidate_session(update_dict['session_id'])
+    if previous:
+        cache.invalidate_session(previous['session_id'])
     
-    updated_purchase = await db.purchases.find_one({"id": purchase_id})
+    updated_purchase = await db.purchases.find_one({"venue_id": venue_id, "id": purchase_id})
     return PurchaseEntry(**parse_from_mongo(updated_purchase))
 
 @api_router.delete("/purchases/{purchase_id}")
-async def delete_purchase_entry(purchase_id: str):
-    result = await db.purchases.delete_one({"id": purchase_id})
-    if result.deleted_count == 0:
+async def delete_purchase_entry(purchase_id: str, venue_id: str = Depends(get_venue_id)):
+    purchase = await db.purchases.find_one_and_delete({"venue_id": venue_id, "id": purchase_id})
+    if not purchase:
         raise HTTPException(status_code=404, detail="Purchase entry not found")
+    venue_state(venue_id).report_cache.invalidate_session(purchase['session_id'])
     return {"message": "Purchase entry deleted successfully"}
 
 # Bulk order confirmation endpoint
+# Where confirmed deliveries are added to the stock counts
+RECEIVING_LOCATION = os.environ.get('RECEIVING_LOCATION', 'storage_room')
+
+def order_receipts(order: ConfirmedOrder) -> List[dict]:
+    """Received units and their actual unit cost, per order line"""
+    receipts = []
+    for line in order.items:
+        if line.actualQty <= 0:
+            continue
+        units_per_case = line.units_per_case or 1
+        units = line.actualQty * units_per_case if line.isCase else line.actualQty
+        unit_cost = line.actualCost / units if line.actualCost is not None else line.cost_per_unit
+        receipts.append({
+            "item_id": line.id,
+            "qty": units,
+            "planned_qty": line.orderQty * units_per_case if line.isCase else line.orderQty,
+            "unit_cost": round(unit_cost, 2),
+            "cost_per_case": round(unit_cost * units_per_case, 1),
+        })
+    return receipts
+
+async def receive_stock(venue_id: str, receipts: List[dict]) -> int:
+    """Add received units to the stock counts in one bulk write"""
+    received: Dict[str, int] = {}
+    for r in receipts:
+        received[r['item_id']] = received.get(r['item_id'], 0) + r['qty']
+    if not received:
+        return 0
+    now = datetime.now(timezone.utc)
+    untouched = {loc: 0 for loc in sync_ops.LOCATIONS if loc != RECEIVING_LOCATION}
+    await db.stock_counts.bulk_write([
+        UpdateOne(
+            {"venue_id": venue_id, "item_id": item_id},
+            {
+                "$inc": {RECEIVING_LOCATION: qty, "total_count": qty, "version": 1},
+                # Offline edits made before the delivery don't overwrite it
+                "$set": {f"location_updated_at.{RECEIVING_LOCATION}": now},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "count_date": now, "counted_by": "Staff", **untouched},
+            },
+            upsert=True,
+        )
+        for item_id, qty in received.items()
+    ], ordered=False)
+    bump_version(venue_id, "counts")
+    await apply_count_valuations(venue_id, [(item_id, None, {RECEIVING_LOCATION: qty}) for item_id, qty in received.items()])
+    return len(received)
+
+async def record_order_purchases(venue_id: str, order: ConfirmedOrder, receipts: List[dict]) -> None:
+    """Record the received lines as purchases in the order's session (or the open one)"""
+    if not receipts:
+        return
+    session_id = order.session_id
+    if session_id is None:
+        session = await db.stock_sessions.find_one({"venue_id": venue_id, "is_active": True}, {"_id": 0, "id": 1})
+        session_id = session['id'] if session else None
+    await db.purchases.insert_many([
+        prepare_for_mongo(PurchaseEntry(
+            venue_id=venue_id, order_id=order.id, session_id=session_id, item_id=r['item_id'],
+            planned_quantity=r['planned_qty'], actual_quantity=r['qty'], cost_per_unit=r['unit_cost'],
+            total_cost=round(r['qty'] * r['unit_cost'], 2), supplier=order.supplier,
+            purchase_date=order.completed_at, delivery_received=True,
+        ).dict())
+        for r in receipts
+    ])
+    if session_id:
+        venue_state(venue_id).report_cache.invalidate_session(session_id)
+
+# How long a request applying an order holds it before a retry may take over
+ORDER_CLAIM_SECONDS = 60
+
+async def claim_pending_order(venue_id: str, order_id: str) -> Optional[dict]:
+    """A confirmed order whose stock was never fully received, if no other request is applying it"""
+    now = datetime.now(timezone.utc)
+    return await db.confirmed_orders.find_one_and_update(
+        {"venue_id": venue_id, "id": order_id, "receipt_status": "pending", "claimed_until": {"$lte": now}},
+        {"$set": {"claimed_until": now + timedelta(seconds=ORDER_CLAIM_SECONDS)}},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+    )
+
+async def apply_order(venue_id: str, order: ConfirmedOrder, done: List[str]) -> int:
+    """Apply a confirmed order's effects, skipping the steps ``done`` by an earlier attempt.
+
+    Each step is recorded on the order as it completes and the order is
+    marked applied after the last, so a retry of a failed attempt picks up
+    where it stopped instead of booking anything twice.
+    """
+    values = await get_item_value_map(venue_id)
+    # Lines for items not in the catalog (deleted since the order) are left out of every step
+    receipts = [r for r in order_receipts(order) if r['item_id'] in values]
+    # Buffered count edits predate the delivery and must land before it
+    await count_buffer.flush(venue_id)
+    steps = [
+        # Book the actual purchase costs into price history and cost layers
+        ("costs", lambda: costing.record_receipts(db, venue_id, receipts, ref_id=order.id)),
+        ("anomalies", lambda: venue_state(venue_id).anomaly_detector.record_receipts(db, receipts)),
+        ("stock", lambda: receive_stock(venue_id, receipts)),
+        ("purchases", lambda: record_order_purchases(venue_id, order, receipts)),
+    ]
+    selector = {"venue_id": venue_id, "id": order.id}
+    try:
+        for step, apply in steps:
+            if step in done:
+                continue
+            await apply()
+            await db.confirmed_orders.update_one(selector, {"$push": {"applied_steps": step}})
+    except Exception:
+        # Let a retry resume straight away
+        await db.confirmed_orders.update_one(selector, {"$set": {"claimed_until": datetime.now(timezone.utc)}})
+        raise
+    await db.confirmed_orders.update_one(selector, {"$set": {"receipt_status": "applied"}, "$unset": {"claimed_until": ""}})
+    return len({r['item_id'] for r in receipts})
+
 @api_router.post("/orders")
-async def save_confirmed_order(request: Request):
-    """Save a confirmed purchase order with actual quantities and costs"""
-    order = await request.json()
-    order.pop('_id', None)
-    result = await db.confirmed_orders.insert_one(order)
-    return {"message": "Order saved successfully", "order_id": order.get('id')}
-
-@api_router.get("/orders")
-async def get_confirmed_orders():
+async def save_confirmed_order(order: ConfirmedOrderCreate, venue_id: str = Depends(get_venue_id)):
+    """Save a confirmed purchase order and add what was received to stock.
+
+    Order ids are unique per venue, so a retried confirmation changes nothing,
+    unless the first attempt failed part way; then the retry finishes it (or
+    gets a 409 while that attempt is still running).
+    """
+    order_obj = ConfirmedOrder(**order.dict(), venue_id=venue_id)
+    doc = prepare_for_mongo(order_obj.dict())
+    doc.update(receipt_status="pending", applied_steps=[],
+               claimed_until=datetime.now(timezone.utc) + timedelta(seconds=ORDER_CLAIM_SECONDS))
+    done: List[str] = []
+    try:
+        await db.confirmed_orders.insert_one(doc)
+    except DuplicateKeyError:
+        pending = await claim_pending_order(venue_id, order.id)
+        if pending is None:
+            saved = await db.confirmed_orders.find_one({"venue_id": venue_id, "id": order.id}, {"_id": 0, "receipt_status": 1})
+            if saved and saved.get('receipt_status') == "pending":
+                # Another attempt holds the claim and hasn't finished
+                raise HTTPException(status_code=409, detail="Order is still being applied, try again shortly")
+            return {"message": "Order already saved", "order_id": order.id, "duplicate": True}
+        # Finish the order as first saved, whatever the retry carries
+        done = pending.get('applied_steps') or []
+        order_obj = ConfirmedOrder(**{k: v for k, v in pending.items() if k in ConfirmedOrder.model_fields})
+
+    items_received = await apply_order(venue_id, order_obj, done)
+    return {"message": "Order saved successfully", "order_id": order.id, "duplicate": False,
+            "items_received": items_received}
+
+@api_router.get("/orders", response_class=NegotiatedResponse)
+async def get_confirmed_orders(venue_id: str = Depends(get_venue_id)):
     """Get all confirmed orders for history"""
-    orders = await db.confirmed_orders.find({}, {"_id": 0}).sort("completed_at", -1).to_list(100)
+    orders = await db.confirmed_orders.find({"venue_id": venue_id}, {"_id": 0}).sort("completed_at", -1).to_list(100)
     return orders
 
 # Historical analysis and reporting endpoints
 @api_router.get("/reports/session-comparison/{session1_id}/{session2_id}")
-async def compare_sessions(session1_id: str, session2_id: str):
+async def compare_sessions(session1_id: str, session2_id: str, cost_method: str = "wac",
+                           venue_id: str = Depends(get_venue_id)):
+    if cost_method not in costing.COST_METHODS:
+        raise HTTPException(status_code=400, detail=f"cost_method must be one of {', '.join(costing.COST_METHODS)}")
+    state = venue_state(venue_id)
+    key = ReportCache.make_key("session-comparison", (session1_id, session2_id), state.versions["catalog"], cost_method)
+    return await state.report_cache.get_or_build(
+        key, lambda: build_session_comparison(venue_id, session1_id, session2_id, cost_method)
+    )
+
+async def build_session_comparison(venue_id: str, session1_id: str, session2_id: str, cost_method: str):
+    cost_field = f"{cost_method}_unit_cost"
+    
     # Get both sessions
-    session1 = await db.stock_sessions.find_one({"id": session1_id})
-    session2 = await db.stock_sessions.find_one({"id": session2_id})
+    session1 = await db.stock_sessions.find_one({"venue_id": venue_id, "id": session1_id})
+    session2 = await db.stock_sessions.find_one({"venue_id": venue_id, "id": session2_id})
     
     if not session1 or not session2:
         raise HTTPException(status_code=404, detail="Session not found")
+    for session in (session1, session2):
+        if session.get('archived_in'):
+            raise archived_session_error(session)
     
     # Get stock counts for both sessions from historical_counts collection
-    counts1 = await db.historical_counts.find({"session_id": session1_id}).to_list(1000)
-    counts2 = await db.historical_counts.find({"session_id": session2_id}).to_list(1000)
+    keyframes = venue_state(venue_id).keyframes
+    counts1 = await snapshots.session_counts(db, venue_id, session1_id, keyframes)
+    counts2 = await snapshots.session_counts(db, venue_id, session2_id, keyframes)
     
     # Get purchases between sessions (purchases made after session1 and before/during session2)
     # For now, we'll look for purchases in either session
     purchases = await db.purchases.find({
-        "$or": [
-            {"session_id": session1_id},
-            {"session_id": session2_id}
-        ]
+        "venue_id": venue_id,
+        "session_id": {"$in": [session1_id, session2_id]}
     }).to_list(1000)
     
     # Get all items for reference
-    items = await db.items.find().to_list(1000)
+    items = await db.items.find({"venue_id": venue_id}).to_list(1000)
     items_map = {item['id']: item for item in items}
     
     # Calculate usage and costs
@@ -768,8 +1662,10 @@ async def compare_sessions(session1_id: str, session2_id: str):
         # Calculate usage: opening + purchases - closing
         calculated_usage = opening_stock + purchases_made - closing_stock
         
-        # Calculate cost
-        cost_per_unit = item.get('cost_per_unit', 0.0)
+        # Value usage at the cost recorded when the closing session was saved,
+        # so later price edits don't rewrite history
+        closing_row = counts2_map.get(item_id, {})
+        cost_per_unit = closing_row.get(cost_field, closing_row.get('cost_per_unit', item.get('cost_per_unit', 0.0)))
         usage_cost = calculated_usage * cost_per_unit if calculated_usage > 0 else 0.0
         total_usage_cost += usage_cost
         
@@ -787,8 +1683,8 @@ async def compare_sessions(session1_id: str, session2_id: str):
             })
     
     # Calculate period between sessions
-    session1_date = datetime.fromisoformat(session1['session_date'].replace('Z', '+00:00')) if isinstance(session1['session_date'], str) else session1['session_date']
-    session2_date = datetime.fromisoformat(session2['session_date'].replace('Z', '+00:00')) if isinstance(session2['session_date'], str) else session2['session_date']
+    session1_date = session1['session_date']
+    session2_date = session2['session_date']
     period_days = (session2_date - session1_date).days
     
     return {
@@ -800,47 +1696,231 @@ async def compare_sessions(session1_id: str, session2_id: str):
         "session2_date": session2_date,
         "item_comparisons": item_comparisons,
         "total_usage_cost": total_usage_cost,
-        "period_days": period_days
+        "period_days": period_days,
+        "cost_method": cost_method
+    }
+
+@api_router.get("/reports/cost-of-goods")
+async def get_cost_of_goods(period: Optional[str] = None, method: str = "wac", venue_id: str = Depends(get_venue_id)):
+    """Cost of goods used per item for one month, read from the precomputed cost layers"""
+    if method not in costing.COST_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(costing.COST_METHODS)}")
+    period = period or costing.period_key(datetime.now(timezone.utc))
+    layers = await db.cost_layers.find({"venue_id": venue_id, "period": period}, {"_id": 0}).to_list(None)
+    
+    items = await db.items.find({"venue_id": venue_id}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    names = {item['id']: item['name'] for item in items}
+    
+    rows = []
+    total_cogs = 0.0
+    total_received = 0.0
+    for layer in layers:
+        cogs = layer.get(f"cogs_{method}", 0.0)
+        total_cogs += cogs
+        total_received += layer.get('received_cost', 0.0)
+        rows.append({
+            "item_id": layer['item_id'],
+            "item_name": names.get(layer['item_id'], 'Unknown'),
+            "received_qty": layer.get('received_qty', 0),
+            "received_cost": round(layer.get('received_cost', 0.0), 2),
+            "usage_qty": layer.get('usage_qty', 0),
+            "cost_of_goods": round(cogs, 2),
+            "closing_wac_unit_cost": round(layer.get('closing_wac_unit_cost', 0.0), 2),
+        })
+    rows.sort(key=lambda r: r['cost_of_goods'], reverse=True)
+    
+    return {
+        "period": period,
+        "method": method,
+        "items": rows,
+        "total_received_cost": round(total_received, 2),
+        "total_cost_of_goods": round(total_cogs, 2)
     }
 
 @api_router.get("/reports/usage-summary")
-async def get_usage_summary():
+async def get_usage_summary(cost_method: str = "wac", venue_id: str = Depends(get_venue_id)):
     # Get last two sessions
-    sessions = await db.stock_sessions.find().sort("session_date", -1).limit(2).to_list(2)
+    sessions = await db.stock_sessions.find({"venue_id": venue_id}, {"_id": 0, "id": 1}).sort("session_date", -1).limit(2).to_list(2)
     
     if len(sessions) < 2:
         return {"message": "Need at least 2 sessions to generate usage report", "sessions_available": len(sessions)}
     
-    # Use the comparison endpoint logic
+    # Use the comparison endpoint logic (served from the report cache)
     latest_session = sessions[0]
     previous_session = sessions[1]
     
-    return await compare_sessions(previous_session['id'], latest_session['id'])
+    return await compare_sessions(previous_session['id'], latest_session['id'], cost_method, venue_id)
+
+@api_router.get("/reports/usage-series")
+async def get_usage_series(limit: int = 6, cost_method: str = "wac", venue_id: str = Depends(get_venue_id)):
+    """Usage cost between each pair of consecutive sessions, oldest first"""
+    if cost_method not in costing.COST_METHODS:
+        raise HTTPException(status_code=400, detail=f"cost_method must be one of {', '.join(costing.COST_METHODS)}")
+    sessions = await db.stock_sessions.find({"venue_id": venue_id}, {"_id": 0, "id": 1}).sort("session_date", -1).limit(limit + 1).to_list(limit + 1)
+    session_ids = tuple(s['id'] for s in reversed(sessions))
+    
+    async def build():
+        series = []
+        for previous_id, latest_id in zip(session_ids, session_ids[1:]):
+            comparison = await compare_sessions(previous_id, latest_id, cost_method, venue_id)
+            series.append({
+                "session1_id": previous_id,
+                "session1_name": comparison['session1_name'],
+                "session1_date": comparison['session1_date'],
+                "session2_id": latest_id,
+                "session2_name": comparison['session2_name'],
+                "session2_date": comparison['session2_date'],
+                "period_days": comparison['period_days'],
+                "total_usage_cost": comparison['total_usage_cost'],
+                "items_with_activity": len(comparison['item_comparisons'])
+            })
+        return {"cost_method": cost_method, "series": series}
+    
+    state = venue_state(venue_id)
+    key = ReportCache.make_key("usage-series", session_ids, state.versions["catalog"], cost_method)
+    return await state.report_cache.get_or_build(key, build)
+
+@api_router.get("/reports/cache-stats")
+async def get_report_cache_stats(venue_id: str = Depends(get_venue_id)):
+    return venue_state(venue_id).report_cache.stats()
+
+@api_router.get("/reports/anomalies")
+async def get_count_anomalies(include_resolved: bool = False, limit: int = 100, venue_id: str = Depends(get_venue_id)):
+    """Counts flagged as likely miscounts, newest first"""
+    query = {"venue_id": venue_id} if include_resolved else {"venue_id": venue_id, "resolved": False}
+    flagged = await db.count_anomalies.find(query, {"_id": 0}).sort("detected_at", -1).to_list(limit)
+    
+    item_ids = list({a['item_id'] for a in flagged})
+    items = await db.items.find({"venue_id": venue_id, "id": {"$in": item_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    names = {item['id']: item['name'] for item in items}
+    for a in flagged:
+        a['item_name'] = names.get(a['item_id'], 'Unknown')
+    return flagged
+
+@api_router.post("/reports/anomalies/{anomaly_id}/resolve")
+async def resolve_count_anomaly(anomaly_id: str, venue_id: str = Depends(get_venue_id)):
+    """Mark a flagged count as checked (e.g. the count was right after all)"""
+    anomaly = await db.count_anomalies.find_one({"venue_id": venue_id, "id": anomaly_id})
+    if not anomaly:
+        raise HTTPException(status_code=404, detail="Anomaly not found")
+    await db.count_anomalies.update_one(
+        {"venue_id": venue_id, "id": anomaly_id},
+        {"$set": {"resolved": True, "resolved_at": datetime.now(timezone.utc), "resolution": "confirmed"}}
+    )
+    venue_state(venue_id).anomaly_detector.open_items.discard(anomaly['item_id'])
+    return {"message": "Anomaly resolved"}
+
+# History archival: months past the horizon are packed into one compressed
+# document per collection, keeping only a rollup queryable
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', '24'))  # 0 disables the scheduled job
+archive_lock = asyncio.Lock()
+
+def archived_session_error(session: dict) -> HTTPException:
+    month = session['archived_in']
+    return HTTPException(status_code=409, detail=(
+        f"Session is archived in {month}; restore it with POST /api/archive/historical_counts/{month}/restore"
+    ))
+
+async def archive_venue_history(venue_id: str, older_than_days: int, dry_run: bool = False) -> dict:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    state = venue_state(venue_id)
+    async with archive_lock:
+        results = await archive.archive_venue(db, venue_id, cutoff, state.keyframes, dry_run)
+    if results and not dry_run:
+        state.report_cache.clear()
+        logger.info(f"Archived {sum(r['rows'] for r in results)} rows for venue '{venue_id}' in {len(results)} month(s)")
+    return {"cutoff": cutoff, "dry_run": dry_run, "archived": results}
+
+async def archive_all_venues() -> dict:
+    rows = 0
+    venues = sorted(await archive.archived_venues(db))
+    for venue_id in venues:
+        result = await archive_venue_history(venue_id, ARCHIVE_AFTER_DAYS)
+        rows += sum(r['rows'] for r in result['archived'])
+    return {"venues": len(venues), "rows": rows}
+
+@api_router.get("/archive")
+async def get_archives(collection: Optional[str] = None, venue_id: str = Depends(get_venue_id)):
+    """Archived months with their rollups (the raw rows stay compressed until restored)"""
+    return await archive.list_archives(db, venue_id, collection)
+
+@api_router.post("/archive/run")
+async def run_archive(older_than_days: int = ARCHIVE_AFTER_DAYS, dry_run: bool = False,
+                      venue_id: str = Depends(get_venue_id)):
+    if older_than_days < 0:
+        raise HTTPException(status_code=400, detail="older_than_days must not be negative")
+    return await archive_venue_history(venue_id, older_than_days, dry_run)
+
+@api_router.post("/archive/{collection}/{month}/restore")
+async def restore_archive(collection: str, month: str, venue_id: str = Depends(get_venue_id)):
+    if collection not in archive.ARCHIVED_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"collection must be one of {', '.join(archive.ARCHIVED_COLLECTIONS)}")
+    async with archive_lock:
+        restored = await archive.restore_month(db, venue_id, collection, month)
+    if not restored:
+        raise HTTPException(status_code=404, detail="Archive not found")
+    venue_state(venue_id).report_cache.clear()
+    return {"restored": restored}
 
 # Endpoint to save current stock counts to a session
 @api_router.post("/stock-sessions/{session_id}/save-counts")
-async def save_counts_to_session(session_id: str):
+async def save_counts_to_session(session_id: str, venue_id: str = Depends(get_venue_id)):
     # Get current stock counts
-    current_counts = await db.stock_counts.find().to_list(1000)
+    await count_buffer.flush(venue_id)
+    current_counts = await db.stock_counts.find({"venue_id": venue_id}).to_list(1000)
     
     if not current_counts:
         raise HTTPException(status_code=400, detail="No stock counts available to save")
+    try:
+        await snapshots.check_saveable(db, venue_id, session_id)
+    except snapshots.SnapshotConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    # Cost the usage since the last snapshot and stamp the unit costs in
+    # effect onto the historical rows
+    saved_date = datetime.now(timezone.utc)
+    items = await db.items.find({"venue_id": venue_id}, {"_id": 0, "id": 1, "cost_per_unit": 1}).to_list(None)
+    prices = {item['id']: item.get('cost_per_unit', 0.0) for item in items}
+    # Re-saving the latest session replaces what its previous save booked
+    unit_costs = await costing.record_session_usage(db, venue_id, current_counts, prices, saved_date, session_id)
+    await venue_state(venue_id).anomaly_detector.record_session(db, current_counts, session_id)
     
-    # Save each count with session_id reference
+    # Save each count with session_id reference (only the changed ones unless
+    # this session is a keyframe)
+    historical = []
     for count in current_counts:
         # Remove the MongoDB _id to avoid conflicts
         if '_id' in count:
             del count['_id']
-        count['session_id'] = session_id
-        count['saved_date'] = datetime.now(timezone.utc)
-        # Create a historical record
-        await db.historical_counts.insert_one(prepare_for_mongo(count))
+        count.update(unit_costs.get(count['item_id'], {}))
+        historical.append(prepare_for_mongo(count))
+    state = venue_state(venue_id)
+    try:
+        snapshot = await snapshots.save_session(
+            db, venue_id, session_id, historical, saved_date, SNAPSHOT_KEYFRAME_INTERVAL, state.keyframes
+        )
+    except snapshots.SnapshotConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    state.report_cache.invalidate_session(session_id)
     
-    return {"message": f"Saved {len(current_counts)} stock counts to session", "count": len(current_counts)}
+    return {
+        "message": f"Saved {len(current_counts)} stock counts to session",
+        "count": len(current_counts),
+        "snapshot": snapshot['kind'],
+        "stored": snapshot['stored_count'],
+    }
+
+# Seed data is only read when the endpoint below is called, not at import
+SEED_ITEMS_PATH = ROOT_DIR / 'data' / 'real_items.json'
+
+def load_seed_items() -> List[dict]:
+    with open(SEED_ITEMS_PATH, encoding='utf-8') as f:
+        return json.load(f)
 
 # Initialize with real data from spreadsheet - DANGEROUS: Wipes all data!
 @api_router.post("/initialize-real-data")
-async def initialize_real_data(confirm: str = None):
+async def initialize_real_data(confirm: str = None, venue_id: str = Depends(get_venue_id)):
     # Safety check - require confirmation parameter
     if confirm != "YES_DELETE_ALL_DATA":
         return {
@@ -850,119 +1930,125 @@ async def initialize_real_data(confirm: str = None):
         }
     
     # Clear existing data
-    await db.items.delete_many({})
-    await db.stock_counts.delete_many({})
-    
-    # Enhanced real items based on the spreadsheet with proper case calculations and complete data
-    real_items = [
-        # Beers (most popular items) - commonly bought by case
-        {"name": "Big Chang", "category": "B", "category_name": "Beer", "units_per_case": 15, "min_stock": 30, "max_stock": 120, "primary_supplier": "Singha99", "cost_per_unit": 44.0, "cost_per_case": 660.0, "bought_by_case": True},
-        {"name": "Small Chang", "category": "B", "category_name": "Beer", "units_per_case": 24, "min_stock": 48, "max_stock": 192, "primary_supplier": "Singha99", "cost_per_unit": 45.0, "cost_per_case": 1080.0, "bought_by_case": True},
-        {"name": "Big Leo", "category": "B", "category_name": "Beer", "units_per_case": 12, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 45.0, "cost_per_case": 540.0, "bought_by_case": True},
-        {"name": "Small Leo", "category": "B", "category_name": "Beer", "units_per_case": 24, "min_stock": 48, "max_stock": 192, "primary_supplier": "Singha99", "cost_per_unit": 45.0, "cost_per_case": 1080.0, "bought_by_case": True},
-        {"name": "Big Singha", "category": "B", "category_name": "Beer", "units_per_case": 12, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 50.08, "cost_per_case": 601.0, "bought_by_case": True},
-        {"name": "Small Singha", "category": "B", "category_name": "Beer", "units_per_case": 24, "min_stock": 48, "max_stock": 192, "primary_supplier": "Singha99", "cost_per_unit": 27.08, "cost_per_case": 650.0, "bought_by_case": True},
-        {"name": "Small Heineken", "category": "B", "category_name": "Beer", "units_per_case": 24, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 31.75, "cost_per_case": 762.0, "bought_by_case": True},
-        {"name": "Small San Miguel Lite", "category": "B", "category_name": "Beer", "units_per_case": 24, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 30.75, "cost_per_case": 738.0, "bought_by_case": True},
-        {"name": "Bam Bam (can)", "category": "B", "category_name": "Beer", "units_per_case": 12, "min_stock": 12, "max_stock": 48, "primary_supplier": "Vendor", "cost_per_unit": 14.0, "cost_per_case": 168.0, "bought_by_case": True},
-        {"name": "Soju", "category": "B", "category_name": "Beer", "units_per_case": 12, "min_stock": 12, "max_stock": 48, "primary_supplier": "Vendor", "cost_per_unit": 0.75, "cost_per_case": 9.0, "bought_by_case": True},
-        
-        # Thai Alcohol - commonly bought by case/box
-        {"name": "Charles House Rum", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 12, "min_stock": 6, "max_stock": 24, "primary_supplier": "Makro", "cost_per_unit": 24.0, "cost_per_case": 288.0, "bought_by_case": True},
-        {"name": "Charles House Gin", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 12, "min_stock": 6, "max_stock": 24, "primary_supplier": "Makro", "cost_per_unit": 23.0, "cost_per_case": 276.0, "bought_by_case": True},
-        {"name": "Yeow Ngeah Vodka", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 12, "min_stock": 6, "max_stock": 24, "primary_supplier": "Vendor", "cost_per_unit": 15.0, "cost_per_case": 180.0, "bought_by_case": True},
-        {"name": "Sangsom (Black)", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 12, "min_stock": 6, "max_stock": 24, "primary_supplier": "Singha99", "cost_per_unit": 45.0, "cost_per_case": 540.0, "bought_by_case": True},
-        {"name": "Hong Thong", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 12, "min_stock": 6, "max_stock": 24, "primary_supplier": "Singha99", "cost_per_unit": 4.0, "cost_per_case": 48.0, "bought_by_case": True},
-        
-        # Import Alcohol (premium by bottle)
-        {"name": "Bacardi Rum", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 6, "primary_supplier": "zBKK", "cost_per_unit": 850.0},
-        {"name": "Jack Daniels", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 6, "primary_supplier": "zBKK", "cost_per_unit": 1200.0},
-        {"name": "Grey Goose Vodka", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 2500.0},
-        {"name": "Bombay Gin", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 900.0},
-        {"name": "Captain Morgan Spiced Rum", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 750.0},
-        {"name": "Jagermeister", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 1100.0},
-        {"name": "Jose Cuervo Gold Tequila", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 850.0},
-        {"name": "Skyy Vodka", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 650.0},
-        
-        # Mixers - case items marked as commonly bought by case
-        {"name": "Big Coke", "category": "M", "category_name": "Mixers", "units_per_case": 12, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 12.0, "cost_per_case": 144.0, "bought_by_case": True},
-        {"name": "Big Sprite", "category": "M", "category_name": "Mixers", "units_per_case": 12, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 12.0, "cost_per_case": 144.0, "bought_by_case": True},
-        {"name": "Soda Water", "category": "M", "category_name": "Mixers", "units_per_case": 24, "min_stock": 48, "max_stock": 144, "primary_supplier": "Singha99", "cost_per_unit": 10.0, "cost_per_case": 240.0, "bought_by_case": True},
-        {"name": "Tonic Water", "category": "M", "category_name": "Mixers", "units_per_case": 24, "min_stock": 48, "max_stock": 144, "primary_supplier": "Singha99", "cost_per_unit": 10.0, "cost_per_case": 240.0, "bought_by_case": True},
-        {"name": "Schweppes Lime", "category": "M", "category_name": "Mixers", "units_per_case": 24, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 10.0, "cost_per_case": 240.0, "bought_by_case": True},
-        {"name": "Schweppes Ginger Ale", "category": "M", "category_name": "Mixers", "units_per_case": 24, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 10.0, "cost_per_case": 240.0, "bought_by_case": True},
-        {"name": "Fanta Orange", "category": "M", "category_name": "Mixers", "units_per_case": 24, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 10.0, "cost_per_case": 240.0, "bought_by_case": True},
-        {"name": "Red Bull", "category": "M", "category_name": "Mixers", "units_per_case": 50, "min_stock": 100, "max_stock": 300, "primary_supplier": "Singha99", "cost_per_unit": 4.0, "cost_per_case": 200.0, "bought_by_case": True},
-        {"name": "Small Water (600ml)", "category": "M", "category_name": "Mixers", "units_per_case": 12, "min_stock": 24, "max_stock": 96, "primary_supplier": "Singha99", "cost_per_unit": 5.5, "cost_per_case": 66.0, "bought_by_case": True},
-        {"name": "Big Water (1.5L)", "category": "M", "category_name": "Mixers", "units_per_case": 6, "min_stock": 12, "max_stock": 48, "primary_supplier": "Singha99", "cost_per_unit": 5.5, "cost_per_case": 33.0, "bought_by_case": True},
-        {"name": "Orange Juice (1L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 6, "max_stock": 24, "primary_supplier": "Makro", "cost_per_unit": 55.0},
-        {"name": "Cranberry Juice (1L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 3, "max_stock": 12, "primary_supplier": "Singha99", "cost_per_unit": 65.0},
-        
-        # Bar Supplies
-        {"name": "Buckets", "category": "O", "category_name": "Bar Supplies", "units_per_case": 1, "min_stock": 2, "max_stock": 10, "primary_supplier": "Makro", "cost_per_unit": 59.0},
-        {"name": "Limes (25 pack)", "category": "O", "category_name": "Bar Supplies", "units_per_case": 25, "min_stock": 50, "max_stock": 200, "primary_supplier": "Makro", "cost_per_unit": 0.4, "cost_per_case": 10.0},
-        {"name": "Plastic Cups (16oz)", "category": "O", "category_name": "Bar Supplies", "units_per_case": 50, "min_stock": 100, "max_stock": 500, "primary_supplier": "Makro", "cost_per_unit": 2.18, "cost_per_case": 109.0},
-        {"name": "Paper Cups (16oz)", "category": "O", "category_name": "Bar Supplies", "units_per_case": 50, "min_stock": 100, "max_stock": 500, "primary_supplier": "Makro", "cost_per_unit": 1.58, "cost_per_case": 79.0},
-        {"name": "Straws", "category": "O", "category_name": "Bar Supplies", "units_per_case": 100, "min_stock": 200, "max_stock": 1000, "primary_supplier": "Makro", "cost_per_unit": 0.68, "cost_per_case": 68.0},
-        
-        # Missing Import Alcohol (Premium Spirits)
-        {"name": "Fireball", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 1050.0},
-        {"name": "Jack Daniels Honey", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 1300.0},
-        {"name": "Jameson", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 1400.0},
-        {"name": "Jose Cuervo Silver Tequila", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 900.0},
-        {"name": "Malibu", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 800.0},
-        {"name": "Bacardi Black Rum", "category": "A", "category_name": "Import Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "zBKK", "cost_per_unit": 900.0},
-        
-        # Missing Thai Alcohol & Liqueurs
-        {"name": "Thai Tequila (Matador)", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Singha99", "cost_per_unit": 280.0},
-        {"name": "Thai Malibu (Coconut Liquor)", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Singha99", "cost_per_unit": 250.0},
-        {"name": "Fox (Jagermeister)", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Singha99", "cost_per_unit": 320.0},
-        {"name": "Dark Rum (Phoenix)", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Singha99", "cost_per_unit": 200.0},
-        {"name": "Triplesec (Charles House)", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 6, "primary_supplier": "Singha99", "cost_per_unit": 180.0},
-        {"name": "Blue Curacao (Charles House)", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 6, "primary_supplier": "Singha99", "cost_per_unit": 200.0},
-        {"name": "Sambuca", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "Singha99", "cost_per_unit": 450.0},
-        {"name": "Peach Schnapps", "category": "A", "category_name": "Thai Alcohol", "units_per_case": 1, "min_stock": 1, "max_stock": 6, "primary_supplier": "Singha99", "cost_per_unit": 220.0},
-        
-        # Missing Mixers & Concentrates
-        {"name": "Fanta Strawberry", "category": "M", "category_name": "Mixers", "units_per_case": 24, "min_stock": 12, "max_stock": 48, "primary_supplier": "Singha99", "cost_per_unit": 10.0, "cost_per_case": 240.0, "bought_by_case": True},
-        {"name": "Blue Concentrate", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Makro", "cost_per_unit": 150.0},
-        {"name": "Orange Concentrate (45L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "Makro", "cost_per_unit": 800.0},
-        {"name": "Pineapple Juice (1L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 3, "max_stock": 12, "primary_supplier": "Makro", "cost_per_unit": 65.0},
-        {"name": "Pineapple Concentrate (11.5L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "Makro", "cost_per_unit": 450.0},
-        {"name": "Mango Juice (1L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 3, "max_stock": 12, "primary_supplier": "Makro", "cost_per_unit": 70.0},
-        {"name": "Mango Concentrate (11.5L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "Makro", "cost_per_unit": 480.0},
-        {"name": "Strawberry Concentrate (11.5L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "Makro", "cost_per_unit": 460.0},
-        {"name": "Passionfruit Concentrate (11.5L)", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "Makro", "cost_per_unit": 500.0},
-        {"name": "Lime Juice", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Makro", "cost_per_unit": 45.0},
-        {"name": "Grenadine", "category": "M", "category_name": "Mixers", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Makro", "cost_per_unit": 85.0},
-        
-        # Complete Housekeeping & Supplies
-        {"name": "Toilet Paper (Jumbo Roll)", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 4, "min_stock": 8, "max_stock": 32, "primary_supplier": "Makro", "cost_per_unit": 45.0, "cost_per_case": 180.0},
-        {"name": "Toilet Paper (Small Roll)", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 24, "min_stock": 24, "max_stock": 96, "primary_supplier": "Makro", "cost_per_unit": 5.0, "cost_per_case": 120.0},
-        {"name": "Trash Bags Small (24x28)", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 5, "min_stock": 10, "max_stock": 50, "primary_supplier": "Makro", "cost_per_unit": 15.0, "cost_per_case": 75.0},
-        {"name": "Trash Bags Big (30x40)", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 5, "min_stock": 10, "max_stock": 40, "primary_supplier": "Makro", "cost_per_unit": 25.0, "cost_per_case": 125.0},
-        {"name": "Floor Cleaner (Concentrate)", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 4, "min_stock": 4, "max_stock": 16, "primary_supplier": "Makro", "cost_per_unit": 28.0, "cost_per_case": 112.0},
-        {"name": "Toilet Cleaner", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Makro", "cost_per_unit": 35.0},
-        {"name": "Bleach", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Makro", "cost_per_unit": 25.0},
-        {"name": "Laundry Washing Powder (25kg)", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "Makro", "cost_per_unit": 350.0},
-        {"name": "Laundry Softener (20L)", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 1, "max_stock": 4, "primary_supplier": "Makro", "cost_per_unit": 180.0},
-        {"name": "Hand Soap", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 3, "max_stock": 12, "primary_supplier": "Makro", "cost_per_unit": 35.0},
-        {"name": "Body Soap", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 3, "max_stock": 12, "primary_supplier": "Makro", "cost_per_unit": 40.0},
-        {"name": "Shampoo", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Makro", "cost_per_unit": 65.0},
-        {"name": "Air Freshener Spray", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Makro", "cost_per_unit": 45.0},
-        {"name": "Dish Soap", "category": "Z", "category_name": "Hostel Supplies", "units_per_case": 1, "min_stock": 2, "max_stock": 8, "primary_supplier": "Makro", "cost_per_unit": 30.0},
-    ]
+    await count_buffer.flush(venue_id)
+    await db.items.delete_many({"venue_id": venue_id})
+    await db.stock_counts.delete_many({"venue_id": venue_id})
+    bump_version(venue_id, "catalog", "counts")
+    await valuation.recompute(db, venue_id)
     
-    # Insert real items
-    for item_data in real_items:
-        item = Item(**item_data)
-        await db.items.insert_one(prepare_for_mongo(item.dict()))
+    # Items from the spreadsheet, with case sizes and costs
+    real_items = load_seed_items()
+    await db.items.insert_many([prepare_for_mongo(Item(**item_data, venue_id=venue_id, version=1).dict()) for item_data in real_items])
+    bump_version(venue_id, "catalog")
     
     return {"message": "Complete data initialized successfully - ALL items from spreadsheet", "items_count": len(real_items)}
 
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness for the platform's health checks; never touches the database"""
+    return {"status": "ok", "ready": startup_timer.ready is not None, "uptime_s": round(startup_timer.since_import(), 1)}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics_registry.render(), media_type=metrics.CONTENT_TYPE)
+
+# Debug endpoints
+@api_router.get("/debug/queries")
+async def get_query_report(limit: int = 20):
+    """Worst N+1 suspects, slowest queries and the routes issuing the most commands"""
+    return query_monitor.summary(limit)
+
+@api_router.get("/debug/startup")
+async def get_startup_report():
+    """Import, startup and first-request timings of this process"""
+    return startup_timer.report()
+
+@api_router.get("/debug/pool")
+async def get_pool_report():
+    """Connection pool usage and database operations retried after transient errors"""
+    retrying = isinstance(db, connection.RetryingDatabase)  # Not the memory backend
+    return {
+        "options": connection.client_options(os.environ),
+        "pool": pool_stats.summary(),
+        "retries": db.retry_policy.summary() if retrying else None,
+    }
+
+@api_router.get("/debug/count-buffer")
+async def get_count_buffer_report():
+    """Buffered count edits and how many writes coalescing saved"""
+    return count_buffer.summary()
+
+@api_router.post("/debug/queries/reset")
+async def reset_query_report():
+    query_monitor.reset()
+    return {"message": "Query statistics reset"}
+
+# Background jobs
+VALUATION_RECOMPUTE_CRON = os.environ.get('VALUATION_RECOMPUTE_CRON', '30 4 * * *')
+REPORT_WARM_MINUTES = float(os.environ.get('REPORT_WARM_MINUTES', '10'))  # 0 disables warming
+
+async def recompute_all_valuations() -> dict:
+    """Rebuild every venue's running valuation from its counts (corrects any drift)"""
+    drifted = {}
+    await count_buffer.flush()
+    for venue_id in sorted(await db.items.distinct("venue_id")):
+        result = await valuation.recompute(db, venue_id)
+        if result['drift']:
+            drifted[venue_id] = result['drift']
+    return {"drifted": drifted}
+
+async def warm_report_caches() -> dict:
+    """Build this process's usage summaries ahead of the first request after a change"""
+    for venue_id in list(venue_states):
+        for cost_method in costing.COST_METHODS:
+            await get_usage_summary(cost_method, venue_id)
+    return {"venues": len(venue_states)}
+
+if ARCHIVE_INTERVAL_HOURS > 0:
+    job_scheduler.add_interval("archive_history", ARCHIVE_INTERVAL_HOURS * 3600, archive_all_venues, lease_seconds=900)
+job_scheduler.add_cron("recompute_valuations", VALUATION_RECOMPUTE_CRON, recompute_all_valuations)
+if REPORT_WARM_MINUTES > 0:
+    # Each worker has its own caches, so every worker warms them
+    job_scheduler.add_interval("warm_report_caches", REPORT_WARM_MINUTES * 60, warm_report_caches, single_flight=False)
+
+@api_router.get("/jobs")
+async def get_jobs(runs: int = 10):
+    """Scheduled jobs with their next run, current lease and recent runs (from every worker)"""
+    return await job_scheduler.status(runs)
+
+@api_router.post("/jobs/{name}/run")
+async def run_job(name: str):
+    """Run a job now; skipped if it is already running somewhere"""
+    if name not in job_scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await job_scheduler.run(name)
+
+# Schema migrations (applied at startup; see migrations.py)
+@api_router.get("/migrations")
+async def get_migrations():
+    return await migrations.status(db)
+
+@api_router.post("/migrations/run")
+async def run_migrations():
+    """Apply any migrations not yet applied (e.g. after a restore from an old backup)"""
+    await count_buffer.flush()
+    applied = await migrations.run_pending(db, DEFAULT_VENUE_ID)
+    if any(record['changes'] for record in applied):
+        # Cached catalogs, valuations and reports may hold the old shapes
+        venue_states.clear()
+    return {"applied": applied}
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Innermost, so the metrics below record compressed sizes
+app.add_middleware(
+    response_encoding.EncodingMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', '1024')),
+    gzip_level=int(os.environ.get('GZIP_LEVEL', '6')),
+    brotli_quality=int(os.environ.get('BROTLI_QUALITY', '4')),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -971,6 +2057,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(metrics.MetricsMiddleware, registry=metrics_registry, observers=[query_monitor.finish_request, startup_timer.observe_request])
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -978,6 +2066,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def create_indexes():
+    # Independent, so they go out together rather than one round trip at a time
+    await asyncio.gather(
+        # Every hot query filters on venue first
+        db.items.create_index([("venue_id", 1), ("id", 1)], unique=True),
+        db.items.create_index([("venue_id", 1), ("sort_order", 1)]),
+        db.recipes.create_index([("venue_id", 1), ("id", 1)], unique=True),
+        db.stock_counts.create_index([("venue_id", 1), ("item_id", 1)], unique=True),
+        db.stock_sessions.create_index([("venue_id", 1), ("session_date", -1)]),
+        db.stock_sessions.create_index([("venue_id", 1), ("is_active", 1)]),
+        db.historical_counts.create_index([("venue_id", 1), ("session_id", 1)]),
+        db.purchases.create_index([("venue_id", 1), ("session_id", 1)]),
+        # One item's timeline without loading whole sessions
+        db.historical_counts.create_index([("venue_id", 1), ("item_id", 1), ("saved_date", -1)]),
+        db.purchases.create_index([("venue_id", 1), ("item_id", 1), ("purchase_date", -1)]),
+        db.shopping_orders.create_index([("venue_id", 1), ("order_date", -1)]),
+        db.confirmed_orders.create_index([("venue_id", 1), ("completed_at", -1)]),
+        # Orders saved before ids were checked may lack one
+        db.confirmed_orders.create_index([("venue_id", 1), ("id", 1)], unique=True,
+                                         partialFilterExpression={"id": {"$type": "string"}}),
+        db.suppliers.create_index([("venue_id", 1), ("name", 1)], unique=True),
+        db.valuation.create_index("venue_id", unique=True),
+        db.order_quantities.create_index([("venue_id", 1), ("item_id", 1)], unique=True),
+        db.applied_ops.create_index([("venue_id", 1), ("op_id", 1)], unique=True),
+        # The op log only has to outlive a device's offline window
+        db.applied_ops.create_index("applied_at", expireAfterSeconds=SYNC_OP_TTL_DAYS * 86400),
+        costing.ensure_indexes(db),
+        anomalies.ensure_indexes(db),
+        snapshots.ensure_indexes(db),
+        archive.ensure_indexes(db),
+        job_scheduler.ensure_indexes(),
+    )
+
+async def on_startup():
+    # Open the minimum pool up front; index creation and loading the default
+    # venue's catalog then share it concurrently
+    await startup_timer.timed("connect", connection.warm_up(db, connection.client_options(os.environ)['minPoolSize']))
+    await startup_timer.timed("migrations", migrations.run_pending(db, DEFAULT_VENUE_ID))
+    await asyncio.gather(
+        startup_timer.timed("indexes", create_indexes()),
+        startup_timer.timed("catalog", get_item_value_map(DEFAULT_VENUE_ID)),
+    )
+    job_scheduler.start()
+    count_buffer.start()
+    startup_timer.mark_ready()
+
+async def on_shutdown():
+    await job_scheduler.stop()
+    await count_buffer.stop()
+    client.close()
+
+startup_timer.mark_imported()
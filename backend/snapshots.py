@@ -0,0 +1,166 @@
+"""Session snapshots stored as keyframes plus deltas.
+
+Saving a session used to copy every stock count into ``historical_counts``.
+Now sessions are chained in save order: every ``keyframe_interval``-th
+snapshot is a keyframe holding every row, and the ones in between hold only
+the rows whose contents changed since the previous session, plus the ids of
+items that disappeared. ``session_snapshots`` has one record per saved
+session saying which it is.
+
+Readers call ``session_counts`` and get the full set of rows either way: the
+keyframe (cached decoded, per venue) with the chain of deltas up to the
+session applied on top. Sessions saved before snapshots existed have no
+record and are read as full copies.
+"""
+from datetime import datetime
+from typing import Dict, List
+
+from pymongo.errors import DuplicateKeyError
+
+from report_cache import ReportCache
+
+# Row fields that are bookkeeping rather than session contents: a row that
+# differs from the previous session only in these is not stored again
+METADATA_FIELDS = {"_id", "id", "session_id", "saved_date", "count_date", "counted_by", "version",
+                   "location_updated_at"}
+
+
+class SnapshotConflict(Exception):
+    pass
+
+
+def _content(row: dict) -> dict:
+    return {k: v for k, v in row.items() if k not in METADATA_FIELDS}
+
+
+def diff_rows(previous: Dict[str, dict], current: List[dict]):
+    """Rows of ``current`` that changed since ``previous`` and item ids that are gone"""
+    changed = [row for row in current
+               if row['item_id'] not in previous or _content(previous[row['item_id']]) != _content(row)]
+    current_ids = {row['item_id'] for row in current}
+    removed = [item_id for item_id in previous if item_id not in current_ids]
+    return changed, removed
+
+
+async def _load_keyframe(db, venue_id: str, session_id: str, cache: ReportCache) -> Dict[str, dict]:
+    key = ReportCache.make_key("keyframe", (session_id,), None)
+
+    async def build():
+        rows = await db.historical_counts.find({"venue_id": venue_id, "session_id": session_id}, {"_id": 0}).to_list(None)
+        return {row['item_id']: row for row in rows}
+
+    return await cache.get_or_build(key, build)
+
+
+async def _session_state(db, venue_id: str, snapshot: dict, cache: ReportCache) -> Dict[str, dict]:
+    """item_id -> row as of ``snapshot``'s session (rows of older sessions where unchanged)"""
+    keyframe_id = snapshot['keyframe_session_id']
+    state = dict(await _load_keyframe(db, venue_id, keyframe_id, cache))
+    if snapshot['kind'] == "keyframe":
+        return state
+    deltas = await db.session_snapshots.find(
+        {"venue_id": venue_id, "keyframe_session_id": keyframe_id, "position": {"$gt": 0, "$lte": snapshot['position']}},
+        {"_id": 0, "session_id": 1, "position": 1, "removed_item_ids": 1}
+    ).sort("position", 1).to_list(None)
+    rows = await db.historical_counts.find(
+        {"venue_id": venue_id, "session_id": {"$in": [d['session_id'] for d in deltas]}}, {"_id": 0}
+    ).to_list(None)
+    rows_by_session: Dict[str, List[dict]] = {}
+    for row in rows:
+        rows_by_session.setdefault(row['session_id'], []).append(row)
+    for delta in deltas:
+        for item_id in delta.get('removed_item_ids', []):
+            state.pop(item_id, None)
+        for row in rows_by_session.get(delta['session_id'], []):
+            state[row['item_id']] = row
+    return state
+
+
+async def session_counts(db, venue_id: str, session_id: str, cache: ReportCache) -> List[dict]:
+    """Every count saved with a session, however it was stored"""
+    snapshot = await db.session_snapshots.find_one({"venue_id": venue_id, "session_id": session_id}, {"_id": 0})
+    if snapshot is None:
+        # Saved before snapshots: a full copy
+        return await db.historical_counts.find({"venue_id": venue_id, "session_id": session_id}, {"_id": 0}).to_list(None)
+    state = await _session_state(db, venue_id, snapshot, cache)
+    return [{**row, "session_id": session_id, "saved_date": snapshot['saved_date']} for row in state.values()]
+
+
+async def check_saveable(db, venue_id: str, session_id: str) -> None:
+    """Only the most recent session can be saved again (later ones are stored relative to it)"""
+    snapshot = await db.session_snapshots.find_one({"venue_id": venue_id, "session_id": session_id}, {"_id": 0, "seq": 1})
+    if snapshot is None:
+        return
+    if await db.session_snapshots.find_one({"venue_id": venue_id, "seq": {"$gt": snapshot['seq']}}, {"_id": 1}):
+        raise SnapshotConflict("Only the most recent session can be saved again")
+
+
+async def save_session(db, venue_id: str, session_id: str, rows: List[dict], saved_date: datetime,
+                       keyframe_interval: int, cache: ReportCache) -> dict:
+    """Store a session's counts as a keyframe or as a delta against the previous session.
+
+    Saving the most recent session again replaces its snapshot.
+    """
+    await check_saveable(db, venue_id, session_id)
+    latest = await db.session_snapshots.find_one({"venue_id": venue_id}, {"_id": 0}, sort=[("seq", -1)])
+    if latest and latest['session_id'] == session_id:
+        await db.historical_counts.delete_many({"venue_id": venue_id, "session_id": session_id})
+        await db.session_snapshots.delete_one({"venue_id": venue_id, "session_id": session_id})
+        cache.invalidate_session(session_id)
+        latest = await db.session_snapshots.find_one({"venue_id": venue_id}, {"_id": 0}, sort=[("seq", -1)])
+
+    if latest is None or latest['position'] + 1 >= keyframe_interval:
+        snapshot = {"kind": "keyframe", "keyframe_session_id": session_id, "position": 0}
+        stored, removed = rows, []
+    else:
+        previous = await _session_state(db, venue_id, latest, cache)
+        snapshot = {"kind": "delta", "keyframe_session_id": latest['keyframe_session_id'],
+                    "position": latest['position'] + 1}
+        stored, removed = diff_rows(previous, rows)
+
+    snapshot.update({
+        "venue_id": venue_id,
+        "session_id": session_id,
+        # Stays increasing when every earlier snapshot has been archived
+        "seq": (latest['seq'] + 1) if latest else int(saved_date.timestamp() * 1000),
+        "saved_date": saved_date,
+        "item_count": len(rows),
+        "stored_count": len(stored),
+        "removed_item_ids": removed,
+    })
+    try:
+        # Claims the next place in the chain before any rows are written
+        await db.session_snapshots.insert_one(snapshot)
+    except DuplicateKeyError:
+        raise SnapshotConflict("Another session was saved at the same time; try again")
+    if stored:
+        await db.historical_counts.insert_many(
+            [{**row, "session_id": session_id, "saved_date": saved_date} for row in stored]
+        )
+    snapshot.pop('_id', None)
+    return snapshot
+
+
+async def self_contained(db, venue_id: str, session_ids: List[str]) -> set:
+    """The sessions whose whole snapshot chain is among ``session_ids``.
+
+    Those can be moved out together without leaving a remaining delta
+    session without the rows it is built on.
+    """
+    records = await db.session_snapshots.find(
+        {"venue_id": venue_id, "session_id": {"$in": session_ids}}, {"_id": 0, "session_id": 1, "keyframe_session_id": 1}
+    ).to_list(None)
+    chain_of = {r['session_id']: r['keyframe_session_id'] for r in records}
+    chains = await db.session_snapshots.find(
+        {"venue_id": venue_id, "keyframe_session_id": {"$in": list(set(chain_of.values()))}},
+        {"_id": 0, "session_id": 1, "keyframe_session_id": 1}
+    ).to_list(None)
+    ids = set(session_ids)
+    broken = {r['keyframe_session_id'] for r in chains if r['session_id'] not in ids}
+    return {sid for sid in ids if chain_of.get(sid) not in broken}
+
+
+async def ensure_indexes(db) -> None:
+    await db.session_snapshots.create_index([("venue_id", 1), ("session_id", 1)], unique=True)
+    await db.session_snapshots.create_index([("venue_id", 1), ("seq", -1)], unique=True)
+    await db.session_snapshots.create_index([("venue_id", 1), ("keyframe_session_id", 1), ("position", 1)])
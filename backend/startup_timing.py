@@ -0,0 +1,88 @@
+"""Cold-start timings: how long the process took to import, start up and
+answer its first requests.
+
+``server`` imports this module before anything else, so ``IMPORT_STARTED``
+covers every import below it. Phases of the startup (connecting, index
+creation, cache priming) are timed with ``StartupTimer.timed``; the first
+request and the first API request are recorded by ``observe_request``, a
+``MetricsMiddleware`` observer. The report is logged once the first API
+request completes and served at ``/api/debug/startup``.
+"""
+import logging
+import os
+import time
+from typing import Awaitable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+IMPORT_STARTED = time.perf_counter()
+
+
+def process_age() -> Optional[float]:
+    """Seconds since the process started (Linux only), covering interpreter and server startup"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - started_ticks / os.sysconf("SC_CLK_TCK")
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class StartupTimer:
+    def __init__(self):
+        # Seconds from process start to this module's import, when known
+        age = process_age()
+        self.before_import = None if age is None else max(0.0, age - (time.perf_counter() - IMPORT_STARTED))
+        self.imported: Optional[float] = None
+        self.ready: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self.first_request: Optional[dict] = None
+        self.first_api_request: Optional[dict] = None
+
+    def since_import(self) -> float:
+        return time.perf_counter() - IMPORT_STARTED
+
+    def mark_imported(self) -> None:
+        self.imported = self.since_import()
+
+    def mark_ready(self) -> None:
+        self.ready = self.since_import()
+        logger.info(f"Ready {_ms(self.ready)}ms after import started (phases: "
+                    + ", ".join(f"{name} {_ms(seconds)}ms" for name, seconds in self.phases.items()) + ")")
+
+    async def timed(self, name: str, awaitable: Awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats) -> None:
+        if self.first_api_request is not None:
+            return
+        request = {"method": method, "route": route, "status": status, "duration_ms": _ms(seconds),
+                   "completed_ms": _ms(self.since_import()), "db_commands": stats.commands}
+        if self.first_request is None:
+            self.first_request = request
+        if route.startswith("/api/"):
+            self.first_api_request = request
+            logger.info(f"First API request {method} {route} took {request['duration_ms']}ms, "
+                        f"completed {request['completed_ms']}ms after import started")
+
+    def report(self) -> dict:
+        return {
+            "before_import_ms": _ms(self.before_import),
+            "import_ms": _ms(self.imported),
+            "ready_ms": _ms(self.ready),
+            "phases_ms": {name: _ms(seconds) for name, seconds in self.phases.items()},
+            "first_request": self.first_request,
+            "first_api_request": self.first_api_request,
+            "uptime_s": round(self.since_import(), 1),
+        }
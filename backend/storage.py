@@ -0,0 +1,882 @@
+"""Storage backends.
+
+Handlers talk to ``db.<collection>`` using a small subset of the Motor
+collection API. ``connect`` returns either a real Motor client or an embedded
+in-memory store implementing that same subset, chosen by ``STORAGE_BACKEND``:
+
+- ``mongo`` (default): Motor against ``MONGO_URL`` / ``DB_NAME``, with the
+  pool settings and retries of idempotent operations from ``connection``
+- ``memory``: process-local store, no MongoDB or network needed. Data is
+  lost on restart; meant for local runs, benchmarks and profiling.
+
+Supported by the in-memory backend:
+
+- ``find`` (filter, projection) with ``sort`` / ``skip`` / ``limit`` /
+  ``to_list`` / ``async for``, ``find_one``, ``count_documents``, ``distinct``
+- ``insert_one`` / ``insert_many``, ``update_one`` / ``update_many`` with
+  ``$set`` ``$setOnInsert`` ``$inc`` ``$unset`` ``$push`` ``$min`` ``$max``
+  and upsert, ``replace_one``, ``delete_one`` / ``delete_many``,
+  ``find_one_and_update`` / ``find_one_and_delete``, ``bulk_write`` (duplicate
+  keys reported per op in a ``BulkWriteError``, as the server does)
+- query operators ``$eq $ne $in $nin $gt $gte $lt $lte $exists $regex $type``
+  and ``$and $or $nor``, dotted paths
+- ``create_index`` (compound, unique) used both for unique constraints and
+  to answer equality / ``$in`` lookups on an index prefix without a scan
+
+Both backends publish command monitoring events to the ``CommandListener``
+objects among ``event_listeners``; the in-memory store reports each
+collection call as the MongoDB command it stands in for (and has no
+connection pool for pool listeners to observe).
+"""
+import copy
+import functools
+import itertools
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+STORAGE_BACKENDS = ("mongo", "memory")
+
+_MISSING = object()
+
+
+def connect(env, event_listeners: Optional[List[Any]] = None) -> Tuple[Any, Any]:
+    """Create the client and database handle selected by ``STORAGE_BACKEND``"""
+    backend = env.get("STORAGE_BACKEND", "mongo")
+    if backend == "mongo":
+        from motor.motor_asyncio import AsyncIOMotorClient
+        import connection
+        client = AsyncIOMotorClient(env["MONGO_URL"], event_listeners=event_listeners or [],
+                                    **connection.client_options(env))
+        return client, connection.RetryingDatabase(client[env["DB_NAME"]], connection.RetryPolicy.from_env(env))
+    if backend == "memory":
+        client = MemoryClient([l for l in event_listeners or [] if isinstance(l, monitoring.CommandListener)])
+        return client, client[env.get("DB_NAME", "bar_stock")]
+    raise ValueError(f"STORAGE_BACKEND must be one of {', '.join(STORAGE_BACKENDS)}, got {backend!r}")
+
+
+# Value handling -------------------------------------------------------------
+
+def _to_bson(value):
+    """Store values the way MongoDB round-trips them: naive UTC datetimes at
+    millisecond precision, tuples as lists, deep copies of containers"""
+    if isinstance(value, dict):
+        return {k: _to_bson(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_bson(v) for v in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return ("__dict__",) + tuple((k, _hashable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return ("__list__",) + tuple(_hashable(v) for v in value)
+    return value
+
+
+def _resolve(doc, path: str) -> List[Any]:
+    """All values at a dotted path, descending into arrays of subdocuments"""
+    values = [doc]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    found.append(value[int(part)])
+                else:
+                    found.extend(v[part] for v in value if isinstance(v, dict) and part in v)
+        values = found
+    return values
+
+
+def _type_rank(value) -> int:
+    # MongoDB's cross-type sort order
+    if value is None or value is _MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+# ``$type`` aliases, by the rank (and Python types) they cover
+_TYPE_ALIASES = {
+    "null": (1, None), "number": (2, None), "double": (2, float), "int": (2, int), "long": (2, int),
+    "string": (3, None), "object": (4, None), "array": (5, None), "objectId": (7, None), "bool": (8, None),
+    "date": (9, None),
+}
+
+
+def _has_type(value, alias: str) -> bool:
+    if alias not in _TYPE_ALIASES:
+        raise NotImplementedError(f"$type {alias!r} is not supported by the memory backend")
+    rank, python_type = _TYPE_ALIASES[alias]
+    return _type_rank(value) == rank and (python_type is None or isinstance(value, python_type))
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank in (2, 3, 7, 8, 9):
+        return rank, value
+    if rank in (4, 5):
+        return rank, repr(value)
+    return rank, 0
+
+
+def _compare(a, b, op: str) -> bool:
+    if _type_rank(a) != _type_rank(b) or _type_rank(a) in (1, 4, 5):
+        return False
+    if op == "$gt":
+        return a > b
+    if op == "$gte":
+        return a >= b
+    if op == "$lt":
+        return a < b
+    return a <= b
+
+
+# Query matching -------------------------------------------------------------
+
+def _equals(values: List[Any], target) -> bool:
+    if target is None:
+        return not values or any(v is None for v in values)
+    for v in values:
+        if v == target and _type_rank(v) == _type_rank(target):
+            return True
+        if isinstance(v, list) and not isinstance(target, list) and target in v:
+            return True
+    return False
+
+
+def _match_field(doc, path: str, cond) -> bool:
+    values = _resolve(doc, path)
+    if not (isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond)):
+        return _equals(values, cond)
+
+    flat = []
+    for v in values:
+        flat.extend(v if isinstance(v, list) else [v])
+    for op, arg in cond.items():
+        if op == "$eq":
+            ok = _equals(values, arg)
+        elif op == "$ne":
+            ok = not _equals(values, arg)
+        elif op == "$in":
+            ok = any(_equals(values, a) for a in arg)
+        elif op == "$nin":
+            ok = not any(_equals(values, a) for a in arg)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            ok = any(_compare(v, arg, op) for v in flat)
+        elif op == "$exists":
+            ok = bool(values) == bool(arg)
+        elif op == "$type":
+            aliases = arg if isinstance(arg, list) else [arg]
+            ok = any(_has_type(v, a) for v in values + flat for a in aliases)
+        elif op == "$regex":
+            pattern = re.compile(arg, re.IGNORECASE if "i" in cond.get("$options", "") else 0)
+            ok = any(isinstance(v, str) and pattern.search(v) for v in flat)
+        elif op == "$options":
+            ok = True
+        elif op == "$not":
+            ok = not _match_field(doc, path, arg)
+        else:
+            raise NotImplementedError(f"Query operator {op} is not supported by the memory backend")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, cond in (query or {}).items():
+        if key == "$and":
+            ok = all(matches(doc, q) for q in cond)
+        elif key == "$or":
+            ok = any(matches(doc, q) for q in cond)
+        elif key == "$nor":
+            ok = not any(matches(doc, q) for q in cond)
+        elif key.startswith("$"):
+            raise NotImplementedError(f"Query operator {key} is not supported by the memory backend")
+        else:
+            ok = _match_field(doc, key, cond)
+        if not ok:
+            return False
+    return True
+
+
+# Projection and updates -----------------------------------------------------
+
+def _get_parent(doc: dict, path: str, create: bool):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list) and part.isdigit():
+            target = target[int(part)]
+            continue
+        if part not in target or not isinstance(target[part], (dict, list)):
+            if not create:
+                return None, parts[-1]
+            target[part] = {}
+        target = target[part]
+    return target, parts[-1]
+
+
+def _set_path(doc: dict, path: str, value) -> None:
+    parent, last = _get_parent(doc, path, create=True)
+    if isinstance(parent, list) and last.isdigit():
+        parent[int(last)] = value
+    else:
+        parent[last] = value
+
+
+def _get_path(doc: dict, path: str, default=None):
+    parent, last = _get_parent(doc, path, create=False)
+    if isinstance(parent, dict):
+        return parent.get(last, default)
+    return default
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        out = {}
+        if include_id and "_id" in doc:
+            out["_id"] = doc["_id"]
+        for path in fields:
+            value = _get_path(doc, path, _MISSING)
+            if value is not _MISSING:
+                _set_path(out, path, copy.deepcopy(value))
+        return out
+    out = copy.deepcopy(doc)
+    for path in fields:
+        parent, last = _get_parent(out, path, create=False)
+        if isinstance(parent, dict):
+            parent.pop(last, None)
+    if not include_id:
+        out.pop("_id", None)
+    return out
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool = False) -> None:
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set_path(doc, path, _to_bson(value))
+            elif op == "$setOnInsert":
+                continue
+            elif op == "$inc":
+                _set_path(doc, path, _get_path(doc, path, 0) + value)
+            elif op == "$unset":
+                parent, last = _get_parent(doc, path, create=False)
+                if isinstance(parent, dict):
+                    parent.pop(last, None)
+            elif op == "$push":
+                current = _get_path(doc, path, None)
+                current = list(current) if current is not None else []
+                if isinstance(value, dict) and "$each" in value:
+                    current.extend(_to_bson(value["$each"]))
+                    if "$slice" in value:
+                        n = value["$slice"]
+                        current = current[n:] if n < 0 else current[:n]
+                else:
+                    current.append(_to_bson(value))
+                _set_path(doc, path, current)
+            elif op in ("$min", "$max"):
+                current = _get_path(doc, path, _MISSING)
+                value = _to_bson(value)
+                if current is _MISSING or _compare(value, current, "$lt" if op == "$min" else "$gt"):
+                    _set_path(doc, path, value)
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported by the memory backend")
+
+
+def _is_operator_update(update: dict) -> bool:
+    return bool(update) and all(k.startswith("$") for k in update)
+
+
+def _upsert_seed(query: dict) -> dict:
+    """Equality fields of a filter, which an upsert copies into the new document"""
+    seed = {}
+    for key, cond in query.items():
+        if key == "$and":
+            for sub in cond:
+                seed.update(_upsert_seed(sub))
+        elif key.startswith("$"):
+            continue
+        elif isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            if "$eq" in cond:
+                _set_path(seed, key, copy.deepcopy(cond["$eq"]))
+        else:
+            _set_path(seed, key, copy.deepcopy(cond))
+    return seed
+
+
+# Indexes --------------------------------------------------------------------
+
+class _Index:
+    """Compound index kept as one hash map per key prefix length, so an
+    equality match on the first N fields is a dictionary lookup"""
+
+    def __init__(self, name: str, keys: List[Tuple[str, int]], unique: bool):
+        self.name = name
+        self.keys = keys
+        self.fields = [k for k, _ in keys]
+        self.unique = unique
+        self.prefixes: List[Dict[tuple, set]] = [{} for _ in self.fields]
+
+    def entries(self, doc: dict) -> set:
+        per_field = []
+        for field in self.fields:
+            values = _resolve(doc, field)
+            expanded = []
+            for v in values or [None]:
+                if isinstance(v, list):
+                    expanded.extend(_hashable(x) for x in v or [None])
+                else:
+                    expanded.append(_hashable(v))
+            per_field.append(expanded)
+        return set(itertools.product(*per_field))
+
+    def add(self, doc_id: int, doc: dict) -> None:
+        for key in self.entries(doc):
+            for n, level in enumerate(self.prefixes, start=1):
+                level.setdefault(key[:n], set()).add(doc_id)
+
+    def remove(self, doc_id: int, doc: dict) -> None:
+        for key in self.entries(doc):
+            for n, level in enumerate(self.prefixes, start=1):
+                ids = level.get(key[:n])
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del level[key[:n]]
+
+    def conflict(self, doc_id: int, doc: dict) -> Optional[tuple]:
+        if not self.unique:
+            return None
+        full = self.prefixes[-1]
+        for key in self.entries(doc):
+            if full.get(key, set()) - {doc_id}:
+                return key
+        return None
+
+    def lookup_values(self, query: dict) -> List[List[Any]]:
+        """Equality / $in values the query pins on this index's leading fields"""
+        pinned = []
+        for field in self.fields:
+            cond = query.get(field, _MISSING)
+            if cond is _MISSING:
+                break
+            if isinstance(cond, dict):
+                if set(cond) == {"$eq"}:
+                    cond = cond["$eq"]
+                elif set(cond) == {"$in"} and not any(isinstance(v, (dict, list)) for v in cond["$in"]):
+                    pinned.append([_hashable(v) for v in cond["$in"]])
+                    continue
+                else:
+                    break
+            if isinstance(cond, (dict, list)):
+                break
+            pinned.append([cond])
+        return pinned
+
+    def lookup(self, pinned: List[List[Any]]) -> set:
+        level = self.prefixes[len(pinned) - 1]
+        ids = set()
+        for key in itertools.product(*pinned):
+            ids |= level.get(key, set())
+        return ids
+
+    def info(self) -> dict:
+        info = {"key": list(self.keys)}
+        if self.unique:
+            info["unique"] = True
+        return info
+
+
+def _index_keys(keys) -> List[Tuple[str, int]]:
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    return [(k, d) for k, d in keys]
+
+
+# Command monitoring ---------------------------------------------------------
+
+class CommandEvent:
+    """Stand-in for PyMongo's CommandStarted/Succeeded/FailedEvent"""
+    __slots__ = ("command_name", "command", "database_name", "request_id", "operation_id",
+                 "connection_id", "duration_micros", "reply", "failure")
+
+    def __init__(self, command_name: str, command: dict, database_name: str, request_id: int):
+        self.command_name = command_name
+        self.command = command
+        self.database_name = database_name
+        self.request_id = request_id
+        self.operation_id = request_id
+        self.connection_id = ("memory", 0)
+        self.duration_micros = 0
+        self.reply = {"ok": 1}
+        self.failure = None
+
+
+_request_ids = itertools.count(1)
+
+
+def _monitored(command_name: str, describe: Callable[..., dict]):
+    """Publish started/succeeded/failed events around a collection call"""
+    def decorate(method):
+        @functools.wraps(method)
+        async def run(self, *args, **kwargs):
+            listeners = self._listeners
+            if not listeners:
+                return await method(self, *args, **kwargs)
+            command = {command_name: self.name}
+            command.update(describe(*args, **kwargs))
+            event = CommandEvent(command_name, command, self.database_name, next(_request_ids))
+            for listener in listeners:
+                listener.started(event)
+            started = time.perf_counter()
+            try:
+                result = await method(self, *args, **kwargs)
+            except Exception as exc:
+                event.duration_micros = int((time.perf_counter() - started) * 1e6)
+                event.failure = {"errmsg": str(exc)}
+                for listener in listeners:
+                    listener.failed(event)
+                raise
+            event.duration_micros = int((time.perf_counter() - started) * 1e6)
+            for listener in listeners:
+                listener.succeeded(event)
+            return result
+        return run
+    return decorate
+
+
+def _update_arg(filter=None, update=None, *args, upsert: bool = False, **kwargs) -> dict:
+    return {"updates": [{"q": filter or {}, "u": update, "upsert": upsert}]}
+
+
+def _documents_arg(documents=None, *args, **kwargs) -> dict:
+    return {"documents": documents if isinstance(documents, list) else [documents]}
+
+
+def _delete_arg(filter=None, *args, **kwargs) -> dict:
+    return {"deletes": [{"q": filter or {}}]}
+
+
+def _query_arg(filter=None, *args, **kwargs) -> dict:
+    return {"query": filter or {}}
+
+
+def _bulk_arg(requests=None, *args, **kwargs) -> dict:
+    return {"ops": [type(op).__name__ for op in requests or []]}
+
+
+def _index_arg(keys=None, *args, **kwargs) -> dict:
+    return {"indexes": [{"key": _index_keys(keys)}]}
+
+
+# Collections ----------------------------------------------------------------
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: Optional[dict], projection: Optional[dict]):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1) -> "MemoryCursor":
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, n: int) -> "MemoryCursor":
+        self._skip = n
+        return self
+
+    def limit(self, n: int) -> "MemoryCursor":
+        self._limit = n
+        return self
+
+    def _results(self) -> List[dict]:
+        docs = self._collection._select(self._query)
+        for field, direction in reversed(self._sort):
+            docs.sort(key=lambda d: _sort_key((_resolve(d, field) or [None])[0]), reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(d, self._projection) for d in docs]
+
+    def _command(self) -> dict:
+        command = {"filter": self._query}
+        if self._sort:
+            command["sort"] = dict(self._sort)
+        if self._limit:
+            command["limit"] = self._limit
+        return command
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = await self._collection._find(self)
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self._collection._find(self):
+            yield doc
+
+
+class MemoryCollection:
+    def __init__(self, name: str, database_name: str = "", listeners: Optional[List[Any]] = None):
+        self.name = name
+        self.database_name = database_name
+        self._listeners = listeners or []
+        self._docs: Dict[int, dict] = {}
+        self._ids: Dict[Any, int] = {}
+        self._indexes: Dict[str, _Index] = {}
+        self._seq = itertools.count()
+
+    # Internals
+
+    def _select(self, query: dict) -> List[dict]:
+        query = _to_bson(query or {})
+        candidates = None
+        if "_id" in query and not isinstance(query["_id"], dict):
+            doc_id = self._ids.get(_hashable(query["_id"]))
+            candidates = [doc_id] if doc_id is not None else []
+        else:
+            best = []
+            best_index = None
+            for index in self._indexes.values():
+                pinned = index.lookup_values(query)
+                if len(pinned) > len(best):
+                    best, best_index = pinned, index
+            if best_index is not None:
+                candidates = sorted(best_index.lookup(best))
+        if candidates is None:
+            docs = self._docs.values()
+        else:
+            docs = (self._docs[i] for i in candidates)
+        return [d for d in docs if matches(d, query)]
+
+    def _check_unique(self, doc_id: int, doc: dict) -> None:
+        for index in self._indexes.values():
+            key = index.conflict(doc_id, doc)
+            if key is not None:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {index.name} dup key: {key}"
+                )
+        existing = self._ids.get(_hashable(doc["_id"]))
+        if existing is not None and existing != doc_id:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+
+    def _insert(self, doc: dict) -> Any:
+        doc = _to_bson(doc)
+        doc.setdefault("_id", ObjectId())
+        doc_id = next(self._seq)
+        self._check_unique(doc_id, doc)
+        self._docs[doc_id] = doc
+        self._ids[_hashable(doc["_id"])] = doc_id
+        for index in self._indexes.values():
+            index.add(doc_id, doc)
+        return doc["_id"]
+
+    def _doc_id(self, doc: dict) -> int:
+        return self._ids[_hashable(doc["_id"])]
+
+    def _write(self, doc: dict, new_doc: dict) -> bool:
+        """Swap a stored document for its updated version, keeping indexes in step"""
+        if new_doc == doc:
+            return False
+        doc_id = self._doc_id(doc)
+        self._check_unique(doc_id, new_doc)
+        for index in self._indexes.values():
+            index.remove(doc_id, doc)
+            index.add(doc_id, new_doc)
+        self._docs[doc_id] = new_doc
+        return True
+
+    def _update(self, query: dict, update: dict, upsert: bool, multi: bool, replace: bool = False) -> dict:
+        if replace and _is_operator_update(update):
+            raise ValueError("replacement document must not contain update operators")
+        if not replace and not _is_operator_update(update):
+            raise ValueError("update document must contain only update operators")
+        docs = self._select(query)
+        if not multi:
+            docs = docs[:1]
+        modified = 0
+        for doc in docs:
+            if replace:
+                new_doc = _to_bson(update)
+                new_doc["_id"] = doc["_id"]
+            else:
+                new_doc = copy.deepcopy(doc)
+                _apply_update(new_doc, update)
+            modified += self._write(doc, new_doc)
+        if docs or not upsert:
+            return {"n": len(docs), "nModified": modified}
+
+        if replace:
+            new_doc = _to_bson(update)
+            if "_id" in query and not isinstance(query["_id"], dict):
+                new_doc.setdefault("_id", query["_id"])
+        else:
+            new_doc = _to_bson(_upsert_seed(query))
+            _apply_update(new_doc, update, inserting=True)
+        upserted_id = self._insert(new_doc)
+        return {"n": 1, "nModified": 0, "upserted": upserted_id}
+
+    def _delete(self, query: dict, multi: bool) -> List[dict]:
+        docs = self._select(query)
+        if not multi:
+            docs = docs[:1]
+        for doc in docs:
+            doc_id = self._doc_id(doc)
+            for index in self._indexes.values():
+                index.remove(doc_id, doc)
+            del self._docs[doc_id]
+            del self._ids[_hashable(doc["_id"])]
+        return docs
+
+    # Motor-compatible API
+
+    @_monitored("find", lambda cursor: cursor._command())
+    async def _find(self, cursor: MemoryCursor) -> List[dict]:
+        return cursor._results()
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> MemoryCursor:
+        return MemoryCursor(self, filter, projection)
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, sort=None):
+        cursor = self.find(filter, projection)
+        if sort:
+            cursor.sort(sort)
+        results = await self._find(cursor.limit(1))
+        return results[0] if results else None
+
+    @_monitored("count", _query_arg)
+    async def count_documents(self, filter: Optional[dict] = None) -> int:
+        return len(self._select(filter or {}))
+
+    async def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+    @_monitored("distinct", lambda key=None, filter=None, **kw: {"key": key, "query": filter or {}})
+    async def distinct(self, key: str, filter: Optional[dict] = None) -> List[Any]:
+        seen = {}
+        for doc in self._select(filter or {}):
+            for value in _resolve(doc, key):
+                for v in value if isinstance(value, list) else [value]:
+                    seen.setdefault(_hashable(v), v)
+        return list(seen.values())
+
+    @_monitored("insert", _documents_arg)
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        inserted_id = self._insert(document)
+        # Like PyMongo, hand the generated _id back on the caller's dict
+        document.setdefault("_id", inserted_id)
+        return InsertOneResult(inserted_id, True)
+
+    @_monitored("insert", _documents_arg)
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True) -> InsertManyResult:
+        ids = []
+        for document in documents:
+            inserted_id = self._insert(document)
+            document.setdefault("_id", inserted_id)
+            ids.append(inserted_id)
+        return InsertManyResult(ids, True)
+
+    @_monitored("update", _update_arg)
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    @_monitored("update", _update_arg)
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    @_monitored("update", _update_arg)
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False, replace=True), True)
+
+    @_monitored("delete", _delete_arg)
+    async def delete_one(self, filter: dict) -> DeleteResult:
+        return DeleteResult({"n": len(self._delete(filter, multi=False))}, True)
+
+    @_monitored("delete", _delete_arg)
+    async def delete_many(self, filter: dict) -> DeleteResult:
+        return DeleteResult({"n": len(self._delete(filter, multi=True))}, True)
+
+    @_monitored("findAndModify", _query_arg)
+    async def find_one_and_delete(self, filter: dict, projection: Optional[dict] = None, sort=None):
+        cursor = self.find(filter, {"_id": 1}).limit(1)
+        if sort:
+            cursor.sort(sort)
+        found = cursor._results()
+        doc = found[0] if found else None
+        if doc is None:
+            return None
+        deleted = self._delete({"_id": doc["_id"]}, multi=False)
+        return _project(deleted[0], projection)
+
+    @_monitored("findAndModify", _query_arg)
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None,
+                                  sort=None, upsert: bool = False,
+                                  return_document: bool = ReturnDocument.BEFORE):
+        cursor = self.find(filter).limit(1)
+        if sort:
+            cursor.sort(sort)
+        found = cursor._results()
+        if not found:
+            if not upsert:
+                return None
+            result = self._update(filter, update, upsert=True, multi=False)
+            if return_document == ReturnDocument.BEFORE:
+                return None
+            return self.find({"_id": result["upserted"]}, projection)._results()[0]
+        before = found[0]
+        self._update({"_id": before["_id"]}, update, upsert=False, multi=False)
+        if return_document == ReturnDocument.BEFORE:
+            return _project(before, projection)
+        return self.find({"_id": before["_id"]}, projection)._results()[0]
+
+    @_monitored("bulkWrite", _bulk_arg)
+    async def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+                  "writeErrors": []}
+        for position, op in enumerate(requests):
+            try:
+                self._bulk_op(op, position, result)
+            except DuplicateKeyError as e:
+                # Like the server: report per-op errors, after the rest of the batch unless ordered
+                result["writeErrors"].append({"index": position, "code": 11000, "errmsg": str(e), "op": op})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        del result["writeErrors"]
+        return BulkWriteResult(result, True)
+
+    def _bulk_op(self, op: Any, position: int, result: dict) -> None:
+        if isinstance(op, InsertOne):
+            self._insert(op._doc)
+            result["nInserted"] += 1
+            return
+        if isinstance(op, (DeleteOne, DeleteMany)):
+            result["nRemoved"] += len(self._delete(op._filter, multi=isinstance(op, DeleteMany)))
+            return
+        if isinstance(op, ReplaceOne):
+            raw = self._update(op._filter, op._doc, op._upsert, multi=False, replace=True)
+        elif isinstance(op, (UpdateOne, UpdateMany)):
+            raw = self._update(op._filter, op._doc, op._upsert, multi=isinstance(op, UpdateMany))
+        else:
+            raise NotImplementedError(f"{type(op).__name__} is not supported by the memory backend")
+        if "upserted" in raw:
+            result["nUpserted"] += 1
+            result["upserted"].append({"index": position, "_id": raw["upserted"]})
+        else:
+            result["nMatched"] += raw["n"]
+            result["nModified"] += raw["nModified"]
+
+    @_monitored("createIndexes", _index_arg)
+    async def create_index(self, keys, unique: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        keys = _index_keys(keys)
+        name = name or "_".join(f"{k}_{d}" for k, d in keys)
+        if name in self._indexes:
+            return name
+        index = _Index(name, keys, unique)
+        for doc_id, doc in self._docs.items():
+            if index.conflict(doc_id, doc) is not None:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}")
+            index.add(doc_id, doc)
+        self._indexes[name] = index
+        return name
+
+    async def drop_index(self, name: str) -> None:
+        self._indexes.pop(name, None)
+
+    async def index_information(self) -> dict:
+        info = {"_id_": {"key": [("_id", 1)]}}
+        info.update({name: index.info() for name, index in self._indexes.items()})
+        return info
+
+    async def drop(self) -> None:
+        self.__init__(self.name, self.database_name, self._listeners)
+
+
+class MemoryDatabase:
+    def __init__(self, name: str, listeners: Optional[List[Any]] = None):
+        self.name = name
+        self._listeners = listeners or []
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(name, self.name, self._listeners)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    async def command(self, command, *args, **kwargs) -> dict:
+        if command == "ping" or command == {"ping": 1}:
+            return {"ok": 1.0}
+        raise NotImplementedError(f"Command {command!r} is not supported by the memory backend")
+
+
+class MemoryClient:
+    def __init__(self, event_listeners: Optional[List[Any]] = None):
+        self._listeners = list(event_listeners or [])
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(name, self._listeners)
+        return database
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def close(self) -> None:
+        pass
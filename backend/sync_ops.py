@@ -0,0 +1,125 @@
+"""Offline operation-log ingestion.
+
+Counting devices queue edits while offline and flush them as a batch of
+operations, each with a client-generated ``op_id`` and the device timestamp
+of the edit. ``plan_ops`` works out what the batch does against the current
+documents without touching the database:
+
+- ops already recorded in ``applied_ops`` (or repeated in the batch) are
+  ``duplicate`` and skipped
+- ops are applied in device-time order; every count location and order
+  quantity remembers the timestamp of its last write, and an op older than
+  that is ``stale`` (a newer edit already won) rather than applied
+- ops for unknown items or locations are ``rejected`` and not recorded, so
+  the device can drop them
+
+All ops set absolute values, so re-applying one is harmless; the op log is
+what keeps a late retry from overwriting a newer edit.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+OP_TYPES = ("count_set", "case_count_set", "order_qty_set")
+LOCATIONS = ("main_bar", "beer_bar", "lobby", "storage_room")
+
+
+def as_utc(when: datetime) -> datetime:
+    """Naive UTC, the form MongoDB hands datetimes back in"""
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def _newer_or_equal(when: datetime, last: Optional[datetime]) -> bool:
+    return last is None or when >= as_utc(last)
+
+
+def plan_ops(ops: List[dict], applied_op_ids: set, items: Dict[str, dict], counts: Dict[str, dict],
+             order_quantities: Dict[str, dict]) -> dict:
+    """Resolve a batch of ops against current state.
+
+    Returns ``results`` (one per op, in request order), ``counts`` and
+    ``order_quantities`` (item_id -> updated document, only for items that
+    changed), ``locations`` (item_id -> the count locations written) and
+    ``records`` (ops to store in the op log).
+    """
+    results: Dict[int, dict] = {}
+    seen = set(applied_op_ids)
+    pending = []
+    for index, op in enumerate(ops):
+        if op["op_id"] in seen:
+            results[index] = {"op_id": op["op_id"], "status": "duplicate"}
+            continue
+        seen.add(op["op_id"])
+        error = _validate(op, items)
+        if error:
+            results[index] = {"op_id": op["op_id"], "status": "rejected", "error": error}
+            continue
+        pending.append((as_utc(op["device_ts"]), index, op))
+
+    new_counts: Dict[str, dict] = {}
+    new_quantities: Dict[str, dict] = {}
+    locations: Dict[str, List[str]] = {}
+    records = []
+    for device_ts, index, op in sorted(pending, key=lambda p: (p[0], p[1])):
+        item_id = op["item_id"]
+        if op["type"] == "order_qty_set":
+            doc = new_quantities.get(item_id) or dict(order_quantities.get(item_id) or {"item_id": item_id})
+            applied = _newer_or_equal(device_ts, doc.get("updated_at"))
+            if applied:
+                doc["quantity"] = op["value"]
+                doc["updated_at"] = device_ts
+                new_quantities[item_id] = doc
+        else:
+            doc = new_counts.get(item_id) or _count_copy(counts.get(item_id), item_id)
+            location = op["location"]
+            stamps = doc["location_updated_at"]
+            applied = _newer_or_equal(device_ts, stamps.get(location))
+            if applied:
+                if op["type"] == "case_count_set":
+                    units_per_case = items[item_id].get("units_per_case", 1) or 1
+                    value = op.get("cases", 0) * units_per_case + op.get("singles", 0)
+                else:
+                    value = op["value"]
+                doc[location] = value
+                stamps[location] = device_ts
+                doc["total_count"] = sum(doc.get(loc, 0) for loc in LOCATIONS)
+                new_counts[item_id] = doc
+                if location not in locations.setdefault(item_id, []):
+                    locations[item_id].append(location)
+        status = "applied" if applied else "stale"
+        results[index] = {"op_id": op["op_id"], "status": status}
+        records.append({**op, "device_ts": device_ts, "status": status})
+
+    return {
+        "results": [results[i] for i in range(len(ops))],
+        "counts": new_counts,
+        "order_quantities": new_quantities,
+        "locations": locations,
+        "records": records,
+    }
+
+
+def _validate(op: dict, items: Dict[str, dict]) -> Optional[str]:
+    if op["type"] not in OP_TYPES:
+        return f"type must be one of {', '.join(OP_TYPES)}"
+    if op["item_id"] not in items:
+        return "Item not found"
+    if op["type"] == "order_qty_set":
+        if op.get("value") is None or op["value"] < 0:
+            return "value must be a non-negative quantity"
+        return None
+    if op.get("location") not in LOCATIONS:
+        return f"location must be one of {', '.join(LOCATIONS)}"
+    if op["type"] == "count_set" and op.get("value") is None:
+        return "value is required"
+    return None
+
+
+def _count_copy(count: Optional[dict], item_id: str) -> dict:
+    doc = {loc: 0 for loc in LOCATIONS}
+    doc.update({"item_id": item_id, "total_count": 0})
+    if count:
+        doc.update(count)
+    doc["location_updated_at"] = dict(doc.get("location_updated_at") or {})
+    return doc
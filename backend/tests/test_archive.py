@@ -0,0 +1,89 @@
+"""
+Tests for history archival:
+1. Dry runs report what would be archived without moving anything
+2. Archived sessions and purchases leave the hot collections, with rollups listed
+3. Reading an archived session returns 409 until its month is restored
+4. Restoring a month brings the rows back unchanged
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+VENUE = {"X-Venue-Id": "TEST_archive"}
+
+
+def restore_all():
+    for archived in requests.get(f"{BASE_URL}/api/archive", headers=VENUE, timeout=10).json():
+        requests.post(f"{BASE_URL}/api/archive/{archived['collection']}/{archived['month']}/restore", headers=VENUE, timeout=10)
+
+
+@pytest.fixture
+def saved_session():
+    item = {
+        "name": "TEST_Archive_Item",
+        "category": "B",
+        "category_name": "Beer",
+        "units_per_case": 24,
+        "primary_supplier": "Singha99",
+        "cost_per_unit": 10.0
+    }
+    created = requests.post(f"{BASE_URL}/api/items", json=item, headers=VENUE, timeout=10).json()
+    requests.put(f"{BASE_URL}/api/stock-counts/{created['id']}", json={"main_bar": 6}, headers=VENUE, timeout=10)
+    session = requests.post(f"{BASE_URL}/api/stock-sessions", json={"session_name": "TEST_Archive_Session"},
+                            headers=VENUE, timeout=10).json()
+    requests.post(f"{BASE_URL}/api/stock-sessions/{session['id']}/save-counts", headers=VENUE, timeout=10)
+    requests.post(f"{BASE_URL}/api/purchases", json={
+        "session_id": session['id'], "item_id": created['id'], "planned_quantity": 24, "actual_quantity": 24,
+        "cost_per_unit": 10.0, "total_cost": 240.0, "supplier": "Singha99"
+    }, headers=VENUE, timeout=10)
+    yield session
+    restore_all()
+    requests.delete(f"{BASE_URL}/api/items/{created['id']}", headers=VENUE, timeout=10)
+
+
+class TestArchive:
+
+    def test_dry_run_moves_nothing(self, saved_session):
+        response = requests.post(f"{BASE_URL}/api/archive/run", params={"older_than_days": 0, "dry_run": True},
+                                 headers=VENUE, timeout=10)
+        assert response.status_code == 200
+        collections = {a['collection'] for a in response.json()['archived']}
+        assert {"historical_counts", "purchases"} <= collections
+
+        counts = requests.get(f"{BASE_URL}/api/stock-sessions/{saved_session['id']}/counts", headers=VENUE, timeout=10)
+        assert counts.status_code == 200
+        assert len(counts.json()) >= 1
+        print("✓ Dry run leaves history in place")
+
+    def test_archive_and_restore(self, saved_session):
+        before = requests.get(f"{BASE_URL}/api/stock-sessions/{saved_session['id']}/counts", headers=VENUE, timeout=10).json()
+
+        response = requests.post(f"{BASE_URL}/api/archive/run", params={"older_than_days": 0}, headers=VENUE, timeout=10)
+        assert response.status_code == 200
+        archived = response.json()['archived']
+        assert any(a['collection'] == "historical_counts" for a in archived)
+
+        purchases = requests.get(f"{BASE_URL}/api/purchases/session/{saved_session['id']}", headers=VENUE, timeout=10).json()
+        assert purchases == []
+        counts = requests.get(f"{BASE_URL}/api/stock-sessions/{saved_session['id']}/counts", headers=VENUE, timeout=10)
+        assert counts.status_code == 409
+
+        listed = requests.get(f"{BASE_URL}/api/archive", params={"collection": "purchases"}, headers=VENUE, timeout=10).json()
+        assert listed and all('data' not in a for a in listed)
+        assert sum(a['rollup']['total_cost'] for a in listed) >= 240.0
+
+        restore_all()
+        after = requests.get(f"{BASE_URL}/api/stock-sessions/{saved_session['id']}/counts", headers=VENUE, timeout=10).json()
+        assert sorted(c['item_id'] for c in after) == sorted(c['item_id'] for c in before)
+        purchases = requests.get(f"{BASE_URL}/api/purchases/session/{saved_session['id']}", headers=VENUE, timeout=10).json()
+        assert len(purchases) == 1
+        print("✓ Archived month restored with its rows")
+
+    def test_restore_unknown(self):
+        response = requests.post(f"{BASE_URL}/api/archive/purchases/1999-01/restore", headers=VENUE, timeout=10)
+        assert response.status_code == 404
+        response = requests.post(f"{BASE_URL}/api/archive/items/1999-01/restore", headers=VENUE, timeout=10)
+        assert response.status_code == 400
+        print("✓ Unknown archives rejected")
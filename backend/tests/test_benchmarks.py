@@ -0,0 +1,57 @@
+"""
+Tests for the API benchmark suite (benchmarks/api_bench.py):
+1. Percentiles and regression comparison against a baseline
+2. A tiny end-to-end run on the in-memory store covers every scenario without errors
+3. The payload benchmark reports bytes and encoding cost for every endpoint
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import api_bench, payload_bench  # noqa: E402
+
+
+class TestBenchmarkSuite:
+
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        assert api_bench.percentile(values, 50) == 50.0
+        assert api_bench.percentile(values, 95) == 95.0
+        assert api_bench.percentile(values, 99) == 99.0
+        assert api_bench.percentile([], 95) == 0.0
+
+    def test_compare_flags_regressions_over_threshold(self):
+        baseline = {"results": {"100": {"items": {"p95_ms": 10.0}, "shopping_list": {"p95_ms": 10.0}}}}
+        current = {"results": {"100": {"items": {"p95_ms": 12.0}, "shopping_list": {"p95_ms": 20.0},
+                                       "new_scenario": {"p95_ms": 99.0}}}}
+        regressions = api_bench.compare(current, baseline, threshold=0.25, metric="p95_ms")
+        assert len(regressions) == 1
+        assert "shopping_list" in regressions[0]
+        print("✓ Only the >25% regression is reported")
+
+    def test_smoke_run(self, tmp_path):
+        output = tmp_path / "bench.json"
+        code = api_bench.main(["--sizes", "20", "--months", "1", "--requests", "3", "--concurrency", "2",
+                               "--output", str(output)])
+        assert code == 0
+        assert code == api_bench.main(["--sizes", "20", "--months", "1", "--requests", "3", "--concurrency", "2",
+                                       "--baseline", str(output), "--threshold", "1000"])
+        results = json.loads(output.read_text())["results"]["20"]
+        assert set(results) == {s.name for s in api_bench.SCENARIOS}
+        for name, stats in results.items():
+            assert stats["errors"] == 0, name
+            assert stats["requests"] > 0
+        print("✓ All scenarios ran without errors")
+
+    def test_payload_smoke_run(self, tmp_path):
+        output = tmp_path / "payload.json"
+        assert payload_bench.main(["--sizes", "20", "--months", "1", "--repeat", "1", "--output", str(output)]) == 0
+        results = json.loads(output.read_text())["results"]["20"]
+        assert set(results) == {e.name for e in payload_bench.ENDPOINTS}
+        for name, result in results.items():
+            for representation, sizes in result["bytes"].items():
+                assert set(sizes) == set(payload_bench.CODINGS), name
+                assert result["encode"][representation]["render_ms"] >= 0
+        assert results["items"]["bytes"]["json"]["br"] < results["items"]["bytes"]["json"]["identity"]
+        print("✓ Payload sizes measured for every endpoint")
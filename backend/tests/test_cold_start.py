@@ -0,0 +1,45 @@
+"""
+Tests for cold-start support:
+1. /healthz answers without the database and reports readiness
+2. Startup timings are reported after the first API request
+3. Seed data loads from its data file, with targets to restock to
+"""
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestColdStart:
+
+    def test_healthz(self):
+        response = requests.get(f"{BASE_URL}/healthz", timeout=10)
+        assert response.status_code == 200
+        data = response.json()
+        assert data['status'] == "ok"
+        assert data['ready'] is True
+        print(f"✓ Healthy, up {data['uptime_s']}s")
+
+    def test_startup_report(self):
+        requests.get(f"{BASE_URL}/api/", timeout=10)
+        report = requests.get(f"{BASE_URL}/api/debug/startup", timeout=10).json()
+        assert report['import_ms'] > 0
+        assert report['ready_ms'] >= report['import_ms']
+        assert {"connect", "indexes", "catalog"} <= set(report['phases_ms'])
+        assert report['first_api_request']['route'].startswith("/api/")
+        print(f"✓ Ready {report['ready_ms']}ms after import started")
+
+    def test_seed_data_loads(self):
+        seed_venue = {"X-Venue-Id": "TEST_cold_start_seed"}
+        response = requests.post(f"{BASE_URL}/api/initialize-real-data", params={"confirm": "YES_DELETE_ALL_DATA"},
+                                 headers=seed_venue, timeout=30)
+        assert response.status_code == 200
+        items = requests.get(f"{BASE_URL}/api/items", headers=seed_venue, timeout=10).json()
+        assert len(items) == response.json()['items_count'] > 0
+        assert all(item['target_stock'] > 0 and item['version'] == 1 for item in items)
+        # Nothing is counted yet, so every seeded item is on the shopping list
+        shopping = requests.get(f"{BASE_URL}/api/shopping-list", headers=seed_venue, timeout=10).json()
+        assert sum(len(lines) for lines in shopping.values()) == len(items)
+        for item in items:
+            requests.delete(f"{BASE_URL}/api/items/{item['id']}", headers=seed_venue, timeout=10)
+        print(f"✓ {len(items)} seed items loaded")
@@ -0,0 +1,99 @@
+"""
+Tests for confirming orders:
+1. Received quantities are added to stock and recorded as purchases
+2. Retrying a confirmation with the same order id changes nothing
+3. Lines for items not in the catalog are left out of costs and stock
+4. Malformed orders are rejected
+"""
+import requests
+import os
+import uuid
+import pytest
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+VENUE = {"X-Venue-Id": "TEST_confirmed_orders"}
+
+
+@pytest.fixture
+def item():
+    response = requests.post(f"{BASE_URL}/api/items", headers=VENUE, json={
+        "name": "TEST_Delivered Lager", "category": "B", "category_name": "Beer",
+        "units_per_case": 12, "primary_supplier": "TEST_Supplier", "cost_per_unit": 10.0,
+    }, timeout=10)
+    assert response.status_code == 200
+    item = response.json()
+    requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE,
+                 json={"main_bar": 3, "storage_room": 2}, timeout=10)
+    yield item
+    requests.delete(f"{BASE_URL}/api/items/{item['id']}", headers=VENUE, timeout=10)
+
+
+def order_for(item, **line):
+    return {
+        "id": f"TEST_{uuid.uuid4()}",
+        "supplier": "TEST_Supplier",
+        "status": "completed",
+        "items": [{**item, "orderQty": 2, "actualQty": 2, "isCase": True, "actualCost": 240.0, **line}],
+    }
+
+
+class TestConfirmedOrders:
+
+    def test_order_adds_stock_and_purchases(self, item):
+        session = requests.post(f"{BASE_URL}/api/stock-sessions", headers=VENUE,
+                                json={"session_name": "TEST_delivery session"}, timeout=10).json()
+        order = order_for(item)
+        response = requests.post(f"{BASE_URL}/api/orders", headers=VENUE, json=order, timeout=10)
+        assert response.status_code == 200
+        assert response.json()['items_received'] == 1
+
+        count = requests.get(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, timeout=10).json()
+        assert count['storage_room'] == 2 + 24
+        assert count['total_count'] == 3 + 2 + 24
+
+        purchases = requests.get(f"{BASE_URL}/api/purchases/session/{session['id']}", headers=VENUE, timeout=10).json()
+        purchase = next(p for p in purchases if p['order_id'] == order['id'])
+        assert purchase['actual_quantity'] == 24
+        assert purchase['cost_per_unit'] == 10.0
+        assert purchase['delivery_received'] is True
+
+        drift = requests.post(f"{BASE_URL}/api/valuation/recompute", headers=VENUE, timeout=10).json()
+        assert drift['drift'] == pytest.approx(0.0)
+        print("✓ Delivery added 24 units to the storage room")
+
+    def test_retry_is_a_no_op(self, item):
+        order = order_for(item, isCase=False, actualQty=5, actualCost=None)
+        first = requests.post(f"{BASE_URL}/api/orders", headers=VENUE, json=order, timeout=10)
+        retry = requests.post(f"{BASE_URL}/api/orders", headers=VENUE, json=order, timeout=10)
+        assert first.status_code == retry.status_code == 200
+        assert first.json()['duplicate'] is False
+        assert retry.json()['duplicate'] is True
+
+        count = requests.get(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, timeout=10).json()
+        assert count['storage_room'] == 2 + 5
+        orders = requests.get(f"{BASE_URL}/api/orders", headers=VENUE, timeout=10).json()
+        assert sum(1 for o in orders if o['id'] == order['id']) == 1
+        assert next(o for o in orders if o['id'] == order['id'])['receipt_status'] == "applied"
+        print("✓ Retried confirmation saved once")
+
+    def test_unknown_items_skipped(self, item):
+        order = order_for(item, isCase=False, actualQty=4, actualCost=None)
+        order['items'].append({"id": "TEST_missing-item", "actualQty": 6, "actualCost": 60.0})
+        response = requests.post(f"{BASE_URL}/api/orders", headers=VENUE, json=order, timeout=10)
+        assert response.status_code == 200
+        assert response.json()['items_received'] == 1
+
+        count = requests.get(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, timeout=10).json()
+        assert count['storage_room'] == 2 + 4
+        prices = requests.get(f"{BASE_URL}/api/items/TEST_missing-item/price-history", headers=VENUE, timeout=10).json()
+        assert prices == []
+        purchases = requests.get(f"{BASE_URL}/api/items/TEST_missing-item/history", headers=VENUE, timeout=10).json()
+        assert purchases['events'] == []
+        print("✓ Unknown item line left out")
+
+    def test_invalid_orders_rejected(self, item):
+        missing_id = {k: v for k, v in order_for(item).items() if k != "id"}
+        assert requests.post(f"{BASE_URL}/api/orders", headers=VENUE, json=missing_id, timeout=10).status_code == 422
+        bad_quantity = order_for(item, actualQty="two")
+        assert requests.post(f"{BASE_URL}/api/orders", headers=VENUE, json=bad_quantity, timeout=10).status_code == 422
+        print("✓ Malformed orders rejected")
@@ -0,0 +1,33 @@
+"""
+Tests for the connection manager diagnostics:
+1. /api/debug/pool reports pool settings, usage and retries
+2. Concurrent requests all succeed and leave no connection checked out
+"""
+import requests
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestConnectionPool:
+
+    def test_pool_report(self):
+        response = requests.get(f"{BASE_URL}/api/debug/pool", timeout=10)
+        assert response.status_code == 200
+        report = response.json()
+        assert report['options']['minPoolSize'] >= 0
+        for key in ('connections_open', 'checked_out', 'checkouts', 'checkout_failures', 'wait_ms'):
+            assert key in report['pool']
+        assert {'p50', 'p95', 'max'} <= set(report['pool']['wait_ms'])
+        print(f"✓ Pool: {report['pool']['connections_open']} open, {report['pool']['checkouts']} checkouts")
+
+    def test_concurrent_requests(self):
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            statuses = list(pool.map(lambda _: requests.get(f"{BASE_URL}/api/stock-counts", timeout=30).status_code,
+                                     range(30)))
+        assert statuses == [200] * 30
+
+        report = requests.get(f"{BASE_URL}/api/debug/pool", timeout=10).json()
+        assert report['pool']['checked_out'] <= report['pool']['connections_open']
+        print(f"✓ 30 concurrent requests, max {report['pool']['max_checked_out']} connections checked out")
@@ -0,0 +1,92 @@
+"""
+Tests for write-time count anomaly detection:
+1. Count write responses carry an 'anomaly' field
+2. A count far above expected usage is flagged and listed at /api/reports/anomalies
+3. Correcting the count resolves the open anomaly
+4. Negative counts are always flagged
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture
+def item_with_history():
+    """Item with three saved sessions using 10 units each (50 -> 40 -> 30)"""
+    item = {
+        "name": "TEST_Anomaly_Item",
+        "category": "B",
+        "category_name": "Beer",
+        "units_per_case": 24,
+        "target_stock": 48,
+        "primary_supplier": "Singha99",
+        "cost_per_unit": 30.0
+    }
+    response = requests.post(f"{BASE_URL}/api/items", json=item, timeout=10)
+    assert response.status_code == 200
+    created = response.json()
+
+    for total in (50, 40, 30):
+        requests.put(f"{BASE_URL}/api/stock-counts/{created['id']}", json={"main_bar": total}, timeout=10)
+        session = requests.post(f"{BASE_URL}/api/stock-sessions", json={"session_name": "TEST_Anomaly_Session"}, timeout=10).json()
+        requests.post(f"{BASE_URL}/api/stock-sessions/{session['id']}/save-counts", timeout=10)
+
+    yield created
+    requests.delete(f"{BASE_URL}/api/items/{created['id']}", timeout=10)
+
+
+def open_anomalies_for(item_id):
+    response = requests.get(f"{BASE_URL}/api/reports/anomalies", timeout=10)
+    assert response.status_code == 200
+    return [a for a in response.json() if a['item_id'] == item_id]
+
+
+class TestCountAnomalies:
+    """Tests for anomaly checks on PUT /api/stock-counts/{item_id}"""
+
+    def test_plausible_count_not_flagged(self, item_with_history):
+        response = requests.put(f"{BASE_URL}/api/stock-counts/{item_with_history['id']}", json={"main_bar": 21}, timeout=10)
+        assert response.status_code == 200
+        assert response.json()['anomaly'] is None
+        print("✓ Expected usage not flagged")
+
+    def test_typo_count_flagged(self, item_with_history):
+        # Expected ~20; 200 is a typo
+        response = requests.put(f"{BASE_URL}/api/stock-counts/{item_with_history['id']}", json={"main_bar": 200}, timeout=10)
+        assert response.status_code == 200
+        anomaly = response.json()['anomaly']
+        assert anomaly is not None
+        assert 'above_expected' in anomaly['reasons']
+        assert anomaly['expected_count'] == pytest.approx(20, abs=1)
+
+        flagged = open_anomalies_for(item_with_history['id'])
+        assert len(flagged) == 1
+        assert flagged[0]['item_name'] == "TEST_Anomaly_Item"
+        print(f"✓ Typo flagged: {anomaly['reasons']}")
+
+    def test_correction_resolves_anomaly(self, item_with_history):
+        requests.put(f"{BASE_URL}/api/stock-counts/{item_with_history['id']}", json={"main_bar": 200}, timeout=10)
+        assert len(open_anomalies_for(item_with_history['id'])) == 1
+
+        response = requests.put(f"{BASE_URL}/api/stock-counts/{item_with_history['id']}", json={"main_bar": 20}, timeout=10)
+        assert response.json()['anomaly'] is None
+        assert open_anomalies_for(item_with_history['id']) == []
+        print("✓ Recount resolved anomaly")
+
+    def test_manual_resolve(self, item_with_history):
+        requests.put(f"{BASE_URL}/api/stock-counts/{item_with_history['id']}", json={"main_bar": 200}, timeout=10)
+        anomaly_id = open_anomalies_for(item_with_history['id'])[0]['id']
+
+        response = requests.post(f"{BASE_URL}/api/reports/anomalies/{anomaly_id}/resolve", timeout=10)
+        assert response.status_code == 200
+        assert open_anomalies_for(item_with_history['id']) == []
+
+    def test_negative_count_flagged(self, item_with_history):
+        response = requests.put(f"{BASE_URL}/api/stock-counts/{item_with_history['id']}", json={"lobby": -5}, timeout=10)
+        assert 'negative_count' in response.json()['anomaly']['reasons']
+
+    def test_resolve_unknown_anomaly_404(self):
+        response = requests.post(f"{BASE_URL}/api/reports/anomalies/does-not-exist/resolve", timeout=10)
+        assert response.status_code == 404
@@ -0,0 +1,90 @@
+"""
+Tests for buffered stock count edits:
+1. Rapid edits to a count return the merged count with increasing versions
+2. Counts, valuation and session saves see edits that are still buffered
+3. A stale If-Match is still rejected with 409
+"""
+import requests
+import os
+import pytest
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+VENUE = {"X-Venue-Id": "TEST_count_buffer"}
+
+
+@pytest.fixture
+def item():
+    response = requests.post(f"{BASE_URL}/api/items", headers=VENUE, json={
+        "name": "TEST_Buffered Lager", "category": "B", "category_name": "Beer",
+        "units_per_case": 24, "primary_supplier": "TEST_Supplier", "cost_per_unit": 2.0,
+    }, timeout=10)
+    assert response.status_code == 200
+    item = response.json()
+    requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, json={"main_bar": 1}, timeout=10)
+    yield item
+    requests.delete(f"{BASE_URL}/api/items/{item['id']}", headers=VENUE, timeout=10)
+
+
+class TestCountBuffer:
+
+    def test_rapid_edits_merge(self, item):
+        versions = []
+        for n in range(2, 7):
+            response = requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE,
+                                    json={"main_bar": n, "lobby": n}, timeout=10)
+            assert response.status_code == 200
+            count = response.json()
+            assert count['total_count'] == 2 * n
+            versions.append(count['version'])
+        assert versions == sorted(versions) and len(set(versions)) == 5
+
+        single = requests.get(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, timeout=10).json()
+        assert single['total_count'] == 12
+        assert single['version'] == versions[-1]
+        print(f"✓ 5 edits merged, version {versions[-1]}")
+
+    def test_reads_see_buffered_edits(self, item):
+        requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, json={"lobby": 4}, timeout=10)
+        requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, json={"storage_room": 5}, timeout=10)
+
+        counts = requests.get(f"{BASE_URL}/api/stock-counts", headers=VENUE, timeout=10).json()
+        count = next(c for c in counts if c['item_id'] == item['id'])
+        assert (count['main_bar'], count['lobby'], count['storage_room'], count['total_count']) == (1, 4, 5, 10)
+
+        value = requests.get(f"{BASE_URL}/api/valuation", headers=VENUE, timeout=10).json()
+        assert value['total'] == pytest.approx(20.0)
+        drift = requests.post(f"{BASE_URL}/api/valuation/recompute", headers=VENUE, timeout=10).json()
+        assert drift['drift'] == pytest.approx(0.0)
+
+        session = requests.post(f"{BASE_URL}/api/stock-sessions", headers=VENUE,
+                                json={"session_name": "TEST_buffer session"}, timeout=10).json()
+        requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, json={"beer_bar": 3}, timeout=10)
+        saved = requests.post(f"{BASE_URL}/api/stock-sessions/{session['id']}/save-counts", headers=VENUE, timeout=10)
+        assert saved.status_code == 200
+        session_counts = requests.get(f"{BASE_URL}/api/stock-sessions/{session['id']}/counts",
+                                      headers=VENUE, timeout=10).json()
+        assert next(c for c in session_counts if c['item_id'] == item['id'])['total_count'] == 13
+        print("✓ Counts, valuation and session saves include buffered edits")
+
+    def test_stale_if_match_conflicts(self, item):
+        first = requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE,
+                             json={"lobby": 2}, timeout=10).json()
+        requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, json={"lobby": 3}, timeout=10)
+
+        stale = requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}",
+                             headers={**VENUE, "If-Match": f'"{first["version"]}"'}, json={"lobby": 9}, timeout=10)
+        assert stale.status_code == 409
+        assert stale.json()['detail']['current']['lobby'] == 3
+
+        current = requests.get(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, timeout=10)
+        fresh = requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}",
+                             headers={**VENUE, "If-Match": current.headers['ETag']}, json={"lobby": 9}, timeout=10)
+        assert fresh.status_code == 200
+        assert fresh.json()['lobby'] == 9
+        print("✓ Stale If-Match rejected, fresh one accepted")
+
+    def test_buffer_report(self):
+        report = requests.get(f"{BASE_URL}/api/debug/count-buffer", timeout=10).json()
+        for key in ('window_ms', 'pending', 'edits', 'flushes', 'documents_written', 'conflicts_merged'):
+            assert key in report
+        print(f"✓ {report['edits']} edits buffered, {report['documents_written']} documents written")
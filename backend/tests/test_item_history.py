@@ -0,0 +1,95 @@
+"""
+Tests for one item's history (/api/items/{id}/history):
+1. Saved counts and purchases come back as one timeline, newest first
+2. Each count carries the usage since the count before it
+3. Cursor pages cover the timeline exactly once; from/to narrow it
+"""
+import requests
+import os
+import pytest
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+VENUE = {"X-Venue-Id": "TEST_item_history"}
+
+
+def history(item_id, **params):
+    response = requests.get(f"{BASE_URL}/api/items/{item_id}/history", params=params, headers=VENUE, timeout=10)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture(scope="module")
+def item():
+    """Counted 10, bought 5, counted 12, bought 4, counted 8 (usage 3 then 8)"""
+    item = requests.post(f"{BASE_URL}/api/items", headers=VENUE, json={
+        "name": "TEST_History Chang", "category": "B", "category_name": "Beer",
+        "primary_supplier": "TEST_Supplier", "cost_per_unit": 30.0,
+    }, timeout=10).json()
+
+    def count_and_save(main_bar, name):
+        requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=VENUE, json={"main_bar": main_bar}, timeout=10)
+        session = requests.post(f"{BASE_URL}/api/stock-sessions", headers=VENUE, json={"session_name": name}, timeout=10).json()
+        response = requests.post(f"{BASE_URL}/api/stock-sessions/{session['id']}/save-counts", headers=VENUE, timeout=10)
+        assert response.status_code == 200
+        return session
+
+    def buy(session, quantity):
+        response = requests.post(f"{BASE_URL}/api/purchases", headers=VENUE, json={
+            "session_id": session['id'], "item_id": item['id'], "planned_quantity": quantity,
+            "actual_quantity": quantity, "cost_per_unit": 30.0, "total_cost": 30.0 * quantity,
+            "supplier": "TEST_Supplier",
+        }, timeout=10)
+        assert response.status_code == 200
+
+    first = count_and_save(10, "TEST_History 1")
+    buy(first, 5)
+    second = count_and_save(12, "TEST_History 2")
+    buy(second, 4)
+    count_and_save(8, "TEST_History 3")
+    yield item
+    requests.delete(f"{BASE_URL}/api/items/{item['id']}", headers=VENUE, timeout=10)
+
+
+class TestItemHistory:
+
+    def test_timeline_with_usage(self, item):
+        data = history(item['id'])
+        events = data['events']
+        assert [(e['type'], e.get('total_count', e.get('quantity'))) for e in events] == [
+            ("count", 8), ("purchase", 4), ("count", 12), ("purchase", 5), ("count", 10)]
+        assert [e['usage'] for e in events if e['type'] == "count"] == [8, 3, None]
+        assert [e['received'] for e in events if e['type'] == "count"][:2] == [4, 5]
+        assert data['next_cursor'] is None
+        print("✓ Counts and purchases merged, usage 3 then 8")
+
+    def test_cursor_pages(self, item):
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = history(item['id'], **params)
+            seen.extend(page['events'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert [e['type'] for e in seen] == ["count", "purchase", "count", "purchase", "count"]
+        # Usage on a page's oldest count still looks past the page
+        assert [e['usage'] for e in seen if e['type'] == "count"] == [8, 3, None]
+        print("✓ Pages of 2 cover the timeline once")
+
+    def test_date_range(self, item):
+        events = history(item['id'])['events']
+        middle = events[2]['date']
+        newer = history(item['id'], **{"from": middle})['events']
+        assert [e['type'] for e in newer] == ["count", "purchase", "count"]
+        assert newer[-1]['usage'] == 3  # Its previous count is before the range
+        older = history(item['id'], to=middle)['events']
+        assert [e['type'] for e in older] == ["count", "purchase", "count"]
+        print("✓ from/to narrow the timeline")
+
+    def test_unknown_item_and_bad_cursor(self, item):
+        assert history("missing-item")['events'] == []
+        response = requests.get(f"{BASE_URL}/api/items/{item['id']}/history", params={"cursor": "yesterday"},
+                                headers=VENUE, timeout=10)
+        assert response.status_code == 400
+        print("✓ Empty timeline for unknown items, bad cursor rejected")
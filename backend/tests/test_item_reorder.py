@@ -0,0 +1,118 @@
+"""
+Tests for fractional item ordering (/api/items/reorder):
+1. Moving an item or a sub-category rewrites only the moved items' keys
+2. Keys run out after repeated moves into one gap, and the venue is respaced in order
+3. Bad requests are rejected before anything is written, and /api/items lists in key order
+"""
+import requests
+import os
+import pytest
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+VENUE = {"X-Venue-Id": "TEST_item_reorder"}
+
+
+def item(name, sub, sort_order):
+    return {"name": name, "category": "A", "category_name": "Thai Alcohol", "sub_category": sub,
+            "primary_supplier": "Makro", "sort_order": sort_order}
+
+
+ITEMS = [
+    item("TEST Gin A", "Gin", 100), item("TEST Gin B", "Gin", 200),
+    item("TEST Rum A", "Rum", 300), item("TEST Rum B", "Rum", 400),
+    item("TEST Vodka A", "Vodka", 500),
+]
+
+
+def reorder(**body):
+    return requests.post(f"{BASE_URL}/api/items/reorder", headers=VENUE, json=body, timeout=10)
+
+
+def listed():
+    response = requests.get(f"{BASE_URL}/api/items", headers=VENUE, timeout=10)
+    assert response.status_code == 200
+    return response.json()
+
+
+def names():
+    return [i['name'] for i in listed()]
+
+
+@pytest.fixture
+def items():
+    created = [requests.post(f"{BASE_URL}/api/items", headers=VENUE, json=i, timeout=10).json() for i in ITEMS]
+    yield {i['name']: i for i in created}
+    for i in created:
+        requests.delete(f"{BASE_URL}/api/items/{i['id']}", headers=VENUE, timeout=10)
+
+
+class TestItemReorder:
+
+    def test_move_item_writes_only_that_item(self, items):
+        before = {i['id']: i['version'] for i in listed()}
+        response = reorder(item_id=items["TEST Vodka A"]['id'],
+                           before=items["TEST Gin A"]['id'], after=items["TEST Gin B"]['id'])
+        assert response.status_code == 200
+        data = response.json()
+        assert data['rebalanced'] is False
+        assert data['items'] == [{"id": items["TEST Vodka A"]['id'], "sort_order": 150.0}]
+        assert names() == ["TEST Gin A", "TEST Vodka A", "TEST Gin B", "TEST Rum A", "TEST Rum B"]
+        changed = [i['name'] for i in listed() if i['version'] != before[i['id']]]
+        assert changed == ["TEST Vodka A"]
+        print("✓ A move writes one item")
+
+    def test_move_group(self, items):
+        response = reorder(group={"category_name": "Thai Alcohol", "sub_category": "Rum"},
+                           after=items["TEST Gin A"]['id'])
+        assert response.status_code == 200
+        keys = [u['sort_order'] for u in response.json()['items']]
+        assert len(keys) == 2 and keys[0] < keys[1] < 100
+        assert names() == ["TEST Rum A", "TEST Rum B", "TEST Gin A", "TEST Gin B", "TEST Vodka A"]
+        print(f"✓ Sub-category moved to the top with keys {keys}")
+
+    def test_rebalance_when_keys_run_out(self, items):
+        a, b = items["TEST Gin A"]['id'], items["TEST Gin B"]['id']
+        movers = [items["TEST Rum A"]['id'], items["TEST Rum B"]['id']]
+        rebalanced = False
+        # Alternate two items into the gap just above Gin B until it can't be halved any more
+        for n in range(60):
+            moving = movers[n % 2]
+            previous = movers[(n + 1) % 2] if n else a
+            response = reorder(item_id=moving, before=previous, after=b)
+            assert response.status_code == 200
+            if response.json()['rebalanced']:
+                rebalanced = True
+                break
+        assert rebalanced
+        order = names()
+        assert order.index("TEST Gin A") < order.index("TEST Gin B")
+        assert order.index(next(i['name'] for i in listed() if i['id'] == moving)) == order.index("TEST Gin B") - 1
+        keys = [i['sort_order'] for i in listed()]
+        assert keys == sorted(keys) and len(set(keys)) == len(keys)
+        print(f"✓ Rebalanced after {n + 1} moves into one gap, order kept")
+
+    def test_validation(self, items):
+        gin = items["TEST Gin A"]['id']
+        assert reorder(before=gin).status_code == 400
+        assert reorder(item_id=gin).status_code == 400
+        assert reorder(item_id=gin, before=gin).status_code == 400
+        assert reorder(item_id="missing", before=gin).status_code == 404
+        assert reorder(item_id=gin, before="missing").status_code == 404
+        assert reorder(group={"category_name": "Thai Alcohol", "sub_category": "Tequila"}, before=gin).status_code == 404
+        print("✓ Bad moves rejected")
+
+    def test_reversed_neighbours_change_nothing(self, items):
+        # Off the STEP grid, so a respace would show
+        assert reorder(item_id=items["TEST Vodka A"]['id'],
+                       before=items["TEST Gin A"]['id'], after=items["TEST Gin B"]['id']).status_code == 200
+        before = {i['id']: (i['sort_order'], i['version']) for i in listed()}
+        response = reorder(item_id=items["TEST Rum A"]['id'],
+                           before=items["TEST Gin B"]['id'], after=items["TEST Gin A"]['id'])
+        assert response.status_code == 400
+        assert {i['id']: (i['sort_order'], i['version']) for i in listed()} == before
+        print("✓ Reversed neighbours rejected without touching any item")
+
+    def test_items_listed_in_key_order(self, items):
+        keys = [i['sort_order'] for i in listed()]
+        assert keys == sorted(keys)
+        print("✓ /api/items comes back in key order")
@@ -0,0 +1,80 @@
+"""
+Tests for catalog search (/api/items/search):
+1. Prefix, fuzzy and multi-word queries find the right items, best first
+2. The index follows item creates, renames and deletes
+"""
+import requests
+import os
+import pytest
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+VENUE = {"X-Venue-Id": "TEST_item_search"}
+
+ITEMS = [
+    {"name": "TEST Singha Lager", "category": "B", "category_name": "Beer", "sub_category": "Lager",
+     "primary_supplier": "Singha99"},
+    {"name": "TEST Grey Goose Vodka", "category": "A", "category_name": "Thai Alcohol", "sub_category": "Vodka",
+     "primary_supplier": "Makro"},
+    {"name": "TEST Schweppes Soda", "category": "M", "category_name": "Mixers", "sub_category": "Soda",
+     "primary_supplier": "Makro"},
+]
+
+
+def search(q, **params):
+    response = requests.get(f"{BASE_URL}/api/items/search", params={"q": q, **params}, headers=VENUE, timeout=10)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture(scope="module")
+def items():
+    created = [requests.post(f"{BASE_URL}/api/items", headers=VENUE, json=item, timeout=10).json() for item in ITEMS]
+    yield created
+    for item in created:
+        requests.delete(f"{BASE_URL}/api/items/{item['id']}", headers=VENUE, timeout=10)
+
+
+class TestItemSearch:
+
+    def test_prefix(self, items):
+        hits = search("sing")
+        assert hits[0]['id'] == items[0]['id']
+        assert hits[0]['score'] > 0
+        print(f"✓ 'sing' -> {hits[0]['name']}")
+
+    def test_fuzzy(self, items):
+        assert search("vodak")[0]['id'] == items[1]['id']
+        assert search("shweppes")[0]['id'] == items[2]['id']
+        print("✓ Misspelt queries still match")
+
+    def test_all_words_must_match(self, items):
+        hits = search("makro soda")
+        assert [h['id'] for h in hits] == [items[2]['id']]
+        assert search("zzzz") == []
+        assert search("") == []
+        print("✓ Multi-word queries narrow the results")
+
+    def test_ranking_and_limit(self, items):
+        hits = search("makro")
+        assert {h['id'] for h in hits} == {items[1]['id'], items[2]['id']}
+        assert len(search("test", limit=2)) == 2
+        name_hit = search("soda")[0]
+        assert name_hit['id'] == items[2]['id']
+        print("✓ Ranked and limited")
+
+    def test_index_follows_writes(self, items):
+        item = requests.post(f"{BASE_URL}/api/items", headers=VENUE, json={
+            "name": "TEST Zubrowka Bison Grass", "category": "A", "category_name": "Thai Alcohol",
+            "primary_supplier": "Makro",
+        }, timeout=10).json()
+        try:
+            assert search("zubrow")[0]['id'] == item['id']
+
+            requests.put(f"{BASE_URL}/api/items/{item['id']}", headers=VENUE,
+                         json={**item, "name": "TEST Wyborowa"}, timeout=10)
+            assert search("zubrow") == []
+            assert search("wybor")[0]['id'] == item['id']
+        finally:
+            requests.delete(f"{BASE_URL}/api/items/{item['id']}", headers=VENUE, timeout=10)
+        assert search("wybor") == []
+        print("✓ Creates, renames and deletes are searchable immediately")
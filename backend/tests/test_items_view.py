@@ -0,0 +1,100 @@
+"""
+Tests for the grouped catalog view (/api/items/view):
+1. Items come back grouped by category then sub-category, in display order
+2. Joined stock gives have/need per item and totals per group
+3. The view follows catalog, ordering and count writes; bad parameters are rejected
+"""
+import requests
+import os
+import pytest
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+VENUE = {"X-Venue-Id": "TEST_items_view"}
+
+
+def item(name, category_name, sub, sort_order, target=0, **extra):
+    return {"name": name, "category": "A", "category_name": category_name, "sub_category": sub,
+            "primary_supplier": "Makro", "sort_order": sort_order, "target_stock": target,
+            "cost_per_unit": 10.0, **extra}
+
+
+ITEMS = [
+    item("TEST Rum", "Thai Alcohol", "Rum", 100, target=6),
+    item("TEST Gin", "Thai Alcohol", "Gin", 200, target=4),
+    item("TEST Loose", "Thai Alcohol", None, 900),
+    item("TEST Lager", "Beer", None, 100, target=48, units_per_case=24, bought_by_case=True),
+]
+
+
+def view(**params):
+    response = requests.get(f"{BASE_URL}/api/items/view", params=params, headers=VENUE, timeout=10)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def by_key(groups):
+    return {g['key']: g for g in groups}
+
+
+@pytest.fixture
+def items():
+    created = [requests.post(f"{BASE_URL}/api/items", headers=VENUE, json=i, timeout=10).json() for i in ITEMS]
+    yield {i['name']: i for i in created}
+    for i in created:
+        requests.delete(f"{BASE_URL}/api/items/{i['id']}", headers=VENUE, timeout=10)
+
+
+class TestItemsView:
+
+    def test_grouped_in_display_order(self, items):
+        data = view()
+        assert [g['key'] for g in data['groups']] == ["Beer", "Thai Alcohol"]
+        thai = by_key(data['groups'])["Thai Alcohol"]
+        # No sub-category first, then by lowest sort_order
+        assert [g['key'] for g in thai['groups']] == ["Thai Alcohol", "Thai Alcohol - Rum", "Thai Alcohol - Gin"]
+        assert thai['totals'] == {"items": 3}
+        assert data['totals'] == {"items": 4}
+        print("✓ Grouped by category and sub-category")
+
+    def test_stock_joined(self, items):
+        requests.put(f"{BASE_URL}/api/stock-counts/{items['TEST Lager']['id']}", headers=VENUE,
+                     json={"main_bar": 10}, timeout=10)
+        data = view(counts="true")
+        beer = by_key(data['groups'])["Beer"]
+        lager = beer['groups'][0]['items'][0]
+        assert (lager['have'], lager['need'], lager['suggested'], lager['value']) == (10, 38, 2, 100.0)
+        assert beer['totals'] == {"items": 1, "have": 10, "need": 38, "suggested": 2, "value": 100.0}
+        assert data['totals']['need'] == 38 + 6 + 4
+        print("✓ Stock and need joined, with totals")
+
+    def test_sort_and_flat(self, items):
+        flat = view(group="", sort="-need")
+        assert [i['name'] for i in flat['items']][:3] == ["TEST Lager", "TEST Rum", "TEST Gin"]
+        by_supplier = view(group="supplier", sort="name")
+        assert [i['name'] for i in by_supplier['groups'][0]['items']] == sorted(i['name'] for i in ITEMS)
+        print("✓ Sorted by a stock column, flat and by supplier")
+
+    def test_follows_writes(self, items):
+        view(counts="true")
+        gin = items["TEST Gin"]
+        requests.post(f"{BASE_URL}/api/items/reorder", headers=VENUE,
+                      json={"group": {"category_name": "Thai Alcohol", "sub_category": "Gin"},
+                            "after": items["TEST Rum"]['id']}, timeout=10)
+        thai = by_key(view(counts="true")['groups'])["Thai Alcohol"]
+        assert [g['key'] for g in thai['groups']][1:] == ["Thai Alcohol - Gin", "Thai Alcohol - Rum"]
+
+        requests.put(f"{BASE_URL}/api/stock-counts/{gin['id']}", headers=VENUE, json={"lobby": 3}, timeout=10)
+        thai = by_key(view(counts="true")['groups'])["Thai Alcohol"]
+        assert by_key(thai['groups'])["Thai Alcohol - Gin"]['items'][0]['have'] == 3
+
+        current = requests.get(f"{BASE_URL}/api/items/{gin['id']}", headers=VENUE, timeout=10).json()
+        requests.put(f"{BASE_URL}/api/items/{gin['id']}", headers=VENUE,
+                     json={**current, "sub_category": "Vodka"}, timeout=10)
+        thai = by_key(view(counts="true")['groups'])["Thai Alcohol"]
+        assert "Thai Alcohol - Vodka" in by_key(thai['groups'])
+        print("✓ Reorders, counts and item edits show up immediately")
+
+    def test_bad_parameters(self, items):
+        assert requests.get(f"{BASE_URL}/api/items/view", params={"group": "colour"}, headers=VENUE, timeout=10).status_code == 400
+        assert requests.get(f"{BASE_URL}/api/items/view", params={"sort": "-colour"}, headers=VENUE, timeout=10).status_code == 400
+        print("✓ Unknown group or sort column rejected")
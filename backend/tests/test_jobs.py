@@ -0,0 +1,38 @@
+"""
+Tests for the background job scheduler:
+1. Scheduled jobs are listed with their schedule and next run
+2. Running a job now records the run with its duration
+3. Unknown jobs return 404
+"""
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestJobs:
+
+    def test_jobs_listed(self):
+        response = requests.get(f"{BASE_URL}/api/jobs", timeout=10)
+        assert response.status_code == 200
+        jobs = {j['name']: j for j in response.json()}
+        assert "recompute_valuations" in jobs
+        assert jobs["recompute_valuations"]['schedule'].startswith("cron ")
+        assert all(j['next_run'] for j in jobs.values())
+        print(f"✓ {len(jobs)} jobs scheduled")
+
+    def test_run_now_recorded(self):
+        response = requests.post(f"{BASE_URL}/api/jobs/recompute_valuations/run", timeout=30)
+        assert response.status_code == 200
+        run = response.json()
+        assert run['status'] in ("ok", "skipped")
+        if run['status'] == "ok":
+            assert run['duration_ms'] >= 0
+            jobs = {j['name']: j for j in requests.get(f"{BASE_URL}/api/jobs", timeout=10).json()}
+            assert any(r['id'] == run['id'] for r in jobs["recompute_valuations"]['recent_runs'])
+        print(f"✓ Manual run {run['status']}")
+
+    def test_unknown_job(self):
+        response = requests.post(f"{BASE_URL}/api/jobs/TEST_no_such_job/run", timeout=10)
+        assert response.status_code == 404
+        print("✓ Unknown job rejected")
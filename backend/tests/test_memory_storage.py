@@ -0,0 +1,161 @@
+"""
+Tests for the embedded in-memory storage backend (STORAGE_BACKEND=memory).
+These run in-process and need no MongoDB or running server:
+1. CRUD with the Motor-style API the handlers use
+2. Update operators and upserts
+3. Unique compound indexes and index-backed lookups
+4. Projection, sort, limit and bulk writes
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import storage  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def db():
+    client, database = storage.connect({"STORAGE_BACKEND": "memory"})
+    return database
+
+
+class TestMemoryStorage:
+
+    def test_connect_rejects_unknown_backend(self):
+        with pytest.raises(ValueError):
+            storage.connect({"STORAGE_BACKEND": "sqlite"})
+
+    def test_insert_find_update_delete(self, db):
+        async def scenario():
+            await db.items.insert_one({"id": "a", "venue_id": "main", "name": "Beer", "cost_per_unit": 30.0})
+            await db.items.insert_one({"id": "b", "venue_id": "main", "name": "Rum", "cost_per_unit": 100.0})
+
+            found = await db.items.find_one({"id": "a"}, {"_id": 0})
+            assert found == {"id": "a", "venue_id": "main", "name": "Beer", "cost_per_unit": 30.0}
+
+            result = await db.items.update_one({"id": "a"}, {"$set": {"cost_per_unit": 32.0}})
+            assert (result.matched_count, result.modified_count) == (1, 1)
+            missing = await db.items.update_one({"id": "zzz"}, {"$set": {"cost_per_unit": 1.0}})
+            assert missing.matched_count == 0
+
+            cheap = await db.items.find({"cost_per_unit": {"$lt": 50}}, {"_id": 0, "id": 1}).to_list(None)
+            assert cheap == [{"id": "a"}]
+
+            deleted = await db.items.delete_one({"id": "b"})
+            assert deleted.deleted_count == 1
+            assert await db.items.count_documents({}) == 1
+        run(scenario())
+        print("✓ Basic CRUD")
+
+    def test_update_operators_and_upsert(self, db):
+        async def scenario():
+            await db.valuation.update_one(
+                {"venue_id": "main"},
+                {"$inc": {"total": 10.0, "locations.main_bar": 10.0}, "$setOnInsert": {"created": True}},
+                upsert=True,
+            )
+            await db.valuation.update_one(
+                {"venue_id": "main"},
+                {"$inc": {"total": 5.0}, "$setOnInsert": {"created": False}},
+                upsert=True,
+            )
+            doc = await db.valuation.find_one({"venue_id": "main"}, {"_id": 0})
+            assert doc == {"venue_id": "main", "total": 15.0, "locations": {"main_bar": 10.0}, "created": True}
+
+            before = await db.valuation.find_one_and_update(
+                {"venue_id": "main"}, {"$unset": {"created": ""}}, return_document=ReturnDocument.BEFORE
+            )
+            assert before["created"] is True
+            assert "created" not in await db.valuation.find_one({"venue_id": "main"})
+        run(scenario())
+
+    def test_unique_index(self, db):
+        async def scenario():
+            await db.stock_counts.create_index([("venue_id", 1), ("item_id", 1)], unique=True)
+            await db.stock_counts.insert_one({"venue_id": "a", "item_id": "x"})
+            await db.stock_counts.insert_one({"venue_id": "b", "item_id": "x"})
+            with pytest.raises(DuplicateKeyError):
+                await db.stock_counts.insert_one({"venue_id": "a", "item_id": "x"})
+            with pytest.raises(DuplicateKeyError):
+                await db.stock_counts.update_one({"venue_id": "b"}, {"$set": {"venue_id": "a"}})
+            assert "venue_id_1_item_id_1" in await db.stock_counts.index_information()
+        run(scenario())
+        print("✓ Unique compound index enforced")
+
+    def test_indexed_lookup_matches_scan(self, db):
+        async def scenario():
+            await db.historical_counts.insert_many(
+                [{"venue_id": "main", "session_id": f"s{i % 10}", "item_id": f"i{i}", "total_count": i} for i in range(500)]
+            )
+            scanned = await db.historical_counts.find({"session_id": {"$in": ["s1", "s2"]}}, {"_id": 0}).to_list(None)
+            await db.historical_counts.create_index([("venue_id", 1), ("session_id", 1)])
+            indexed = await db.historical_counts.find(
+                {"venue_id": "main", "session_id": {"$in": ["s1", "s2"]}}, {"_id": 0}
+            ).to_list(None)
+            assert len(indexed) == 100
+            assert indexed == scanned
+        run(scenario())
+
+    def test_sort_limit_and_dates(self, db):
+        async def scenario():
+            for day in (3, 1, 2):
+                await db.stock_sessions.insert_one({
+                    "id": f"s{day}",
+                    "session_date": datetime(2026, 1, day, 12, 0, 0, 123456, tzinfo=timezone.utc),
+                })
+            latest = await db.stock_sessions.find({}, {"_id": 0}).sort("session_date", -1).limit(2).to_list(2)
+            assert [s["id"] for s in latest] == ["s3", "s2"]
+            # Stored like BSON dates: naive UTC, millisecond precision
+            assert latest[0]["session_date"] == datetime(2026, 1, 3, 12, 0, 0, 123000)
+
+            await db.stock_sessions.insert_one({"id": "legacy", "session_date": "2026-01-04T12:00:00Z"})
+            strings = await db.stock_sessions.find({"session_date": {"$type": "string"}}, {"_id": 0, "id": 1}).to_list(None)
+            assert strings == [{"id": "legacy"}]
+            assert await db.stock_sessions.count_documents({"session_date": {"$type": ["date", "null"]}}) == 3
+        run(scenario())
+
+    def test_bulk_write(self, db):
+        async def scenario():
+            await db.cost_layers.insert_one({"item_id": "a", "period": "2026-01", "received_qty": 1})
+            result = await db.cost_layers.bulk_write([
+                UpdateOne({"item_id": "a", "period": "2026-01"}, {"$inc": {"received_qty": 2}}, upsert=True),
+                UpdateOne({"item_id": "b", "period": "2026-01"}, {"$inc": {"received_qty": 5}}, upsert=True),
+                ReplaceOne({"item_id": "c"}, {"item_id": "c", "received_qty": 0}, upsert=True),
+            ])
+            assert result.matched_count == 1
+            assert result.upserted_count == 2
+            layers = await db.cost_layers.find({}, {"_id": 0, "item_id": 1, "received_qty": 1}).sort("item_id", 1).to_list(None)
+            assert layers == [
+                {"item_id": "a", "received_qty": 3},
+                {"item_id": "b", "received_qty": 5},
+                {"item_id": "c", "received_qty": 0},
+            ]
+        run(scenario())
+        print("✓ Bulk upserts and increments")
+
+    def test_bulk_write_reports_duplicate_keys(self, db):
+        async def scenario():
+            await db.stock_counts.create_index([("item_id", 1)], unique=True)
+            await db.stock_counts.insert_one({"item_id": "a", "version": 2})
+            # Version-guarded upserts: a stale version collides with the existing document
+            with pytest.raises(BulkWriteError) as raised:
+                await db.stock_counts.bulk_write([
+                    UpdateOne({"item_id": "a", "version": 1}, {"$set": {"main_bar": 5}}, upsert=True),
+                    UpdateOne({"item_id": "b", "version": {"$in": [0, None]}}, {"$set": {"main_bar": 3}}, upsert=True),
+                ], ordered=False)
+            assert [e['index'] for e in raised.value.details['writeErrors']] == [0]
+            assert raised.value.details['writeErrors'][0]['code'] == 11000
+            counts = await db.stock_counts.find({}, {"_id": 0}).sort("item_id", 1).to_list(None)
+            assert counts == [{"item_id": "a", "version": 2}, {"item_id": "b", "main_bar": 3}]
+        run(scenario())
+        print("✓ Unordered bulk write reports each collision and applies the rest")
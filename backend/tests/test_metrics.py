@@ -0,0 +1,57 @@
+"""
+Tests for the Prometheus /metrics endpoint:
+1. Served as Prometheus text format
+2. Requests are counted per route template and status
+3. Latency histograms and per-request database command counts are exported
+"""
+import re
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def scrape():
+    response = requests.get(f"{BASE_URL}/metrics", timeout=10)
+    assert response.status_code == 200
+    return response
+
+
+def sample(text, name, **labels):
+    """Value of the first sample of ``name`` carrying all ``labels``"""
+    for line in text.splitlines():
+        if line.startswith(name + "{") and all(f'{k}="{v}"' in line for k, v in labels.items()):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+class TestMetrics:
+
+    def test_content_type(self):
+        response = scrape()
+        assert response.headers['content-type'].startswith("text/plain; version=0.0.4")
+        assert "# TYPE barstock_http_request_duration_seconds histogram" in response.text
+        print("✓ Prometheus text format")
+
+    def test_requests_counted_by_route_template(self):
+        before = sample(scrape().text, "barstock_http_requests_total", method="GET", route="/api/items", status="200") or 0
+        for _ in range(3):
+            requests.get(f"{BASE_URL}/api/items", timeout=10)
+        after = sample(scrape().text, "barstock_http_requests_total", method="GET", route="/api/items", status="200")
+        assert after >= before + 3
+
+        requests.get(f"{BASE_URL}/api/items/does-not-exist", timeout=10)
+        text = scrape().text
+        # Path parameters are folded into the route template
+        assert sample(text, "barstock_http_requests_total", route="/api/items/{item_id}", status="404") >= 1
+        assert "does-not-exist" not in text
+        print("✓ Requests counted per route template")
+
+    def test_latency_and_db_histograms(self):
+        requests.get(f"{BASE_URL}/api/items", timeout=10)
+        text = scrape().text
+        assert sample(text, "barstock_http_request_duration_seconds_count", method="GET", route="/api/items") >= 1
+        assert sample(text, "barstock_http_request_duration_seconds_bucket", route="/api/items", le="+Inf") >= 1
+        assert sample(text, "barstock_http_request_db_commands_sum", method="GET", route="/api/items") >= 1
+        assert re.search(r'barstock_db_command_duration_seconds_count\{command="find"\} \d+', text)
+        print("✓ Latency and database command histograms exported")
@@ -0,0 +1,33 @@
+"""
+Tests for schema migrations (/api/migrations):
+1. Every migration was applied at startup and recorded
+2. Running them on demand again changes nothing
+"""
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestMigrations:
+
+    def test_applied_at_startup(self):
+        response = requests.get(f"{BASE_URL}/api/migrations", timeout=10)
+        assert response.status_code == 200
+        migrations = response.json()
+        versions = [m['version'] for m in migrations]
+        assert versions == sorted(versions) and len(set(versions)) == len(versions)
+        assert {"assign_default_venue", "real_dates", "target_stock", "round_costs"} <= {m['name'] for m in migrations}
+        for m in migrations:
+            assert m['applied'] is not None, f"migration {m['name']} not applied"
+            assert isinstance(m['applied']['changes'], dict)
+        print(f"✓ {len(migrations)} migrations applied")
+
+    def test_rerun_is_a_no_op(self):
+        before = requests.get(f"{BASE_URL}/api/migrations", timeout=10).json()
+        response = requests.post(f"{BASE_URL}/api/migrations/run", timeout=30)
+        assert response.status_code == 200
+        assert response.json() == {"applied": []}
+        after = requests.get(f"{BASE_URL}/api/migrations", timeout=10).json()
+        assert after == before
+        print("✓ Nothing left to apply")
@@ -0,0 +1,71 @@
+"""
+Tests for venue partitioning via the X-Venue-Id header:
+1. Items, counts and valuation created in one venue are invisible to another
+2. Requests without the header use the default venue
+3. Supplier terms with the same name are kept per venue
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+VENUE_A = {"X-Venue-Id": "TEST_venue_a"}
+VENUE_B = {"X-Venue-Id": "TEST_venue_b"}
+
+
+@pytest.fixture
+def venue_a_item():
+    item = {
+        "name": "TEST_Venue_Item",
+        "category": "B",
+        "category_name": "Beer",
+        "units_per_case": 24,
+        "target_stock": 48,
+        "primary_supplier": "Singha99",
+        "cost_per_unit": 10.0
+    }
+    response = requests.post(f"{BASE_URL}/api/items", json=item, headers=VENUE_A, timeout=10)
+    assert response.status_code == 200
+    created = response.json()
+    assert created['venue_id'] == "TEST_venue_a"
+    yield created
+    requests.delete(f"{BASE_URL}/api/items/{created['id']}", headers=VENUE_A, timeout=10)
+
+
+class TestMultiVenue:
+
+    def test_items_isolated(self, venue_a_item):
+        ids_a = [i['id'] for i in requests.get(f"{BASE_URL}/api/items", headers=VENUE_A, timeout=10).json()]
+        ids_b = [i['id'] for i in requests.get(f"{BASE_URL}/api/items", headers=VENUE_B, timeout=10).json()]
+        ids_default = [i['id'] for i in requests.get(f"{BASE_URL}/api/items", timeout=10).json()]
+        assert venue_a_item['id'] in ids_a
+        assert venue_a_item['id'] not in ids_b
+        assert venue_a_item['id'] not in ids_default
+
+        response = requests.get(f"{BASE_URL}/api/items/{venue_a_item['id']}", headers=VENUE_B, timeout=10)
+        assert response.status_code == 404
+        print("✓ Items only visible in their own venue")
+
+    def test_counts_and_valuation_isolated(self, venue_a_item):
+        requests.put(f"{BASE_URL}/api/stock-counts/{venue_a_item['id']}", json={"main_bar": 5}, headers=VENUE_A, timeout=10)
+
+        counts_b = requests.get(f"{BASE_URL}/api/stock-counts", headers=VENUE_B, timeout=10).json()
+        assert all(c['item_id'] != venue_a_item['id'] for c in counts_b)
+
+        value_a = requests.get(f"{BASE_URL}/api/valuation", headers=VENUE_A, timeout=10).json()
+        value_b = requests.get(f"{BASE_URL}/api/valuation", headers=VENUE_B, timeout=10).json()
+        assert value_a['total'] >= 50.0
+        assert value_b['venue_id'] == "TEST_venue_b"
+        assert value_b['total'] == 0.0
+        print("✓ Counts and valuation kept per venue")
+
+    def test_supplier_terms_per_venue(self):
+        requests.put(f"{BASE_URL}/api/suppliers/TEST_Supplier", json={"name": "TEST_Supplier", "min_order_total": 100}, headers=VENUE_A, timeout=10)
+        requests.put(f"{BASE_URL}/api/suppliers/TEST_Supplier", json={"name": "TEST_Supplier", "min_order_total": 200}, headers=VENUE_B, timeout=10)
+
+        terms_a = [s for s in requests.get(f"{BASE_URL}/api/suppliers", headers=VENUE_A, timeout=10).json() if s['name'] == "TEST_Supplier"]
+        terms_b = [s for s in requests.get(f"{BASE_URL}/api/suppliers", headers=VENUE_B, timeout=10).json() if s['name'] == "TEST_Supplier"]
+        assert terms_a[0]['min_order_total'] == 100
+        assert terms_b[0]['min_order_total'] == 200
+        print("✓ Same supplier name holds different terms per venue")
@@ -0,0 +1,89 @@
+"""
+Tests for optimistic concurrency on items and stock counts:
+1. Every write increments the document version (returned as ETag too)
+2. An update based on an old version gets 409 with the current document
+3. If-Match header and body `version` field are both accepted
+4. Updates without a version still succeed (last write wins)
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ITEM = {
+    "name": "TEST_Versioned_Item",
+    "category": "B",
+    "category_name": "Beer",
+    "units_per_case": 24,
+    "primary_supplier": "Singha99",
+    "cost_per_unit": 10.0
+}
+
+
+@pytest.fixture
+def test_item():
+    response = requests.post(f"{BASE_URL}/api/items", json=ITEM, timeout=10)
+    assert response.status_code == 200
+    created = response.json()
+    yield created
+    requests.delete(f"{BASE_URL}/api/items/{created['id']}", timeout=10)
+
+
+class TestItemVersions:
+
+    def test_version_increments(self, test_item):
+        assert test_item['version'] == 1
+        response = requests.put(f"{BASE_URL}/api/items/{test_item['id']}",
+                                json={**ITEM, "cost_per_unit": 12.0, "version": 1}, timeout=10)
+        assert response.status_code == 200
+        assert response.json()['version'] == 2
+        assert response.headers['ETag'] == '"2"'
+
+        fetched = requests.get(f"{BASE_URL}/api/items/{test_item['id']}", timeout=10)
+        assert fetched.headers['ETag'] == '"2"'
+        print("✓ Item version increments on write")
+
+    def test_stale_update_conflicts(self, test_item):
+        first = requests.put(f"{BASE_URL}/api/items/{test_item['id']}",
+                             json={**ITEM, "cost_per_unit": 12.0}, headers={"If-Match": '"1"'}, timeout=10)
+        assert first.status_code == 200
+
+        second = requests.put(f"{BASE_URL}/api/items/{test_item['id']}",
+                              json={**ITEM, "cost_per_unit": 15.0}, headers={"If-Match": '"1"'}, timeout=10)
+        assert second.status_code == 409
+        current = second.json()['detail']['current']
+        assert current['cost_per_unit'] == 12.0
+        assert current['version'] == 2
+
+        item = requests.get(f"{BASE_URL}/api/items/{test_item['id']}", timeout=10).json()
+        assert item['cost_per_unit'] == 12.0
+        print("✓ Stale item update rejected with current document")
+
+    def test_unconditional_update(self, test_item):
+        response = requests.put(f"{BASE_URL}/api/items/{test_item['id']}",
+                                json={**ITEM, "cost_per_unit": 11.0}, timeout=10)
+        assert response.status_code == 200
+        assert response.json()['version'] == 2
+        print("✓ Update without a version still applies")
+
+
+class TestCountVersions:
+
+    def test_count_conflict(self, test_item):
+        url = f"{BASE_URL}/api/stock-counts/{test_item['id']}"
+        assert requests.get(url, timeout=10).headers['ETag'] == '"0"'
+
+        first = requests.put(url, json={"main_bar": 4, "version": 0}, timeout=10)
+        assert first.status_code == 200
+        assert first.json()['version'] == 1
+
+        second = requests.put(url, json={"main_bar": 9, "version": 0}, timeout=10)
+        assert second.status_code == 409
+        assert second.json()['detail']['current']['main_bar'] == 4
+
+        third = requests.put(url, json={"lobby": 2}, headers={"If-Match": '"1"'}, timeout=10)
+        assert third.status_code == 200
+        assert third.json()['total_count'] == 6
+        assert third.json()['version'] == 2
+        print("✓ Stale count update rejected, current one applied")
@@ -0,0 +1,151 @@
+"""
+Tests for the cost-minimizing order optimizer:
+1. GET /api/shopping-list/optimized plans cheapest cases/singles mix
+2. Alternative supplier offers are used when cheaper
+3. Case-only items are rounded up to whole cases
+4. Supplier terms (minimum order totals) via /api/suppliers
+5. Minimums met by topping up, never by moving items onto a short supplier
+6. Results cached until counts or prices change
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def find_line(plan, item_id):
+    for supplier, entry in plan['suppliers'].items():
+        for line in entry['items']:
+            if line['item_id'] == item_id:
+                return line
+    return None
+
+
+class TestOrderOptimizer:
+    """Tests for GET /api/shopping-list/optimized"""
+
+    @pytest.fixture(autouse=True)
+    def setup_items(self):
+        self.created = []
+        yield
+        for item_id in self.created:
+            requests.delete(f"{BASE_URL}/api/items/{item_id}", timeout=10)
+
+    def create_item(self, **overrides):
+        item = {
+            "name": "TEST_Optimizer_Item",
+            "category": "B",
+            "category_name": "Beer",
+            "units_per_case": 24,
+            "target_stock": 30,
+            "primary_supplier": "TEST_Supplier_A",
+            "cost_per_unit": 30.0,
+            "cost_per_case": 600.0,
+            "bought_by_case": False,
+            **overrides
+        }
+        response = requests.post(f"{BASE_URL}/api/items", json=item, timeout=10)
+        assert response.status_code == 200, f"Create failed: {response.text}"
+        self.created.append(response.json()['id'])
+        requests.put(f"{BASE_URL}/api/stock-counts/{response.json()['id']}", json={"main_bar": 0}, timeout=10)
+        return response.json()
+
+    def test_mixes_cases_and_singles(self):
+        item = self.create_item()
+        plan = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        line = find_line(plan, item['id'])
+        # 1 case (600) + 6 singles (180) beats 2 cases (1200)
+        assert line['cases'] == 1
+        assert line['singles'] == 6
+        assert line['cost'] == 780.0
+        print(f"✓ Mixed plan: {line['cases']} case + {line['singles']} singles")
+
+    def test_case_only_rounds_up(self):
+        item = self.create_item(name="TEST_Optimizer_CaseOnly", bought_by_case=True)
+        plan = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        line = find_line(plan, item['id'])
+        assert line['cases'] == 2
+        assert line['singles'] == 0
+        print("✓ Case-only item rounded up to whole cases")
+
+    def test_cheaper_alternative_supplier(self):
+        item = self.create_item(
+            name="TEST_Optimizer_MultiSupplier",
+            supplier_offers=[{"supplier": "TEST_Supplier_B", "cost_per_unit": 20.0, "cost_per_case": 400.0}]
+        )
+        plan = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        line = find_line(plan, item['id'])
+        assert line['supplier'] == "TEST_Supplier_B"
+        print("✓ Cheaper alternative supplier chosen")
+
+    def test_minimum_order_total_reported(self):
+        self.create_item(name="TEST_Optimizer_MinOrder", primary_supplier="TEST_Supplier_Min")
+        response = requests.put(
+            f"{BASE_URL}/api/suppliers/TEST_Supplier_Min",
+            json={"name": "TEST_Supplier_Min", "min_order_total": 1000000},
+            timeout=10
+        )
+        assert response.status_code == 200
+        plan = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        entry = plan['suppliers']['TEST_Supplier_Min']
+        assert entry['min_order_total'] == 1000000
+        assert entry['meets_minimum'] is False
+        print("✓ Unmet supplier minimum flagged")
+
+    def set_minimum(self, supplier, minimum):
+        response = requests.put(
+            f"{BASE_URL}/api/suppliers/{supplier}",
+            json={"name": supplier, "min_order_total": minimum},
+            timeout=10
+        )
+        assert response.status_code == 200
+
+    def test_cheap_supplier_topped_up_to_minimum(self):
+        item = self.create_item(
+            name="TEST_Optimizer_TopUp",
+            primary_supplier="TEST_Supplier_TopUp",
+            supplier_offers=[{"supplier": "TEST_Supplier_Dear", "cost_per_unit": 60.0}]
+        )
+        self.set_minimum("TEST_Supplier_TopUp", 1000)
+        plan = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        line = find_line(plan, item['id'])
+        # 38 units from the cheap supplier (1020) beat 30 from the dear one (1800)
+        assert line['supplier'] == "TEST_Supplier_TopUp"
+        assert line['units'] == 38
+        assert line['top_up_units'] == 8
+        assert line['cost'] == 1020.0
+        assert plan['suppliers']['TEST_Supplier_TopUp']['meets_minimum'] is True
+        print("✓ Cheap supplier topped up to its minimum")
+
+    def test_not_moved_onto_supplier_below_minimum(self):
+        item = self.create_item(
+            name="TEST_Optimizer_Push",
+            primary_supplier="TEST_Supplier_Far",
+            supplier_offers=[
+                {"supplier": "TEST_Supplier_Near", "cost_per_unit": 25.0},
+                {"supplier": "TEST_Supplier_Open", "cost_per_unit": 40.0},
+            ]
+        )
+        self.set_minimum("TEST_Supplier_Far", 100000)
+        self.set_minimum("TEST_Supplier_Near", 50000)
+        plan = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        line = find_line(plan, item['id'])
+        # Neither minimum can be reached, so the supplier without one wins
+        assert line['supplier'] == "TEST_Supplier_Open"
+        assert all(entry['meets_minimum'] for entry in plan['suppliers'].values()
+                   if entry['min_order_total'] < 1000000)
+        print("✓ Item not moved onto a supplier short of its minimum")
+
+    def test_result_cached_until_counts_change(self):
+        item = self.create_item(name="TEST_Optimizer_Cache")
+        first = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        second = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        assert second['cached'] is True
+        assert second['total_cost'] == first['total_cost']
+
+        requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", json={"main_bar": 30}, timeout=10)
+        third = requests.get(f"{BASE_URL}/api/shopping-list/optimized", timeout=10).json()
+        assert third['cached'] is False
+        assert find_line(third, item['id']) is None
+        print("✓ Cache invalidated by count write")
@@ -0,0 +1,160 @@
+"""
+Tests for price history and cost-of-goods valuation:
+1. Price history entry recorded when item cost changes (and not otherwise)
+2. Confirmed orders record actual purchase cost
+3. Session comparison uses costs stamped at snapshot time
+4. Cost of goods report (wac / fifo)
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+TEST_ITEM = {
+    "name": "TEST_Costing_Item",
+    "category": "B",
+    "category_name": "Beer",
+    "units_per_case": 12,
+    "target_stock": 24,
+    "primary_supplier": "Singha99",
+    "cost_per_unit": 40.0,
+    "cost_per_case": 0,
+    "bought_by_case": True
+}
+
+
+@pytest.fixture
+def test_item():
+    response = requests.post(f"{BASE_URL}/api/items", json=TEST_ITEM, timeout=10)
+    assert response.status_code == 200, f"Setup failed: {response.text}"
+    item = response.json()
+    yield item
+    requests.delete(f"{BASE_URL}/api/items/{item['id']}", timeout=10)
+
+
+class TestPriceHistory:
+    """Tests for GET /api/items/{id}/price-history"""
+
+    def test_create_records_initial_price(self, test_item):
+        response = requests.get(f"{BASE_URL}/api/items/{test_item['id']}/price-history", timeout=10)
+        assert response.status_code == 200
+        history = response.json()
+        assert len(history) == 1
+        assert history[0]['source'] == "item_create"
+        assert history[0]['cost_per_unit'] == 40.0
+        print("✓ Initial price recorded on create")
+
+    def test_cost_change_records_entry(self, test_item):
+        update = {**TEST_ITEM, "cost_per_unit": 45.0, "cost_per_case": 0}
+        response = requests.put(f"{BASE_URL}/api/items/{test_item['id']}", json=update, timeout=10)
+        assert response.status_code == 200
+
+        history = requests.get(f"{BASE_URL}/api/items/{test_item['id']}/price-history", timeout=10).json()
+        assert len(history) == 2
+        assert history[0]['source'] == "item_update"
+        assert history[0]['cost_per_unit'] == 45.0
+        assert history[0]['cost_per_case'] == 540.0
+        print("✓ Price change recorded, newest first")
+
+    def test_non_cost_edit_does_not_record_entry(self, test_item):
+        update = {**TEST_ITEM, "name": "TEST_Costing_Item_Renamed", "cost_per_case": 480.0}
+        response = requests.put(f"{BASE_URL}/api/items/{test_item['id']}", json=update, timeout=10)
+        assert response.status_code == 200
+
+        history = requests.get(f"{BASE_URL}/api/items/{test_item['id']}/price-history", timeout=10).json()
+        assert len(history) == 1
+        print("✓ Rename does not create a price entry")
+
+    def test_confirmed_order_records_purchase_cost(self, test_item):
+        order = {
+            "id": f"TEST_order_{test_item['id']}",
+            "supplier": "Singha99",
+            "status": "completed",
+            "items": [{**test_item, "actualQty": 2, "isCase": True, "actualCost": 1200.0}]
+        }
+        response = requests.post(f"{BASE_URL}/api/orders", json=order, timeout=10)
+        assert response.status_code == 200
+
+        history = requests.get(f"{BASE_URL}/api/items/{test_item['id']}/price-history", timeout=10).json()
+        assert history[0]['source'] == "order"
+        assert history[0]['ref_id'] == order['id']
+        # 1200 / (2 cases * 12 units)
+        assert history[0]['cost_per_unit'] == 50.0
+        print("✓ Order receipt recorded at actual unit cost")
+
+
+class TestCostOfGoods:
+    """Tests for cost-aware reports"""
+
+    def test_cost_of_goods_report_shape(self):
+        for method in ("wac", "fifo"):
+            response = requests.get(f"{BASE_URL}/api/reports/cost-of-goods", params={"method": method}, timeout=10)
+            assert response.status_code == 200
+            report = response.json()
+            assert report['method'] == method
+            assert isinstance(report['items'], list)
+            assert 'total_cost_of_goods' in report
+            print(f"✓ Cost of goods ({method}): ฿{report['total_cost_of_goods']}")
+
+    def test_cost_of_goods_rejects_unknown_method(self):
+        response = requests.get(f"{BASE_URL}/api/reports/cost-of-goods", params={"method": "lifo"}, timeout=10)
+        assert response.status_code == 400
+
+    def test_session_comparison_ignores_later_price_edits(self, test_item):
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"main_bar": 20}, timeout=10)
+        s1 = requests.post(f"{BASE_URL}/api/stock-sessions", json={"session_name": "TEST_Cost_S1"}, timeout=10).json()
+        requests.post(f"{BASE_URL}/api/stock-sessions/{s1['id']}/save-counts", timeout=10)
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"main_bar": 10}, timeout=10)
+        s2 = requests.post(f"{BASE_URL}/api/stock-sessions", json={"session_name": "TEST_Cost_S2"}, timeout=10).json()
+        requests.post(f"{BASE_URL}/api/stock-sessions/{s2['id']}/save-counts", timeout=10)
+
+        url = f"{BASE_URL}/api/reports/session-comparison/{s1['id']}/{s2['id']}"
+        before = requests.get(url, timeout=10).json()
+        row = next(r for r in before['item_comparisons'] if r['item_id'] == test_item['id'])
+        assert row['calculated_usage'] == 10
+        assert row['cost_per_unit'] == 40.0
+
+        # Editing the price afterwards must not change the historic report
+        requests.put(f"{BASE_URL}/api/items/{test_item['id']}", json={**TEST_ITEM, "cost_per_unit": 99.0}, timeout=10)
+        after = requests.get(url, timeout=10).json()
+        row_after = next(r for r in after['item_comparisons'] if r['item_id'] == test_item['id'])
+        assert row_after['cost_per_unit'] == row['cost_per_unit']
+        print("✓ Historic comparison is stable across price edits")
+
+    def test_session_comparison_matches_cost_of_goods(self):
+        """Two lots at ฿10 and ฿20, 10 units used: FIFO uses the ฿10 lot, WAC the ฿15 average"""
+        venue = {"X-Venue-Id": "TEST_costing_lots"}
+        item = requests.post(f"{BASE_URL}/api/items", headers=venue, json={
+            **TEST_ITEM, "name": "TEST_Costing_Lots", "units_per_case": 1, "cost_per_unit": 10.0, "bought_by_case": False,
+        }, timeout=10).json()
+        try:
+            requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=venue, json={"main_bar": 10}, timeout=10)
+            s1 = requests.post(f"{BASE_URL}/api/stock-sessions", headers=venue, json={"session_name": "TEST_Lots_S1"}, timeout=10).json()
+            requests.post(f"{BASE_URL}/api/stock-sessions/{s1['id']}/save-counts", headers=venue, timeout=10)
+            before = {m: requests.get(f"{BASE_URL}/api/reports/cost-of-goods", params={"method": m}, headers=venue,
+                                      timeout=10).json()['total_cost_of_goods'] for m in ("wac", "fifo")}
+
+            # Receive 10 more at ฿20 (into the storage room), then count 10 left
+            response = requests.post(f"{BASE_URL}/api/orders", headers=venue, json={
+                "id": f"TEST_lots_{item['id']}", "supplier": "Singha99", "status": "completed", "session_id": s1['id'],
+                "items": [{**item, "isCase": False, "actualQty": 10, "actualCost": 200.0}],
+            }, timeout=10)
+            assert response.status_code == 200
+            requests.put(f"{BASE_URL}/api/stock-counts/{item['id']}", headers=venue,
+                         json={"main_bar": 10, "storage_room": 0}, timeout=10)
+            s2 = requests.post(f"{BASE_URL}/api/stock-sessions", headers=venue, json={"session_name": "TEST_Lots_S2"}, timeout=10).json()
+            requests.post(f"{BASE_URL}/api/stock-sessions/{s2['id']}/save-counts", headers=venue, timeout=10)
+
+            for method, expected in (("fifo", 100.0), ("wac", 150.0)):
+                report = requests.get(f"{BASE_URL}/api/reports/cost-of-goods", params={"method": method},
+                                      headers=venue, timeout=10).json()
+                assert round(report['total_cost_of_goods'] - before[method], 2) == expected
+                comparison = requests.get(f"{BASE_URL}/api/reports/session-comparison/{s1['id']}/{s2['id']}",
+                                          params={"cost_method": method}, headers=venue, timeout=10).json()
+                row = next(r for r in comparison['item_comparisons'] if r['item_id'] == item['id'])
+                assert row['calculated_usage'] == 10
+                assert round(row['usage_cost'], 2) == expected
+            print("✓ Session comparison and cost of goods agree for FIFO and WAC")
+        finally:
+            requests.delete(f"{BASE_URL}/api/items/{item['id']}", headers=venue, timeout=10)
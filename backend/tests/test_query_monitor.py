@@ -0,0 +1,69 @@
+"""
+Tests for database command monitoring:
+1. Command shapes blank out filter values
+2. A handler issuing one update per item is reported as an N+1 suspect at /api/debug/queries
+3. Per-route command totals are summarized
+"""
+import os
+import sys
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from query_monitor import command_shape  # noqa: E402
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture
+def many_items():
+    created = []
+    for n in range(15):
+        item = {
+            "name": f"TEST_QueryMonitor_{n}",
+            "category": "O",
+            "category_name": "Bar Supplies",
+            "primary_supplier": "Makro",
+        }
+        created.append(requests.post(f"{BASE_URL}/api/items", json=item, timeout=10).json())
+    yield created
+    for item in created:
+        requests.delete(f"{BASE_URL}/api/items/{item['id']}", timeout=10)
+
+
+class TestCommandShape:
+
+    def test_values_blanked(self):
+        shape = command_shape("find", {"find": "items", "filter": {"venue_id": "main", "id": {"$in": ["a", "b"]}}})
+        assert shape == 'find items {"venue_id": "?", "id": {"$in": "?"}}'
+
+    def test_update_and_delete_statements(self):
+        update = {"update": "stock_counts", "updates": [{"q": {"item_id": "x"}, "u": {"$set": {"main_bar": 1}}}]}
+        assert command_shape("update", update) == 'update stock_counts {"item_id": "?"}'
+        delete = {"delete": "purchases", "deletes": [{"q": {"$or": [{"id": "a"}, {"session_id": "b"}]}}]}
+        assert command_shape("delete", delete) == 'delete purchases {"$or": [{"id": "?"}, {"session_id": "?"}]}'
+
+
+class TestQueryMonitor:
+
+    def test_n_plus_one_reported(self, many_items):
+        updates = [{"id": item['id'], "sort_order": n} for n, item in enumerate(many_items)]
+        response = requests.put(f"{BASE_URL}/api/items/batch-sort-order", json=updates, timeout=10)
+        assert response.status_code == 200
+
+        report = requests.get(f"{BASE_URL}/api/debug/queries", params={"limit": 50}, timeout=10).json()
+        suspects = [s for s in report['n_plus_one_suspects'] if s['route'] == "PUT /api/items/batch-sort-order"]
+        assert suspects, report['n_plus_one_suspects']
+        assert suspects[0]['max_repeats'] >= 15
+        assert suspects[0]['shape'].startswith("update items")
+        print(f"✓ N+1 suspect: {suspects[0]['shape']} x{suspects[0]['max_repeats']}")
+
+    def test_route_totals(self, many_items):
+        requests.get(f"{BASE_URL}/api/items", timeout=10)
+        report = requests.get(f"{BASE_URL}/api/debug/queries", params={"limit": 100}, timeout=10).json()
+        routes = {r['route']: r for r in report['routes_by_commands']}
+        assert routes["GET /api/items"]['requests'] >= 1
+        assert routes["GET /api/items"]['avg_commands'] >= 1
+        for key in ('slow_ms', 'slowest_queries', 'recent_slow_queries'):
+            assert key in report
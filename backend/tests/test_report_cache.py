@@ -0,0 +1,93 @@
+"""
+Tests for the session report cache:
+1. Repeated session comparisons are served from cache (hit counter moves)
+2. Writing a purchase against a session invalidates reports over it
+3. /api/reports/usage-series returns consecutive-session usage
+4. /api/reports/cache-stats exposes hit/miss/eviction counters
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def cache_stats():
+    response = requests.get(f"{BASE_URL}/api/reports/cache-stats", timeout=10)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def two_sessions():
+    item = {
+        "name": "TEST_ReportCache_Item",
+        "category": "M",
+        "category_name": "Mixers",
+        "units_per_case": 12,
+        "target_stock": 24,
+        "primary_supplier": "Singha99",
+        "cost_per_unit": 12.0
+    }
+    created = requests.post(f"{BASE_URL}/api/items", json=item, timeout=10).json()
+    session_ids = []
+    for total in (24, 12):
+        requests.put(f"{BASE_URL}/api/stock-counts/{created['id']}", json={"main_bar": total}, timeout=10)
+        session = requests.post(f"{BASE_URL}/api/stock-sessions", json={"session_name": "TEST_ReportCache"}, timeout=10).json()
+        requests.post(f"{BASE_URL}/api/stock-sessions/{session['id']}/save-counts", timeout=10)
+        session_ids.append(session['id'])
+    yield created, session_ids
+    requests.delete(f"{BASE_URL}/api/items/{created['id']}", timeout=10)
+
+
+class TestReportCache:
+
+    def test_cache_stats_shape(self):
+        stats = cache_stats()
+        for key in ('size', 'maxsize', 'hits', 'misses', 'hit_rate', 'evictions', 'invalidations'):
+            assert key in stats
+        print(f"✓ Cache stats: {stats}")
+
+    def test_repeat_comparison_is_a_hit(self, two_sessions):
+        _, (s1, s2) = two_sessions
+        url = f"{BASE_URL}/api/reports/session-comparison/{s1}/{s2}"
+        first = requests.get(url, timeout=10).json()
+        hits_before = cache_stats()['hits']
+        second = requests.get(url, timeout=10).json()
+        assert second == first
+        assert cache_stats()['hits'] == hits_before + 1
+        print("✓ Second comparison served from cache")
+
+    def test_purchase_invalidates_session_reports(self, two_sessions):
+        item, (s1, s2) = two_sessions
+        url = f"{BASE_URL}/api/reports/session-comparison/{s1}/{s2}"
+        before = requests.get(url, timeout=10).json()
+
+        purchase = {
+            "session_id": s2,
+            "item_id": item['id'],
+            "planned_quantity": 12,
+            "actual_quantity": 12,
+            "cost_per_unit": 12.0,
+            "total_cost": 144.0,
+            "supplier": "Singha99"
+        }
+        created = requests.post(f"{BASE_URL}/api/purchases", json=purchase, timeout=10).json()
+        after = requests.get(url, timeout=10).json()
+        row = next(r for r in after['item_comparisons'] if r['item_id'] == item['id'])
+        assert row['purchases_made'] == 12
+        assert after['total_usage_cost'] > before['total_usage_cost']
+        print("✓ Purchase write invalidated cached comparison")
+
+        requests.delete(f"{BASE_URL}/api/purchases/{created['id']}", timeout=10)
+
+    def test_usage_series(self, two_sessions):
+        response = requests.get(f"{BASE_URL}/api/reports/usage-series", params={"limit": 3}, timeout=10)
+        assert response.status_code == 200
+        data = response.json()
+        assert data['cost_method'] == "wac"
+        assert 1 <= len(data['series']) <= 3
+        for entry in data['series']:
+            assert 'total_usage_cost' in entry
+            assert 'session1_id' in entry and 'session2_id' in entry
+        print(f"✓ Usage series with {len(data['series'])} intervals")
@@ -0,0 +1,79 @@
+"""
+Tests for response encoding:
+1. Large responses are compressed with brotli or gzip as negotiated; small ones are not
+2. List endpoints return MessagePack when Accept asks for it, JSON otherwise
+"""
+import requests
+import os
+import pytest
+import brotli
+import msgpack
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+VENUE = {"X-Venue-Id": "TEST_response_encoding"}
+
+
+@pytest.fixture(scope="module")
+def items():
+    created = []
+    for n in range(10):
+        response = requests.post(f"{BASE_URL}/api/items", headers=VENUE, json={
+            "name": f"TEST_Encoded Item {n}", "category": "B", "category_name": "Beer",
+            "units_per_case": 24, "primary_supplier": "TEST_Supplier", "cost_per_unit": 2.0,
+        }, timeout=10)
+        assert response.status_code == 200
+        created.append(response.json())
+    yield created
+    for item in created:
+        requests.delete(f"{BASE_URL}/api/items/{item['id']}", headers=VENUE, timeout=10)
+
+
+class TestCompression:
+
+    def test_gzip(self, items):
+        response = requests.get(f"{BASE_URL}/api/items", headers={**VENUE, "Accept-Encoding": "gzip"}, timeout=10)
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == "gzip"
+        assert "Accept-Encoding" in response.headers['Vary']
+        assert len(response.json()) == len(items)
+        print(f"✓ gzip: {response.headers['Content-Length']} bytes on the wire")
+
+    def test_brotli_preferred(self, items):
+        response = requests.get(f"{BASE_URL}/api/items", headers={**VENUE, "Accept-Encoding": "gzip, deflate, br"},
+                                stream=True, timeout=10)
+        assert response.headers['Content-Encoding'] == "br"
+        body = brotli.decompress(response.raw.read(decode_content=False))
+        plain = requests.get(f"{BASE_URL}/api/items", headers={**VENUE, "Accept-Encoding": "identity"}, timeout=10)
+        assert 'Content-Encoding' not in plain.headers
+        assert len(body) == len(plain.content) > int(response.headers['Content-Length'])
+        print(f"✓ br: {response.headers['Content-Length']} of {len(body)} bytes")
+
+    def test_small_responses_uncompressed(self):
+        response = requests.get(f"{BASE_URL}/healthz", headers={"Accept-Encoding": "gzip, br"}, timeout=10)
+        assert response.status_code == 200
+        assert 'Content-Encoding' not in response.headers
+        print("✓ Small response sent as is")
+
+
+class TestMessagePack:
+
+    def test_list_endpoint_msgpack(self, items):
+        response = requests.get(f"{BASE_URL}/api/items", headers={**VENUE, "Accept": "application/msgpack"}, timeout=10)
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == "application/msgpack"
+        assert "Accept" in response.headers['Vary']
+        as_json = requests.get(f"{BASE_URL}/api/items", headers=VENUE, timeout=10).json()
+        assert msgpack.unpackb(response.content) == as_json
+        print("✓ MessagePack matches JSON")
+
+    def test_json_by_default(self, items):
+        for accept in ("*/*", "application/json, text/plain, */*", "application/json, application/msgpack;q=0.5"):
+            response = requests.get(f"{BASE_URL}/api/items", headers={**VENUE, "Accept": accept}, timeout=10)
+            assert response.headers['Content-Type'] == "application/json", accept
+
+    def test_other_endpoints_stay_json(self):
+        response = requests.get(f"{BASE_URL}/api/valuation", headers={**VENUE, "Accept": "application/msgpack"},
+                                timeout=10)
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == "application/json"
+        print("✓ Non-list endpoints answer in JSON")
@@ -0,0 +1,119 @@
+"""
+Tests for delta-encoded session snapshots:
+1. A session saved with nothing changed stores no rows (unless it is a keyframe)
+2. Session counts read back in full, whether stored as keyframe or delta
+3. Only the most recent session can be saved again, replacing its usage and costs
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+VENUE = {"X-Venue-Id": "TEST_snapshots"}
+
+
+def save_session(name):
+    session = requests.post(f"{BASE_URL}/api/stock-sessions", json={"session_name": name}, headers=VENUE, timeout=10).json()
+    response = requests.post(f"{BASE_URL}/api/stock-sessions/{session['id']}/save-counts", headers=VENUE, timeout=10)
+    assert response.status_code == 200
+    return session['id'], response.json()
+
+
+def counts_by_item(rows):
+    return {r['item_id']: (r['main_bar'], r['beer_bar'], r['lobby'], r['storage_room']) for r in rows}
+
+
+@pytest.fixture
+def counted_items():
+    ids = []
+    for n in range(3):
+        item = {
+            "name": f"TEST_Snapshot_Item_{n}",
+            "category": "Z",
+            "category_name": "Hostel Supplies",
+            "primary_supplier": "Makro",
+            "cost_per_unit": 5.0
+        }
+        created = requests.post(f"{BASE_URL}/api/items", json=item, headers=VENUE, timeout=10).json()
+        requests.put(f"{BASE_URL}/api/stock-counts/{created['id']}", json={"storage_room": 10 + n}, headers=VENUE, timeout=10)
+        ids.append(created['id'])
+    yield ids
+    for item_id in ids:
+        requests.delete(f"{BASE_URL}/api/items/{item_id}", headers=VENUE, timeout=10)
+
+
+class TestSessionSnapshots:
+
+    def test_unchanged_session_stores_nothing(self, counted_items):
+        save_session("TEST_Snapshot_1")
+        _, result = save_session("TEST_Snapshot_2")
+        assert result['snapshot'] in ("keyframe", "delta")
+        if result['snapshot'] == "delta":
+            assert result['stored'] == 0
+        else:
+            assert result['stored'] == result['count']
+        print(f"✓ Unchanged session stored as {result['snapshot']} with {result['stored']} rows")
+
+    def test_sessions_read_back_in_full(self, counted_items):
+        first_id, _ = save_session("TEST_Snapshot_A")
+        first_expected = counts_by_item(requests.get(f"{BASE_URL}/api/stock-counts", headers=VENUE, timeout=10).json())
+
+        requests.put(f"{BASE_URL}/api/stock-counts/{counted_items[0]}", json={"lobby": 4}, headers=VENUE, timeout=10)
+        second_id, result = save_session("TEST_Snapshot_B")
+        if result['snapshot'] == "delta":
+            assert result['stored'] == 1
+        second_expected = counts_by_item(requests.get(f"{BASE_URL}/api/stock-counts", headers=VENUE, timeout=10).json())
+
+        for session_id, expected in ((first_id, first_expected), (second_id, second_expected)):
+            rows = requests.get(f"{BASE_URL}/api/stock-sessions/{session_id}/counts", headers=VENUE, timeout=10).json()
+            assert counts_by_item(rows) == expected
+            assert all(r['session_id'] == session_id for r in rows)
+        print("✓ Keyframe and delta sessions reconstruct in full")
+
+    def test_only_latest_session_resaved(self, counted_items):
+        item_id = counted_items[0]
+        older_id, _ = save_session("TEST_Snapshot_Old")
+        set_storage(item_id, 4)  # 6 used
+        latest_id, _ = save_session("TEST_Snapshot_New")
+        booked = cost_of_goods(item_id)
+        assert (booked['usage_qty'], booked['cost_of_goods']) == (6, 30.0)
+        baseline = expected_count(item_id, 4)
+
+        response = requests.post(f"{BASE_URL}/api/stock-sessions/{older_id}/save-counts", headers=VENUE, timeout=10)
+        assert response.status_code == 409
+
+        response = requests.post(f"{BASE_URL}/api/stock-sessions/{latest_id}/save-counts", headers=VENUE, timeout=10)
+        assert response.status_code == 200
+        rows = requests.get(f"{BASE_URL}/api/stock-sessions/{latest_id}/counts", headers=VENUE, timeout=10).json()
+        assert len(rows) == len({r['item_id'] for r in rows})
+        # Nothing booked twice: same cost of goods, no extra usage sample
+        assert cost_of_goods(item_id) == booked
+        assert expected_count(item_id, 4) == baseline
+
+        # A corrected count re-saved replaces the session's usage
+        set_storage(item_id, 5)
+        response = requests.post(f"{BASE_URL}/api/stock-sessions/{latest_id}/save-counts", headers=VENUE, timeout=10)
+        assert response.status_code == 200
+        corrected = cost_of_goods(item_id)
+        assert (corrected['usage_qty'], corrected['cost_of_goods']) == (5, 25.0)
+        print("✓ Older sessions can't be re-saved; re-saving the latest replaces it")
+
+
+def set_storage(item_id, storage_room):
+    response = requests.put(f"{BASE_URL}/api/stock-counts/{item_id}", json={"storage_room": storage_room},
+                            headers=VENUE, timeout=10)
+    assert response.status_code == 200
+    return response.json()
+
+
+def cost_of_goods(item_id):
+    report = requests.get(f"{BASE_URL}/api/reports/cost-of-goods", headers=VENUE, timeout=10).json()
+    return next(row for row in report['items'] if row['item_id'] == item_id)
+
+
+def expected_count(item_id, storage_room):
+    """The anomaly baseline's expected count, read off a deliberately negative count"""
+    anomaly = set_storage(item_id, -1)['anomaly']
+    set_storage(item_id, storage_room)
+    return anomaly['expected_count']
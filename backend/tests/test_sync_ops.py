@@ -0,0 +1,127 @@
+"""
+Tests for offline op-log ingestion (POST /api/sync/ops):
+1. A batch of count and order-quantity ops is applied in one request
+2. Re-sending the same ops is a no-op (deduplicated by op_id)
+3. An op older than the last write to its location is reported stale
+4. Case counts are converted with the item's units per case
+5. Ops for unknown items or locations are rejected
+6. Ops landing alongside deliveries leave the delivered units in place
+"""
+import pytest
+import requests
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+def op(item_id, minutes_ago=0, **fields):
+    fields.setdefault("type", "count_set")
+    return {
+        "op_id": f"TEST_{uuid.uuid4()}",
+        "item_id": item_id,
+        "device_ts": (datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)).isoformat(),
+        **fields,
+    }
+
+
+def sync(ops):
+    response = requests.post(f"{BASE_URL}/api/sync/ops", json={"device_id": "TEST_device", "ops": ops}, timeout=10)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def test_item():
+    item = {
+        "name": "TEST_Sync_Item",
+        "category": "B",
+        "category_name": "Beer",
+        "units_per_case": 24,
+        "primary_supplier": "Singha99",
+        "cost_per_unit": 10.0
+    }
+    response = requests.post(f"{BASE_URL}/api/items", json=item, timeout=10)
+    assert response.status_code == 200
+    created = response.json()
+    yield created
+    requests.delete(f"{BASE_URL}/api/items/{created['id']}", timeout=10)
+
+
+class TestSyncOps:
+
+    def test_batch_applied(self, test_item):
+        ops = [
+            op(test_item['id'], minutes_ago=3, location="main_bar", value=5),
+            op(test_item['id'], minutes_ago=2, location="lobby", value=2),
+            op(test_item['id'], minutes_ago=1, location="main_bar", value=7),
+            op(test_item['id'], type="order_qty_set", value=48),
+        ]
+        result = sync(ops)
+        assert [r['status'] for r in result['results']] == ["applied"] * 4
+        assert result['summary'] == {"applied": 4}
+
+        count = requests.get(f"{BASE_URL}/api/stock-counts/{test_item['id']}", timeout=10).json()
+        assert count['main_bar'] == 7
+        assert count['lobby'] == 2
+        assert count['total_count'] == 9
+
+        quantities = requests.get(f"{BASE_URL}/api/order-quantities", timeout=10).json()
+        assert quantities[test_item['id']] == 48
+        print("✓ Batch of ops applied in device-time order")
+
+    def test_resend_is_noop(self, test_item):
+        ops = [op(test_item['id'], location="beer_bar", value=4)]
+        sync(ops)
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"beer_bar": 10}, timeout=10)
+
+        result = sync(ops)
+        assert result['results'][0]['status'] == "duplicate"
+        count = requests.get(f"{BASE_URL}/api/stock-counts/{test_item['id']}", timeout=10).json()
+        assert count['beer_bar'] == 10
+        print("✓ Re-sent ops are deduplicated")
+
+    def test_older_op_is_stale(self, test_item):
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"storage_room": 30}, timeout=10)
+
+        result = sync([op(test_item['id'], minutes_ago=10, location="storage_room", value=12)])
+        assert result['results'][0]['status'] == "stale"
+        count = requests.get(f"{BASE_URL}/api/stock-counts/{test_item['id']}", timeout=10).json()
+        assert count['storage_room'] == 30
+        print("✓ Offline edit older than the last online edit does not overwrite it")
+
+    def test_case_count(self, test_item):
+        result = sync([op(test_item['id'], type="case_count_set", location="storage_room", cases=2, singles=5)])
+        assert result['counts'][0]['storage_room'] == 53
+        print("✓ Case count converted to units")
+
+    def test_invalid_ops_rejected(self, test_item):
+        result = sync([
+            op("TEST_missing_item", location="main_bar", value=1),
+            op(test_item['id'], location="cellar", value=1),
+        ])
+        assert [r['status'] for r in result['results']] == ["rejected", "rejected"]
+        assert all(r['error'] for r in result['results'])
+        print("✓ Invalid ops rejected")
+
+    def test_concurrent_delivery_kept(self, test_item):
+        def deliver(n):
+            response = requests.post(f"{BASE_URL}/api/orders", json={
+                "id": f"TEST_{uuid.uuid4()}", "supplier": "Singha99",
+                "items": [{"id": test_item['id'], "actualQty": 1, "actualCost": 10.0}],
+            }, timeout=10)
+            assert response.status_code == 200
+
+        def count(n):
+            sync([op(test_item['id'], minutes_ago=-n, location="main_bar", value=n)])
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda n: deliver(n) if n % 2 else count(n), range(1, 21)))
+
+        current = requests.get(f"{BASE_URL}/api/stock-counts/{test_item['id']}", timeout=10).json()
+        assert current['main_bar'] == 20
+        assert current['storage_room'] == 10
+        assert current['total_count'] == 30
+        print("✓ Concurrent deliveries and synced counts both kept")
@@ -0,0 +1,86 @@
+"""
+Tests for live inventory valuation:
+1. GET /api/valuation returns running totals per location x category
+2. Count writes adjust the totals by their delta
+3. Price changes revalue counted stock
+4. POST /api/valuation/recompute reports no drift after normal writes
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture
+def test_item():
+    item = {
+        "name": "TEST_Valuation_Item",
+        "category": "O",
+        "category_name": "TEST_Valuation_Category",
+        "units_per_case": 10,
+        "target_stock": 0,
+        "primary_supplier": "Makro",
+        "cost_per_unit": 10.0
+    }
+    response = requests.post(f"{BASE_URL}/api/items", json=item, timeout=10)
+    assert response.status_code == 200
+    created = response.json()
+    yield created
+    requests.delete(f"{BASE_URL}/api/items/{created['id']}", timeout=10)
+
+
+def category_value(category="TEST_Valuation_Category"):
+    response = requests.get(f"{BASE_URL}/api/valuation", timeout=10)
+    assert response.status_code == 200
+    return response.json().get('categories', {}).get(category, 0.0)
+
+
+class TestValuation:
+    """Tests for /api/valuation"""
+
+    def test_valuation_shape(self):
+        response = requests.get(f"{BASE_URL}/api/valuation", timeout=10)
+        assert response.status_code == 200
+        data = response.json()
+        for key in ('cells', 'locations', 'categories', 'total'):
+            assert key in data
+        print(f"✓ Current stock value: ฿{data['total']:.2f}")
+
+    def test_count_write_adjusts_totals(self, test_item):
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"main_bar": 5}, timeout=10)
+        assert category_value() == pytest.approx(50.0)
+
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"main_bar": 2, "lobby": 1}, timeout=10)
+        assert category_value() == pytest.approx(30.0)
+
+        requests.post(
+            f"{BASE_URL}/api/stock-counts-enhanced/{test_item['id']}",
+            json={"storage_room": {"cases": 1, "singles": 0}},
+            timeout=10
+        )
+        # Enhanced count replaces all locations: only 10 units in storage remain
+        assert category_value() == pytest.approx(100.0)
+        print("✓ Count writes applied as deltas")
+
+    def test_price_change_revalues_stock(self, test_item):
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"main_bar": 4}, timeout=10)
+        update = {k: v for k, v in test_item.items() if k != 'id'}
+        update.update({"cost_per_unit": 25.0, "cost_per_case": 0})
+        requests.put(f"{BASE_URL}/api/items/{test_item['id']}", json=update, timeout=10)
+        assert category_value() == pytest.approx(100.0)
+        print("✓ Price change revalued counted stock")
+
+    def test_delete_removes_value(self, test_item):
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"main_bar": 3}, timeout=10)
+        requests.delete(f"{BASE_URL}/api/items/{test_item['id']}", timeout=10)
+        assert category_value() == pytest.approx(0.0)
+
+    def test_recompute_reports_no_drift(self, test_item):
+        requests.put(f"{BASE_URL}/api/stock-counts/{test_item['id']}", json={"beer_bar": 7}, timeout=10)
+        response = requests.post(f"{BASE_URL}/api/valuation/recompute", params={"apply": False}, timeout=10)
+        assert response.status_code == 200
+        result = response.json()
+        assert result['applied'] is False
+        assert abs(result['drift']) < 0.01
+        print(f"✓ Drift check: {result['drift']}")
@@ -0,0 +1,117 @@
+"""Running stock valuation per location x category.
+
+One ``valuation`` document per venue holds value totals at four levels (cell,
+location, category, grand total). Count writes and price/category changes
+``$inc`` it by the change they cause, so reading the current value is one
+document fetch regardless of catalog size. ``recompute`` rebuilds it from
+``stock_counts`` x ``items`` to detect and repair drift.
+"""
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOCATIONS = ("main_bar", "beer_bar", "lobby", "storage_room")
+
+def _key(name: Optional[str]) -> str:
+    """Category names are used as field names; keep them path-safe"""
+    return (name or "Uncategorized").replace(".", "_").replace("$", "_")
+
+
+def count_value_deltas(old_count: Optional[dict], new_count: Optional[dict],
+                       unit_cost: float, category: str) -> Dict[tuple, float]:
+    """Value change per location caused by replacing ``old_count`` with ``new_count``"""
+    deltas = {}
+    for loc in LOCATIONS:
+        before = (old_count or {}).get(loc, 0) or 0
+        after = (new_count or {}).get(loc, 0) or 0
+        if before != after:
+            deltas[(loc, category)] = (after - before) * unit_cost
+    return deltas
+
+
+def revalue_deltas(count: Optional[dict], old_cost: float, new_cost: float,
+                   old_category: str, new_category: str) -> Dict[tuple, float]:
+    """Value change for an item's counted stock when its price or category changes"""
+    deltas = {}
+    if not count:
+        return deltas
+    for loc in LOCATIONS:
+        qty = count.get(loc, 0) or 0
+        if not qty:
+            continue
+        if old_category == new_category:
+            if old_cost != new_cost:
+                deltas[(loc, new_category)] = qty * (new_cost - old_cost)
+        else:
+            deltas[(loc, old_category)] = deltas.get((loc, old_category), 0.0) - qty * old_cost
+            deltas[(loc, new_category)] = deltas.get((loc, new_category), 0.0) + qty * new_cost
+    return deltas
+
+
+def _inc_doc(deltas: Dict[tuple, float]) -> Dict[str, float]:
+    inc: Dict[str, float] = {}
+    for (loc, category), value in deltas.items():
+        cat = _key(category)
+        for path in (f"cells.{loc}.{cat}", f"locations.{loc}", f"categories.{cat}", "total"):
+            inc[path] = inc.get(path, 0.0) + value
+    return inc
+
+
+async def apply_deltas(db, venue_id: str, deltas: Dict[tuple, float]) -> None:
+    """Fold value changes into the venue's running totals with one atomic update"""
+    if not deltas:
+        return
+    await db.valuation.update_one(
+        {"venue_id": venue_id},
+        {"$inc": _inc_doc(deltas), "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def get_valuation(db, venue_id: str) -> dict:
+    doc = await db.valuation.find_one({"venue_id": venue_id}, {"_id": 0})
+    if not doc:
+        return {"venue_id": venue_id, "cells": {}, "locations": {}, "categories": {}, "total": 0.0, "updated_at": None}
+    return doc
+
+
+async def compute_from_scratch(db, venue_id: str) -> dict:
+    """Full stock_counts x items join, in the same shape as the running document"""
+    items = await db.items.find(
+        {"venue_id": venue_id}, {"_id": 0, "id": 1, "cost_per_unit": 1, "category_name": 1}
+    ).to_list(None)
+    counts = await db.stock_counts.find({"venue_id": venue_id}, {"_id": 0}).to_list(None)
+    info = {i["id"]: (i.get("cost_per_unit", 0.0), i.get("category_name")) for i in items}
+
+    cells: Dict[str, Dict[str, float]] = {}
+    locations: Dict[str, float] = {}
+    categories: Dict[str, float] = {}
+    total = 0.0
+    for count in counts:
+        if count["item_id"] not in info:
+            continue
+        cost, category = info[count["item_id"]]
+        cat = _key(category)
+        for loc in LOCATIONS:
+            value = (count.get(loc, 0) or 0) * cost
+            if not value:
+                continue
+            cells.setdefault(loc, {})[cat] = cells.get(loc, {}).get(cat, 0.0) + value
+            locations[loc] = locations.get(loc, 0.0) + value
+            categories[cat] = categories.get(cat, 0.0) + value
+            total += value
+    return {"cells": cells, "locations": locations, "categories": categories, "total": total}
+
+
+async def recompute(db, venue_id: str, apply: bool = True) -> dict:
+    """Rebuild the totals and report how far the running document had drifted"""
+    fresh = await compute_from_scratch(db, venue_id)
+    stored = await get_valuation(db, venue_id)
+    drift = round(stored.get("total", 0.0) - fresh["total"], 2)
+    if apply:
+        await db.valuation.replace_one(
+            {"venue_id": venue_id},
+            {"venue_id": venue_id, **fresh, "updated_at": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+    return {"drift": drift, "stored_total": round(stored.get("total", 0.0), 2),
+            "recomputed_total": round(fresh["total"], 2), "applied": apply}
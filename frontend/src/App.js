@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import axios from 'axios';
 import { Card, CardContent, CardHeader, CardTitle } from './components/ui/card';
 import { Button } from './components/ui/button';
@@ -57,6 +57,10 @@ const supplierColors = {
 function StockManager() {
   const [activeTab, setActiveTab] = useState('count');
   const [items, setItems] = useState([]);
+  // Inline item saves (see saveItem)
+  const itemSaves = useRef({});  // item id -> last queued save
+  const savedItems = useRef({});  // item id -> latest version from the server
+  const ownVersions = useRef({});  // item id -> versions this client wrote
   const [stockCounts, setStockCounts] = useState({});
   const [localCounts, setLocalCounts] = useState({}); // Local state for inputs
   const [orderQtys, setOrderQtys] = useState({});
@@ -102,12 +106,8 @@ function StockManager() {
         axios.get(`${API}/recipes`)
       ]);
       
-      setItems(itemsRes.data.map(item => ({
-        ...item,
-        cost_per_unit: item.cost_per_unit ? Math.round(item.cost_per_unit * 10) / 10 : item.cost_per_unit,
-        cost_per_case: item.cost_per_case ? Math.round(item.cost_per_case * 10) / 10 : item.cost_per_case,
-        sale_price: item.sale_price ? Math.round(item.sale_price * 10) / 10 : item.sale_price,
-      })));
+      setItems(itemsRes.data);
+      savedItems.current = {};  // Freshly loaded versions are the base for the next edit
       setRecipes(recipesRes.data);
       
       // Convert counts array to map
@@ -264,8 +264,8 @@ function StockManager() {
     return (units / unitsPerCase).toFixed(1);
   };
 
-  // Get target stock (use target_stock or fall back to max_stock for old data)
-  const getTarget = (item) => item.target_stock || item.max_stock || 0;
+  // Get target stock
+  const getTarget = (item) => item.target_stock || 0;
 
   // Get suggested order quantity
   const getSuggestedOrder = (item) => {
@@ -348,6 +348,8 @@ function StockManager() {
   // Confirm purchase - opens dialog with editable quantities
   const startConfirmPurchase = (supplier, orderItems) => {
     setCurrentOrder({
+      // One id per order, reused on every retry so the server saves it once
+      id: crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`,
       supplier,
       items: orderItems.map(item => ({
         ...item,
@@ -364,7 +366,7 @@ function StockManager() {
     
     try {
       await axios.post(`${API}/orders`, {
-        id: Date.now().toString(),
+        id: currentOrder.id,
         supplier: currentOrder.supplier,
         status: 'completed',
         completed_at: new Date().toISOString(),
@@ -381,34 +383,77 @@ function StockManager() {
       setOrderQtys(newQtys);
       localStorage.setItem('orderQtys', JSON.stringify(newQtys));
     } catch (error) {
+      if (error.response?.status === 409) {
+        toast({ title: "Purchase is still being saved", description: "Try again in a moment" });
+        return;
+      }
       toast({ title: "Error saving purchase", variant: "destructive" });
     }
   };
 
-  // Save item (inline edit)
-  const saveItem = async (itemId, updates) => {
-    try {
-      const item = items.find(i => i.id === itemId);
-      const payload = { ...item, ...updates };
-      
-      // Auto-calculate costs bidirectionally (rounded to 1 decimal)
-      if (updates.cost_per_unit !== undefined && payload.units_per_case >= 1) {
-        payload.cost_per_case = Math.round(parseFloat(updates.cost_per_unit) * payload.units_per_case * 10) / 10;
-      } else if (updates.cost_per_case !== undefined && payload.units_per_case >= 1) {
-        payload.cost_per_unit = Math.round(parseFloat(updates.cost_per_case) / payload.units_per_case * 10) / 10;
+  // Save item (inline edit). Saves of one item go out one after another, each
+  // based on the version the previous one returned, so quick edits to two
+  // fields don't conflict with each other.
+  const rememberSaved = (item) => {
+    savedItems.current[item.id] = item;
+    ownVersions.current[item.id] = [...(ownVersions.current[item.id] || []), item.version].slice(-10);
+  };
+
+  const buildItemPayload = (item, updates) => {
+    const payload = { ...item, ...updates };
+    
+    // Auto-calculate costs bidirectionally (rounded to 1 decimal)
+    if (updates.cost_per_unit !== undefined && payload.units_per_case >= 1) {
+      payload.cost_per_case = Math.round(parseFloat(updates.cost_per_unit) * payload.units_per_case * 10) / 10;
+    } else if (updates.cost_per_case !== undefined && payload.units_per_case >= 1) {
+      payload.cost_per_unit = Math.round(parseFloat(updates.cost_per_case) / payload.units_per_case * 10) / 10;
+    }
+    // Always round all cost fields to 1 decimal
+    if (payload.cost_per_unit) payload.cost_per_unit = Math.round(payload.cost_per_unit * 10) / 10;
+    if (payload.cost_per_case) payload.cost_per_case = Math.round(payload.cost_per_case * 10) / 10;
+    if (payload.sale_price) payload.sale_price = Math.round(payload.sale_price * 10) / 10;
+    return payload;
+  };
+
+  const saveItem = (itemId, updates) => {
+    const shown = items.find(i => i.id === itemId);
+    // Update local state first for responsive UI
+    setItems(prev => prev.map(i => i.id === itemId ? { ...i, ...buildItemPayload(i, updates) } : i));
+
+    const save = async () => {
+      const base = savedItems.current[itemId] || shown;
+      try {
+        const response = await axios.put(`${API}/items/${itemId}`, buildItemPayload(base, updates));
+        rememberSaved(response.data);
+      } catch (error) {
+        if (error.response?.status !== 409) throw error;
+        const current = error.response.data.detail.current;
+        if ((ownVersions.current[itemId] || []).includes(current.version)) {
+          // Our own earlier write got there first: apply this edit on top of it
+          const response = await axios.put(`${API}/items/${itemId}`, buildItemPayload(current, updates));
+          rememberSaved(response.data);
+          return;
+        }
+        // Someone else saved this item first: show their version
+        savedItems.current[itemId] = current;
+        setItems(prev => prev.map(i => i.id === itemId ? current : i));
+        toast({ title: "Item was changed by someone else", description: "Showing the latest version", variant: "destructive" });
       }
-      // Always round all cost fields to 1 decimal
-      if (payload.cost_per_unit) payload.cost_per_unit = Math.round(payload.cost_per_unit * 10) / 10;
-      if (payload.cost_per_case) payload.cost_per_case = Math.round(payload.cost_per_case * 10) / 10;
-      if (payload.sale_price) payload.sale_price = Math.round(payload.sale_price * 10) / 10;
-      
-      // Update local state first for responsive UI
-      setItems(prev => prev.map(i => i.id === itemId ? { ...i, ...payload } : i));
-      await axios.put(`${API}/items/${itemId}`, payload);
-    } catch (error) {
+    };
+
+    const queued = (itemSaves.current[itemId] || Promise.resolve()).then(save).catch(error => {
       console.error('Error saving item:', error);
       toast({ title: "Error saving", variant: "destructive" });
-    }
+    });
+    itemSaves.current[itemId] = queued;
+    queued.then(() => {
+      // Last save of the burst: keep the new version so the next edit is based on it
+      if (itemSaves.current[itemId] === queued && savedItems.current[itemId]) {
+        setItems(prev => prev.map(i => i.id === itemId ? savedItems.current[itemId] : i));
+        delete itemSaves.current[itemId];
+      }
+    });
+    return queued;
   };
 
   // Add new item
@@ -556,23 +601,33 @@ function StockManager() {
     if (targetIdx < 0 || targetIdx >= catKeys.length) return;
     if (direction === 'up' && !groups[catKeys[targetIdx]].subCategory) return;
 
-    const reordered = [...catKeys];
-    [reordered[idx], reordered[targetIdx]] = [reordered[targetIdx], reordered[idx]];
-
-    const batchUpdates = [];
-    reordered.forEach((k, i) => {
-      groups[k].items.forEach(item => {
-        batchUpdates.push({ id: item.id, sort_order: i * 100 });
-      });
-    });
-
-    setItems(prev => prev.map(item => {
-      const u = batchUpdates.find(b => b.id === item.id);
-      return u ? { ...item, sort_order: u.sort_order } : item;
-    }));
+    // Place the whole sub-category between the groups either side of its new slot
+    // (items without a sub-category always list first, whatever their keys)
+    const lastOf = (k) => k && groups[k].subCategory && groups[k].items[groups[k].items.length - 1].id;
+    const firstOf = (k) => k && groups[k].subCategory && groups[k].items[0].id;
+    const [beforeKey, afterKey] = direction === 'up'
+      ? [catKeys[idx - 2], catKeys[idx - 1]]
+      : [catKeys[idx + 1], catKeys[idx + 2]];
 
     try {
-      await axios.put(`${API}/items/batch-sort-order`, batchUpdates);
+      const res = await axios.post(`${API}/items/reorder`, {
+        group: { category_name: category, sub_category: subCategory || null },
+        before: lastOf(beforeKey) || null,
+        after: firstOf(afterKey) || null,
+      });
+      if (res.data.rebalanced) {
+        await loadData();
+        return;
+      }
+      const keys = Object.fromEntries(res.data.items.map(u => [u.id, u.sort_order]));
+      // The move bumped these items' versions; later edits build on them
+      items.filter(item => item.id in keys).forEach(item => {
+        const saved = savedItems.current[item.id] || item;
+        rememberSaved({ ...saved, sort_order: keys[item.id], version: (saved.version || 0) + 1 });
+      });
+      setItems(prev => prev.map(item =>
+        item.id in keys ? { ...item, sort_order: keys[item.id], version: (item.version || 0) + 1 } : item
+      ));
     } catch (error) {
       console.error('Error updating sort order:', error);
     }